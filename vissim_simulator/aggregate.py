@@ -0,0 +1,228 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import json
+import logging
+import math
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class IntervalAggregator:
+    def __init__(self, interval, sim_len, partial_file=None, resume=False,
+                 start=0):
+        # Input
+        # > 'interval'          : int. Evaluation interval [sec].
+        # > 'sim_len'           : int. Simulation period [sec].
+        # > 'partial_file'      : Path of json lines file or None(a temporary
+        #                         file).
+        # > 'resume'            : boolean. Keep existing 'partial_file'.
+        # > 'start'             : int. Start of the first interval [sec],
+        #                         which is the end of warm-up.
+        #
+        # Completed intervals are pushed one by one while the simulation is
+        # running. Only overall values are kept in memory and updated at every
+        # push. Each interval is written to 'partial_file' at once and read
+        # back by finish(), so that memory stays flat however long the run is
+        # and results survive even if Vissim crashes later.
+
+        self.Interval = interval
+        self.SimLen = sim_len
+        self.Start = start
+        self.NumIntervals = math.ceil((sim_len - start) / interval)
+        self.Count = 0          # The number of pushed intervals.
+
+        self.occuprate_sum = []     # 1D-list of [occupied time (sec) * 100]
+        self.qstop_sum = []         # 1D-list of non-negative numbers.
+
+        if partial_file is None:
+            self.partial = tempfile.TemporaryFile('w+', encoding='UTF8')
+        else:
+            self.partial = open(partial_file, 'r+' if resume else 'w+',
+                                encoding='UTF8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.partial is not None:
+            self.partial.close()
+            self.partial = None
+
+        return
+
+    def state(self):
+        # Output
+        # > dict. Everything needed to continue aggregation later.
+
+        return {'Count': self.Count,
+                'occuprate_sum': list(self.occuprate_sum),
+                'qstop_sum': list(self.qstop_sum),
+                'partial_size': self.partial.tell()}
+
+    def restore(self, state):
+        # Input
+        # > 'state' : dict. Return value of state().
+        #
+        # Intervals pushed after 'state' was taken are dropped, from
+        # 'partial_file' as well.
+
+        self.Count = state['Count']
+        self.occuprate_sum = list(state['occuprate_sum'])
+        self.qstop_sum = list(state['qstop_sum'])
+
+        self.partial.seek(state['partial_size'])
+        self.partial.truncate()
+
+        return
+
+    def next_end(self):
+        # Output
+        # > int. Simulation second at which the next interval is completed.
+
+        return min(self.Start + (self.Count + 1) * self.Interval, self.SimLen)
+
+    def done(self):
+        return self.Count >= self.NumIntervals
+
+    def push(self, VehNum, OccupRate, QStop, AvgSpeed):
+        # Input
+        # > 'VehNum'    : 1D-list of non-negative numbers.
+        # > 'OccupRate' : 1D-list of non-negative numbers.
+        # > 'QStop'     : 1D-list of non-negative numbers.
+        # > 'AvgSpeed'  : 1D-list of numbers.
+        #
+        # Add results of the next interval.
+
+        if self.done():
+            logger.error("IntervalAggregator.push():\t"
+                         + "All intervals have already been pushed.")
+            return
+
+        length = self.next_end() - (self.Start + self.Count * self.Interval)
+
+        if not self.occuprate_sum:
+            self.occuprate_sum = [0.0] * len(OccupRate)
+            self.qstop_sum = [0.0] * len(QStop)
+        for i, value in enumerate(OccupRate):
+            self.occuprate_sum[i] += length * value
+        for i, value in enumerate(QStop):
+            self.qstop_sum[i] += value
+
+        record = {'interval': self.Count + 1,
+                  'from': self.Start + self.Count * self.Interval,
+                  'to': self.next_end(),
+                  'VehNum': VehNum,
+                  'OccupRate': OccupRate,
+                  'QStop': QStop,
+                  'AvgSpeed': AvgSpeed}
+        self.partial.write(json.dumps(record) + '\n')
+        self.partial.flush()
+
+        self.Count += 1
+
+        return
+
+    def finish(self, OccupRate_overall, QStop_overall, per_interval=None):
+        # Input
+        # > 'OccupRate_overall' : Empty list.
+        # > 'QStop_overall'     : Empty list.
+        # > 'per_interval'      : (VehNum_hour, OccupRate_hour, QStop_hour,
+        #                         AvgSpeed_hour) of empty lists or None.
+        #                         Pushed intervals are read back into them.
+
+        if not self.done():
+            logger.error("IntervalAggregator.finish():\t"
+                         + f"Only {self.Count} of {self.NumIntervals} "
+                         + "intervals have been pushed.")
+
+        simulated = (min(self.Start + self.Count * self.Interval, self.SimLen)
+                     - self.Start)
+        OccupRate_overall.extend(value / simulated if simulated else 0
+                                 for value in self.occuprate_sum)
+        QStop_overall.extend(self.qstop_sum)
+
+        if per_interval is not None:
+            self.partial.seek(0)
+            for line in self.partial:
+                record = json.loads(line)
+                for list_2D, name in zip(per_interval, ('VehNum', 'OccupRate',
+                                                        'QStop', 'AvgSpeed')):
+                    list_2D.append(record[name])
+
+        self.close()
+
+        # 'OccupRate_overall' and 'QStop_overall' become 1D list of
+        # non-negative numbers, and lists of 'per_interval' become 2D-lists.
+        return
+
+
+def bucket_bounds(interval, sim_len):
+    # Input
+    # > 'interval'  : int. Length of a bucket [sec].
+    # > 'sim_len'   : int. Simulation period [sec].
+    #
+    # Output
+    # > 1D-list of (int, int) = (from, to) of each bucket.
+    #   The last bucket may be shorter than 'interval'.
+
+    return [(start, min(start + interval, sim_len))
+            for start in range(0, sim_len, interval)]
+
+
+def roll_up(list_2D, interval, target, sim_len, how='sum'):
+    # Input
+    # > 'list_2D'   : 2D-list. list_2D[i] contains values of i-th bucket.
+    # > 'interval'  : int. Length of a bucket of 'list_2D' [sec].
+    # > 'target'    : int. Length of a rolled up bucket [sec].
+    #                 It should be a multiple of 'interval'.
+    # > 'sim_len'   : int. Simulation period [sec].
+    # > 'how'       : 'sum', 'mean' or 'max'.
+    #                 'mean' is weighted by the length of each bucket, so that
+    #                 the partial last bucket counts less.
+    #
+    # Output
+    # > 'rolled' : 2D-list. rolled[j] contains values of j-th 'target' bucket.
+    #
+    # For 'mean' and 'max', -1 means that there was no data and is skipped.
+    # A rolled up value becomes -1 if all of its values were skipped.
+
+    if target % interval:
+        logger.error("roll_up():\t"
+                     + f"{target} sec is not a multiple of {interval} sec.")
+        return []
+    if how not in ('sum', 'mean', 'max'):
+        logger.error(f"roll_up():\tInvalid aggregation '{how}'.")
+        return []
+
+    ratio = target // interval
+    bounds = bucket_bounds(interval, sim_len)[:len(list_2D)]
+
+    rolled = []
+    for first in range(0, len(list_2D), ratio):
+        chunk = list_2D[first:first + ratio]
+        lengths = [end - start for start, end in bounds[first:first + ratio]]
+
+        if how == 'sum':
+            rolled.append([sum(values) for values in zip(*chunk)])
+            continue
+
+        row = []
+        for values in zip(*chunk):
+            valid = [(value, length) for value, length in zip(values, lengths)
+                     if value != -1]
+            if not valid:
+                row.append(-1)
+            elif how == 'max':
+                row.append(max(value for value, _ in valid))
+            else:   # mean
+                total = sum(length for _, length in valid)
+                row.append(sum(value * length for value, length in valid)
+                           / total)
+        rolled.append(row)
+
+    return rolled
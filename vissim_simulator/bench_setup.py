@@ -0,0 +1,80 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import argparse
+import sys
+import time
+
+import runtime
+import setvissim
+
+# Fractions of lanes with signal heads set up per measurement.
+FRACTIONS = (0.25, 0.5, 0.75, 1.0)
+
+
+def measure(Vissim, lanes_with_SH, repeat=3):
+    # Input
+    # > 'Vissim'        : CDispatch with a loaded network.
+    # > 'lanes_with_SH' : 1D list of (int, int, double, double).
+    # > 'repeat'        : int. The best of 'repeat' runs is kept.
+    #
+    # Output
+    # > 1D list of (int(lanes), float(queue counter sec),
+    #   float(data collection sec)).
+    #
+    # Setup time against lane count. Each function first removes what the
+    # previous call created, so removal is part of every measurement.
+
+    rows = []
+    for fraction in FRACTIONS:
+        lanes = lanes_with_SH[:max(1, round(len(lanes_with_SH) * fraction))]
+
+        best = [float('inf'), float('inf')]
+        for _ in range(repeat):
+            for i, function in enumerate((setvissim.set_queue_counter,
+                                          setvissim.set_data_collection)):
+                start = time.perf_counter()
+                function(Vissim, lanes)
+                best[i] = min(best[i], time.perf_counter() - start)
+        rows.append((len(lanes), *best))
+
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure queue counter and data collection setup time "
+                    + "against lane count.")
+    parser.add_argument('inpx', help="Path of a Vissim network (.inpx).")
+    parser.add_argument('--repeat', type=int, default=3)
+    trace = parser.add_mutually_exclusive_group()
+    trace.add_argument('--record', metavar='TRACE_DIR',
+                       help="Record COM traffic into TRACE_DIR.")
+    trace.add_argument('--replay', metavar='TRACE_DIR',
+                       help="Replay TRACE_DIR instead of running Vissim.")
+    args = parser.parse_args(argv)
+
+    if args.record or args.replay:
+        runtime.start_trace(args.record or args.replay,
+                            replay=bool(args.replay))
+    try:
+        Vissim = runtime.dispatch("Vissim.Vissim")
+        Vissim.LoadNet(args.inpx)
+
+        lanes_with_SH = []
+        setvissim.find_incoming_lane(Vissim, lanes_with_SH)
+        rows = measure(Vissim, lanes_with_SH, args.repeat)
+    finally:
+        runtime.stop_trace()
+
+    print(f"{'lanes':>8}{'queue counter':>16}{'data collection':>18}"
+          + f"{'per lane':>12}")
+    for lanes, qc_sec, dc_sec in rows:
+        print(f"{lanes:>8}{qc_sec * 1000:>13.1f} ms{dc_sec * 1000:>15.1f} ms"
+              + f"{(qc_sec + dc_sec) / lanes * 1000:>9.2f} ms")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,15 @@
 # ==========================================================================
 # Author : HyeAnn Lee
 # ==========================================================================
-import json
+import locale
 import logging
-import logging.config
 from pathlib import Path
 
-config = json.load(open("resources/logger.json"))
-logging.config.dictConfig(config)
 logger = logging.getLogger(__name__)
 
+# Result att files are written in the encoding of the system.
+ATT_ENCODING = locale.getpreferredencoding(False)
+
 
 def _read_result_att(att_file):
     # Input
@@ -45,163 +45,235 @@ def _str_2_float(string):
     return float(string)
 
 
-def cal_SH_per_link(lanes_with_SH):
+def los_value(los):
     # Input
-    # > 'lanes_with_SH' : 1D list of (int, int, double, double)
+    # > 'los' : str. 'A' ~ 'F' or "".
     #
     # Output
-    # > 'sh_per_link' : 1D list of (int, int)
+    # > int 1 ~ 6 or None if LOS is missing.
+
+    return ord(los) - ord('A') + 1 if los else None
+
+
+def cal_qstop_per_meter(QStop_hour, QStop_overall, network):
+    # Input
+    # > 'QStop_hour'    : 2D list of non-negative numbers.
+    # > 'QStop_overall' : 1D list of non-negative numbers.
+    # > 'network'       : network.NetworkIndex().
     #
-    # Calculate the number of signal heads per link.
-    # Output is further used to merge Excel cells.
+    # Divide all values in 'QStop_hour' and 'QStop_overall'
+    # by [length of each link].
 
-    sh_per_link = []
+    lengths = network.Lengths
+    for list_1D in QStop_hour:
+        for index_lane in range(len(list_1D)):
+            list_1D[index_lane] /= lengths[index_lane]
+
+    for index_lane in range(len(QStop_overall)):
+        QStop_overall[index_lane] /= lengths[index_lane]
+
+    return
 
-    # init
-    link_track = lanes_with_SH[0][0]
-    num_SH = 0
 
-    # Fill 'sh_per_link'
-    for linkNo, *_ in lanes_with_SH:
-        if linkNo != link_track:    # If new link is met,
-            sh_per_link.append((link_track, num_SH))  # Append prev link info.
-            link_track = linkNo     # Update to current 'linkNo'.
-            num_SH = 1              # Update to current 'num_SH'.
-        else:       # If still the same link,
-            num_SH += 1     # Increment the number of SH.
+class _TextLines:
+    def __init__(self, binary_file):
+        # readline() of 'binary_file' as str, so that _read_result_att() can
+        # leave the file right after the header.
 
-    sh_per_link.append((link_track, num_SH))    # Append the last link info.
+        self.File = binary_file
 
-    return sh_per_link
+    def readline(self):
+        return self.File.readline().decode(ATT_ENCODING)
 
 
-def cal_occuprate_overall(OccupRate_hour, OccupRate_overall, sim_len):
+def _att_header(file):
     # Input
-    # > 'OccupRate_hour'    : 2D list of non-negative numbers.
-    # > 'OccupRate_overall' : Empty list.
-    # > 'sim_len' : int.
-
-    # Calculate how many minutes the last time interval is.
-    last_min = (sim_len - 1) % 3600 + 1
-
-    # Fill 'OccupRate_overall'.
-    for index_DC in range(len(OccupRate_hour[0])):
-        OccupRate = 0
-        for index_hour in range(len(OccupRate_hour)-1):
-            OccupRate += 3600 * OccupRate_hour[index_hour][index_DC]
-        OccupRate += last_min * OccupRate_hour[-1][index_DC]
-        OccupRate_overall.append(OccupRate / sim_len)
-
-    # 'OccupRate_overall' becomes 1D list of non-negative numbers.
-    return
+    # > 'file' : Absolute path of result att file.
+    #
+    # Output
+    # > 'columns' : 1D-list of str.
+    # > 'offset'  : int. Byte offset where data lines start.
+
+    with open(file, 'rb') as att_file:
+        columns = _read_result_att(_TextLines(att_file))
+        offset = att_file.tell()
 
+    return columns, offset
 
-def cal_qstop_overall(QStop_hour, QStop_overall):
+
+def _line_chunks(file, offset, num_chunks):
     # Input
-    # > 'QStop_hour'    : 2D list of non-negative numbers.
-    # > 'QStop_overall' : Empty list.
+    # > 'file'          : Absolute path of result att file.
+    # > 'offset'        : int. Byte offset where data lines start.
+    # > 'num_chunks'    : int.
+    #
+    # Output
+    # > 1D-list of (int(start), int(end)). Byte ranges covering the data, each
+    #   starting at the beginning of a line.
 
-    # Fill 'QStop_overall'.
-    for index_QC in range(len(QStop_hour[0])):
-        qstop = 0
-        for temp_1dlist in QStop_hour:
-            qstop += temp_1dlist[index_QC]
-        QStop_overall.append(qstop)
+    size = Path(file).stat().st_size
+    step = max((size - offset) // max(num_chunks, 1), 1)
 
-    # 'QStop_overall' becomes 1D list of non-negative numbers.
-    return
+    bounds = [offset]
+    with open(file, 'rb') as att_file:
+        for approx in range(offset + step, size, step):
+            if approx <= bounds[-1]:
+                continue
+            att_file.seek(approx - 1)
+            att_file.readline()     # Move to the start of the next line.
+            if att_file.tell() >= size:
+                break
+            bounds.append(att_file.tell())
+    bounds.append(size)
+
+    return [(start, end) for start, end in zip(bounds, bounds[1:])
+            if start < end]
+
+
+def _chunk_lines(file, start, end):
+    # Output
+    # > generator of 1D-list of str. Fields of each data line in the range.
+
+    with open(file, 'rb') as att_file:
+        att_file.seek(start)
+        for line in att_file.read(end - start).decode(ATT_ENCODING)\
+                            .splitlines():
+            if line:
+                yield line.split(';')
 
 
-def cal_qstop_per_meter(QStop_hour, QStop_overall, lanes_with_SH):
+def _linkseg_chunk(file, start, end, positions, links):
     # Input
-    # > 'QStop_hour'    : 2D list of non-negative numbers.
-    # > 'QStop_overall' : 1D list of non-negative numbers.
-    # > 'lanes_with_SH' : 1D list of (int, int, double, double).
+    # > 'file'          : Absolute path of Link Segment Results att file.
+    # > 'start', 'end'  : int. Byte range from _line_chunks().
+    # > 'positions'     : (int, int, int, int). Columns of link evaluation
+    #                     segment, density, relative delay and speed.
+    # > 'links'         : set of str. Links with signal heads.
     #
-    # Divide all values in 'QStop_hour' and 'QStop_overall'
-    # by [length of each link].
+    # Output
+    # > dict of {str(LinkNo): (float, float, float)}. Density, relative delay
+    #   and speed of the first segment of each link in the range.
+
+    def _remove_unit(string):
+        return string.split(" ")[0]
 
-    for index_hour in range(len(QStop_hour)):
-        for index_lane in range(len(QStop_hour[index_hour])):
-            QStop_hour[index_hour][index_lane] /= lanes_with_SH[index_lane][3]
+    pLinkname, pDensity, pDelayRel, pSpeed = positions
 
-    for index_lane in range(len(QStop_overall)):
-        QStop_overall[index_lane] /= lanes_with_SH[index_lane][3]
+    found = dict()
+    for parse in _chunk_lines(file, start, end):
+        linkNo = parse[pLinkname].split('-')[0]
+        if linkNo in links and linkNo not in found:
+            found[linkNo] = (_str_2_float(_remove_unit(parse[pDensity])),
+                             _str_2_float(_remove_unit(parse[pDelayRel])),
+                             _str_2_float(_remove_unit(parse[pSpeed])))
 
-    return
+    return found
 
 
-def extract_from_linkseg(file, lanes_with_SH, Density_overall,
-                         DelayRel_overall, AvgSpeed_overall):
+def _map_chunks(pool, function, args_list):
+    # Input
+    # > 'pool'      : multiprocessing.Pool() or None(in this process).
+    # > 'function'  : function at module level.
+    # > 'args_list' : 1D-list of tuples.
+    #
+    # Output
+    # > 1D-list of return values, in order of 'args_list'.
+
+    if pool is None:
+        return [function(*args) for args in args_list]
+    return pool.starmap(function, args_list)
+
+
+def extract_from_linkseg(file, network, Density_overall, DelayRel_overall,
+                         AvgSpeed_overall, pool=None, num_chunks=1):
     # Input
     # > 'file'              : Absolute path of Link Segment Results att file.
-    # > 'lanes_with_SH'     : 1D list of (int, int, double, double).
+    # > 'network'           : network.NetworkIndex().
     # > 'Density_overall'   : Empty list.
     # > 'DelayRel_overall'  : Empty list.
     # > 'AvgSpeed_overall'  : Empty list.
+    # > 'pool'              : multiprocessing.Pool() or None.
+    # > 'num_chunks'        : int. The number of byte ranges 'file' is split
+    #                         into for 'pool'.
 
-    def _remove_unit(string):
-        # Input
-        # > 'string' : str.
-        #
-        # Output
-        # > str.
+    extract_from_linkseg_files([file], network, [Density_overall],
+                               [DelayRel_overall], [AvgSpeed_overall], pool,
+                               num_chunks)
 
-        return string.split(" ")[0]
+    return
 
-    if not Path(file).exists():
-        logger.error("extract_from_linkseg():\t"
-                     + "Link Segment Results att file is missing.")
 
-    # Read att file to find column names.
-    att_file = open(file, "r")
-    parse = _read_result_att(att_file)  # 'parse' : 1D-list of str.
-    pLinkname = parse.index('LINKEVALSEGMENT')    # int
-    pDensity = parse.index('DENSITY(ALL)')       # int
-    pDelayRel = parse.index('DELAYREL(ALL)')      # int
-    pSpeed = parse.index('SPEED(ALL)')         # int
-
-    # Find links with signal heads.
-    links_with_SH = []
-    for linkNo, *_ in lanes_with_SH:
-        if linkNo not in links_with_SH:
-            links_with_SH.append(linkNo)
-    # 'links_with_SH' : 1D list of int.
-
-    # Read the rest of 'att_file' and fill 'Density_overall',
-    # 'DelayRel_overall' and 'AvgSpeed_overall'.
-    i = 0
-    while i < len(links_with_SH):
-        line = att_file.readline().rstrip()
-        parse = line.split(';')     # 1D-list of str containing actual data.
-
-        # If 'line' is about links with signal head,
-        if parse[pLinkname].split('-')[0] == str(links_with_SH[i]):
-            density = _str_2_float(_remove_unit(parse[pDensity]))
-            delayrel = _str_2_float(_remove_unit(parse[pDelayRel]))
-            speed = _str_2_float(_remove_unit(parse[pSpeed]))
-            Density_overall.    append(density)
-            DelayRel_overall.   append(delayrel)
-            AvgSpeed_overall.   append(speed if speed else -1)
-            i += 1
-    # 'Density_overall', 'DelayRel_overall' and 'AvgSpeed_overall' becomes
+def extract_from_linkseg_files(files, network, Density_list, DelayRel_list,
+                               AvgSpeed_list, pool=None, num_chunks=1):
+    # Input
+    # > 'files'         : 1D-list of absolute paths of Link Segment Results att
+    #                     files. ex) one per simulation run.
+    # > 'network'       : network.NetworkIndex().
+    # > 'Density_list', 'DelayRel_list', 'AvgSpeed_list'
+    #                   : 1D-lists of empty lists, one per file.
+    # > 'pool'          : multiprocessing.Pool() or None.
+    # > 'num_chunks'    : int. The number of byte ranges per file.
+    #
+    # All chunks of all files are parsed on 'pool' at once.
+
+    links = network.LinkNames     # Links with signal heads.
+
+    args_list = []
+    num_file_chunks = []
+    for file in files:
+        if not Path(file).exists():
+            logger.error("extract_from_linkseg():\t"
+                         + "Link Segment Results att file is missing.")
+
+        parse, offset = _att_header(file)   # 'parse' : 1D-list of str.
+        positions = (parse.index('LINKEVALSEGMENT'),
+                     parse.index('DENSITY(ALL)'),
+                     parse.index('DELAYREL(ALL)'),
+                     parse.index('SPEED(ALL)'))
+        chunks = _line_chunks(file, offset, num_chunks)
+        args_list += [(file, start, end, positions, links)
+                      for start, end in chunks]
+        num_file_chunks.append(len(chunks))
+
+    partials = iter(_map_chunks(pool, _linkseg_chunk, args_list))
+
+    num_links = len(network.Links)
+    for index, num in enumerate(num_file_chunks):
+        # Columns of links, filled in file order. The first segment in the
+        # file wins, as chunks are in file order.
+        found = [None] * num_links
+        for _ in range(num):
+            for linkNo, values in next(partials).items():
+                col = links[linkNo]
+                if found[col] is None:
+                    found[col] = values
+
+        for linkNo, values in zip(network.Links, found):
+            if values is None:
+                logger.error("extract_from_linkseg():\t"
+                             + f"No result of link {linkNo}.")
+                values = (0, 0, 0)
+            density, delayrel, speed = values
+            Density_list[index].   append(density)
+            DelayRel_list[index].  append(delayrel)
+            AvgSpeed_list[index].  append(speed if speed else -1)
+    # Each of 'Density_list', 'DelayRel_list' and 'AvgSpeed_list' becomes
     # 1D list of floats. -1 value means that actual data was 0.
 
-    att_file.close()
     return
 
 
-def prep_extract_from_node(hour_step, LOS_hour, EmissionCO_hour,
+def prep_extract_from_node(num_intervals, LOS_hour, EmissionCO_hour,
                            EmissionVOC_hour):
     # Input
-    # > 'hour_step'         : int.
+    # > 'num_intervals'     : int.
     # > 'LOS_hour'          : Empty list.
     # > 'EmissionCO_hour'   : Empty list.
     # > 'EmissionVOC_hour'  : Empty list.
 
-    LOS_hour.           extend([[] for _ in range(hour_step)])
-    EmissionCO_hour.    extend([[] for _ in range(hour_step)])
-    EmissionVOC_hour.   extend([[] for _ in range(hour_step)])
+    LOS_hour.           extend([[] for _ in range(num_intervals)])
+    EmissionCO_hour.    extend([[] for _ in range(num_intervals)])
+    EmissionVOC_hour.   extend([[] for _ in range(num_intervals)])
 
     # 'LOS_hour', 'EmissionCO_hour' and 'EmissionVOC_hour' become
     # empty 2D-lists.
@@ -209,21 +281,41 @@ def prep_extract_from_node(hour_step, LOS_hour, EmissionCO_hour,
     return
 
 
-def extract_from_node(file, node_nums, EmissionCO, EmissionVOC, LOS_hour,
-                      EmissionCO_hour, EmissionVOC_hour):
+def _node_chunk(file, start, end, pMovement):
     # Input
     # > 'file'          : Absolute path of Node Results att file.
-    # > 'node_nums'       : 1D list of int.
+    # > 'start', 'end'  : int. Byte range from _line_chunks().
+    # > 'pMovement'     : int. Column of movement.
+    #
+    # Output
+    # > 2D-list of str. Lines with aggregated data of a node.
+
+    return [parse for parse in _chunk_lines(file, start, end)
+            if '@' not in parse[pMovement]]
+
+
+def extract_from_node(file, network, EmissionCO, EmissionVOC, LOS_hour,
+                      EmissionCO_hour, EmissionVOC_hour, interval=3600,
+                      start=0, pool=None, num_chunks=1):
+    # Input
+    # > 'file'          : Absolute path of Node Results att file.
+    # > 'network'       : network.NetworkIndex().
     # > 'EmissionCO'    : Empty list.
     # > 'EmissionVOC'   : Empty list.
     # > 'LOS_hour'          : Empty 2D-list.
     # > 'EmissionCO_hour'   : Empty 2D-list.
     # > 'EmissionVOC_hour'  : Empty 2D-list.
+    # > 'interval'          : int. Evaluation interval [sec].
+    # > 'start'             : int. Start of evaluation [sec].
+    # > 'pool'              : multiprocessing.Pool() or None.
+    # > 'num_chunks'        : int. The number of byte ranges 'file' is split
+    #                         into for 'pool'.
 
     if not Path(file).exists():
         logger.error("extract_from_node() : Node Results att file is missing.")
 
-    num_nodes = len(node_nums)
+    num_nodes = len(network.Nodes)
+    node_column = network.NodeColumn
 
     # Change form of each list first.
     EmissionCO. extend([0.0 for _ in range(num_nodes)])
@@ -235,8 +327,7 @@ def extract_from_node(file, node_nums, EmissionCO, EmissionVOC, LOS_hour,
         EmissionVOC_hour[index_hour] = [0.0 for _ in range(num_nodes)]
 
     # Read att file to find column names.
-    att_file = open(file, "r")
-    parse = _read_result_att(att_file)  # 'parse' : 1D-list of str.
+    parse, offset = _att_header(file)   # 'parse' : 1D-list of str.
     pTimeInt = parse.index('TIMEINT')        # int
     pMovement = parse.index('MOVEMENT')       # int
     pLOS = parse.index('LOS(ALL)')       # int
@@ -245,28 +336,24 @@ def extract_from_node(file, node_nums, EmissionCO, EmissionVOC, LOS_hour,
 
     # Read the rest of 'att_file'.
     collection = []
-    line = att_file.readline().rstrip()
-    while line:
-        parse = line.split(';')     # 1D-list of str containing actual data.
-        # If 'line' contains aggregated data of a node,
-        if '@' not in parse[pMovement]:
-            collection.append(parse)
-        line = att_file.readline().rstrip()
+    for partial in _map_chunks(
+            pool, _node_chunk,
+            [(file, begin, end, pMovement)
+             for begin, end in _line_chunks(file, offset, num_chunks)]):
+        collection += partial
     # 'collection' becomes 2D list of str.
 
-    att_file.close()
-
     # Fill 'EmissionCO', 'EmissionVOC', 'LOS_hour', 'EmissionCO_hour' and
     # 'EmissionVOC_hour'
     for parse in collection:
         CO = _str_2_float(parse[pCO])
         VOC = _str_2_float(parse[pVOC])
 
-        node_index = node_nums.index(int(parse[pMovement].split(':')[0]))
+        node_index = node_column[int(parse[pMovement].split(':')[0])]
         EmissionCO[node_index] += CO
         EmissionVOC[node_index] += VOC
 
-        hour_index = int(parse[pTimeInt].split('-')[0]) // 3600
+        hour_index = (int(parse[pTimeInt].split('-')[0]) - start) // interval
         LOS_hour[hour_index][node_index] = parse[pLOS][-1]
         EmissionCO_hour[hour_index][node_index] = CO
         EmissionVOC_hour[hour_index][node_index] = VOC
@@ -276,3 +363,26 @@ def extract_from_node(file, node_nums, EmissionCO, EmissionVOC, LOS_hour,
     # 'EmissionCO_hour' and 'EmissionVOC_hour' become 2D-list of float.
 
     return
+
+
+def cal_network_kpi(DelayRel_overall, Density_overall, AvgSpeed_overall,
+                    QStop_overall):
+    # Input
+    # > 'DelayRel_overall'  : 1D list of floats.
+    # > 'Density_overall'   : 1D list of floats.
+    # > 'AvgSpeed_overall'  : 1D list of floats. -1 means no vehicle.
+    # > 'QStop_overall'     : 1D list of non-negative numbers (not per meter).
+    #
+    # Output
+    # > dict of {str(KPI): float}
+    #
+    # Summarize a run into network-wide KPIs.
+
+    def _mean(values):
+        values = [value for value in values if value != -1]
+        return sum(values) / len(values) if values else 0.0
+
+    return {'Delay': _mean(DelayRel_overall),
+            'Density': _mean(Density_overall),
+            'Speed': _mean(AvgSpeed_overall),
+            'QueueStop': float(sum(QStop_overall))}
@@ -0,0 +1,47 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import sys
+
+import pipeline
+
+# (warmup_time, evaluation_interval, checkpoint_period, simulation_time)
+CASES = [
+    (0, 900, 1800, 7200),
+    (900, 3600, 3600, 4 * 3600 + 900),     # Warm-up not a multiple.
+    (600, 900, 2700, 9000),
+    (300, 900, 900, 3900),
+    (1200, 3600, 7200, 3600 * 6),
+]
+
+
+def checkpoints(warmup, interval, period, simulation_len):
+    # Output
+    # > 1D-list of int. Breaks pipeline.simulate() saves a checkpoint at.
+
+    datainfo = {'warmup_time': warmup, 'evaluation_interval': interval,
+                'checkpoint_period': period,
+                'simulation_time': simulation_len}
+    BreakAt = pipeline.add_interval_breakpoint([], datainfo)
+
+    return [break_at for break_at in BreakAt
+            if pipeline.is_checkpoint(break_at, datainfo)]
+
+
+def main():
+    failed = False
+    for warmup, interval, period, simulation_len in CASES:
+        saved = checkpoints(warmup, interval, period, simulation_len)
+        expected = list(range(warmup + period, simulation_len, period))
+
+        print(f"warm-up {warmup:>5}  interval {interval:>5}  "
+              + f"period {period:>5}  {len(saved):>3} checkpoints  "
+              + ("ok" if saved == expected and saved
+                 else f"expected {expected}, saved {saved}"))
+        failed |= saved != expected or not saved
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import subprocess
+import sys
+from pathlib import Path
+
+# The entry point, which imports modules of a command only when the
+# command runs, and modules which tools like .att parsing, report
+# re-rendering or input validation import.
+MODULES = ['main', 'cal', 'readinput', 'report', 'runsimul', 'runtime',
+           'setvissim']
+
+# Modules which must not be imported by 'MODULES' themselves.
+HEAVY = ['win32com', 'pythoncom', 'pywintypes']
+
+# Most of it is spent by the standard library (logging, re, pathlib).
+BUDGET_US = 100000  # 100 ms
+
+
+def measure(modules):
+    # Input
+    # > 'modules' : 1D-list of str.
+    #
+    # Output
+    # > 'cumulative' : dict of {str(module): int(cumulative import time [us])}
+    #
+    # Import 'modules' in a fresh interpreter with '-X importtime'.
+
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         f"import {', '.join(modules)}"],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True, text=True, check=True)
+
+    # Each line : "import time:      self [us] | cumulative | imported package"
+    cumulative = dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _self, cumul, name = line.split(':', 1)[1].split('|')
+        if not cumul.strip().isdigit():     # Header line
+            continue
+        cumulative[name.strip()] = int(cumul)
+
+    return cumulative
+
+
+def main():
+    cumulative = measure(MODULES)
+
+    failed = False
+    total = 0
+    for module in MODULES:
+        total += cumulative.get(module, 0)
+        print(f"{module:<12}{cumulative.get(module, 0):>10} us")
+    print(f"{'total':<12}{total:>10} us (budget {BUDGET_US} us)")
+
+    if total > BUDGET_US:
+        print("Import time budget exceeded.")
+        failed = True
+
+    for name in cumulative:
+        if name.split('.')[0] in HEAVY:
+            print(f"'{name}' is imported eagerly.")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import csv
+import os
+import sys
+import tempfile
+
+import layout
+import report
+
+# Characters Excel does not accept in a sheet name.
+FORBIDDEN = set('[]:*?/\\')
+
+
+def network(num_lanes, num_links):
+    # Output
+    # > 'elements', 'overall', 'tables' as pipeline.finish() passes them
+    #   to report.print_transposed() before layout.render_excel() renders
+    #   each page. Metric names are shared between kinds and long enough
+    #   to be cut at 31 characters.
+
+    elements = {'lane': [f"{link}-{lane}" for link in range(num_lanes // 2)
+                         for lane in (1, 2)],
+                'link': [str(link) for link in range(num_links)]}
+    overall = [('OccupRate', 'lane', [0.5] * len(elements['lane'])),
+               ('QStop', 'lane', [-1] * len(elements['lane'])),
+               ('VehNum', 'link', [10] * len(elements['link']))]
+    per_hour = [(metric, kind, [[index] * len(elements[kind])
+                                for index in range(2)])
+                for metric in ('VehNum', 'AvgSpeed', 'Emissions [CO]/[VOC]?')
+                for kind in ('lane', 'link')]
+    per_interval = [(metric, kind, [[index] * len(elements[kind])
+                                    for index in range(8)])
+                    for metric, kind, _ in per_hour]
+
+    return elements, overall, [(3600, per_hour), (900, per_interval)]
+
+
+def check_names(names):
+    # Output
+    # > 1D list of str. What is wrong with 'names'.
+
+    errors = []
+    seen = {name.lower() for name in report.RESERVED_SHEETS}
+    for name in names:
+        if not name or len(name) > 31:
+            errors.append(f"'{name}' has {len(name)} characters")
+        if FORBIDDEN & set(name):
+            errors.append(f"'{name}' has one of []:*?/\\")
+        if name.startswith("'") or name.endswith("'"):
+            errors.append(f"'{name}' starts or ends with an apostrophe")
+        if name.lower() in seen:
+            errors.append(f"'{name}' is used twice")
+        seen.add(name.lower())
+
+    return errors
+
+
+def check_pages(pages, elements, page_size):
+    # Output
+    # > 1D list of str. What is wrong with the layout of 'pages'.
+
+    errors = []
+    covered = dict()
+    for name, title, sheet in pages:
+        kind = 'lane' if title.startswith(('Overall lane', 'Lane')) \
+            else 'link'
+        rows = sheet.to_rows()
+        header = next((row for row in rows if row[0] == kind.capitalize()),
+                      None)
+        if header is None:
+            errors.append(f"'{name}' has no header row")
+            continue
+
+        body = [row for row in rows[rows.index(header) + 1:]
+                if row[0] is not None]
+        if len(body) > page_size:
+            errors.append(f"'{name}' has {len(body)} rows")
+        if any(len(row) != len(header) for row in body):
+            errors.append(f"'{name}' has ragged rows")
+        covered.setdefault(title, []).extend(row[0] for row in body)
+
+    for title, names in covered.items():
+        kind = 'lane' if title.startswith(('Overall lane', 'Lane')) \
+            else 'link'
+        if names != elements[kind]:
+            errors.append(f"'{title}' does not list every {kind} once")
+
+    return errors
+
+
+def check_csv(sheet):
+    # Output
+    # > 1D list of str. What is wrong with 'sheet' rendered as CSV.
+
+    fd, filename = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        layout.render_csv(sheet, filename)
+        with open(filename, newline='', encoding='UTF8') as f:
+            rows = list(csv.reader(f))
+    finally:
+        os.remove(filename)
+
+    expected = [['' if value is None else str(value) for value in row]
+                for row in sheet.to_rows()]
+    return [] if rows == expected else ["CSV differs from the sheet"]
+
+
+def main():
+    failed = False
+    for num_lanes, num_links, page_size in ((6, 3, 1000), (2500, 1200, 1000),
+                                            (40, 20, 7)):
+        elements, overall, tables = network(num_lanes, num_links)
+
+        pages = []
+        index = report.print_transposed(
+            lambda name, sheet: pages.append([name, None, sheet]),
+            elements, overall, tables, page_size)
+        for page, item in zip(pages, index):
+            page[1] = item[1]
+
+        index_sheet = layout.Sheet()
+        report.print_index(index_sheet, index)
+
+        errors = (check_names([name for name, _, _ in pages])
+                  + check_pages(pages, elements, page_size)
+                  + check_csv(index_sheet))
+        if len(index) != len(pages):
+            errors.append("index does not list every sheet")
+
+        print(f"{num_lanes:>6} lanes{num_links:>6} links{len(pages):>5} sheets"
+              + ("  ok" if not errors else ""))
+        for error in errors:
+            print(f"    {error}")
+        failed |= bool(errors)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
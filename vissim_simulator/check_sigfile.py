@@ -0,0 +1,157 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import bisect
+import copy
+import sys
+
+import readinput
+import runsimul
+import setvissim
+import sigfile
+
+
+class _Iterator:
+    def __init__(self, items):
+        self.Items = items
+        self.Index = 0
+
+    @property
+    def Valid(self):
+        return self.Index < len(self.Items)
+
+    @property
+    def Item(self):
+        return self.Items[self.Index]
+
+    def Next(self):
+        self.Index += 1
+
+
+class _SignalGroup:
+    def __init__(self, log, name, sg_no):
+        self.Log = log
+        self.Key = (name, sg_no)
+
+    def SetAttValue(self, attribute, value):
+        self.Log.append((self.Key, value))
+
+
+class _SignalController:
+    def __init__(self, log, sigcon):
+        self.Name = sigcon.Name
+        self.SGList = [_SignalGroup(log, sigcon.Name, sg_no)
+                       for sg_no in range(1, len(sigcon.SigInd[0]) + 1)]
+
+    def AttValue(self, attribute):
+        return self.Name
+
+    @property
+    def SGs(self):
+        return type('SGs', (), {'Iterator': _Iterator(self.SGList)})
+
+
+class _Network:
+    def __init__(self, log, Signal):
+        self.SCList = [_SignalController(log, sigcon) for sigcon in Signal]
+
+    @property
+    def SignalControllers(self):
+        return type('SCs', (), {'Iterator': _Iterator(self.SCList)})
+
+
+class _Vissim:
+    # Just enough of Vissim for runsimul.set_signal() to record the states
+    # it sets, without a Vissim install.
+
+    def __init__(self, Signal):
+        self.Log = []
+        self.Net = _Network(self.Log, Signal)
+
+
+def breakpoint_states(Signal, BreakAt, simulation_len):
+    # Output
+    # > dict of {(str(Name), int(SG No)): 1D-list of state per second}.
+    #
+    # States runsimul.set_signal() sets, second by second, as
+    # pipeline.simulate() runs breaks 'BreakAt'.
+
+    Vissim = _Vissim(Signal)
+    changes = []    # 1D-list of (int(sec), dict of states set)
+
+    for break_at in [0] + BreakAt:
+        Vissim.Log.clear()
+        runsimul.set_signal(Vissim, Signal, break_at)
+        changes.append((break_at, dict(Vissim.Log)))
+
+    states = dict()
+    secs = [sec for sec, _ in changes]
+    for sec in range(simulation_len):
+        for done in changes[:bisect.bisect_right(secs, sec)]:
+            for key, state in done[1].items():
+                states.setdefault(key, [None] * simulation_len)[sec] = state
+
+    return states
+
+
+def plan(name, offset_info, SigInd, signal_time, simulation_len):
+    # Output
+    # > 'Signal'    : 1D-list of one SigControl() planned as
+    #                 pipeline.plan_signal() does.
+    # > 'BreakAt'   : 1D-list of int.
+
+    sigcon = readinput.SigControl(name, offset_info)
+    sigcon.SigInd = copy.deepcopy(SigInd)
+    sigcon.signal_time = list(signal_time)
+
+    Signal = [sigcon]
+    readinput.rearrange_Signal(Signal)
+    BreakAt = readinput.calculate_breakpoint(Signal, simulation_len)
+
+    return Signal, BreakAt
+
+
+# (name, offset_info, SigInd, signal_time, simulation_len)
+CASES = [
+    ("two steps", (0, 1), [['R', 'G'], ['G', 'R']], [30, 30] * 20, 900),
+    ("offset", (25, 1), [['G', 'R'], ['Y', 'R'], ['R', 'G'], ['R', 'Y']],
+     [40, 3, 30, 3] * 20, 900),
+    ("time of day", (0, 1), [['G', 'R'], ['Y', 'R'], ['R', 'G'], ['R', 'Y']],
+     [40, 3, 30, 3] * 5 + [60, 3, 50, 3] * 5, 1200),
+    ("shorter than period", (10, 2), [['G', 'R'], ['R', 'G']], [45, 45] * 3,
+     600),
+]
+
+
+def main():
+    failed = False
+    for name, offset_info, SigInd, signal_time, simulation_len in CASES:
+        for converted in (False, True):
+            Signal, BreakAt = plan(name, offset_info, SigInd, signal_time,
+                                   simulation_len)
+            if converted:
+                setvissim.convert_signal_to_enum(Signal)
+            sigcon = Signal[0]
+
+            expected = breakpoint_states(Signal, BreakAt, simulation_len)
+            cycle, commands = sigfile.compile_program(sigcon, simulation_len)
+
+            mismatches = 0
+            for sg_no, cmds in commands.items():
+                compiled = sigfile.expand(cycle, cmds, simulation_len)
+                mismatches += sum(
+                    sigfile.display(state) != sg_display for state, sg_display
+                    in zip(expected[(sigcon.Name, sg_no)], compiled))
+            mismatches += len(sigfile.verify(sigcon, simulation_len))
+
+            print(f"{name:<22}{'states' if converted else 'R/G/Y':<8}"
+                  + f"cycle {cycle:>5} sec  "
+                  + ("ok" if not mismatches
+                     else f"{mismatches} seconds differ"))
+            failed |= bool(mismatches)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import csv
+import logging
+import math
+
+import resultdb
+from stats import RunningStat, t_quantile
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('alternative', 'metric', 'kind', 'interval', 'element',
+           'base_mean', 'alt_mean', 'diff', 'pct_change', 'base_runs',
+           'alt_runs', 'significant')
+
+
+# Prefixes of a run set given on the command line.
+PREFIXES = ('runs', 'scenario', 'start')
+
+
+def resolve_runs(db, spec):
+    # Input
+    # > 'db'   : Path of database file or sqlite3.Connection.
+    # > 'spec' : str. '<prefix>:<value>', one of
+    #            runs:3,4,5          run ids,
+    #            scenario:2030       every run of a scenario,
+    #            start:20240101_0900 every run of a replication set.
+    #            Without a prefix, a scenario, else a start time.
+    #
+    # Output
+    # > 1D list of int(run_id).
+
+    prefix, _, value = spec.partition(':')
+    if prefix not in PREFIXES:
+        prefix, value = None, spec
+
+    if prefix == 'runs':
+        try:
+            return [int(item) for item in value.split(',')]
+        except ValueError:
+            logger.error(f"resolve_runs() : '{value}' is not a list of run "
+                         + "ids.")
+            return []
+
+    runs = resultdb.runs(db)
+    run_ids = []
+    if prefix in ('scenario', None):
+        run_ids = [run['run_id'] for run in runs if run['scenario'] == value]
+    if prefix == 'start' or (prefix is None and not run_ids):
+        run_ids = [run['run_id'] for run in runs
+                   if run['start_time'] == value]
+    if not run_ids:
+        logger.error(f"resolve_runs() : No run matches '{spec}'.")
+
+    return run_ids
+
+
+def _timing(runs, run_ids):
+    # Input
+    # > 'runs'    : dict of {int(run_id): dict of run metadata}.
+    # > 'run_ids' : 1D list of int.
+    #
+    # Output
+    # > set of (int(evaluation interval), int(warm-up)) of 'run_ids'.
+
+    return {(runs[run_id]['interval'], runs[run_id]['warmup'])
+            for run_id in run_ids if run_id in runs}
+
+
+def _stat(state):
+    # Input
+    # > 'state' : list returned by resultdb.column_stats() or None.
+    #
+    # Output
+    # > RunningStat(). Empty if 'state' is None.
+
+    stat = RunningStat()
+    if state is not None:
+        stat.restore(state)
+
+    return stat
+
+
+def _significant(base, alt, confidence):
+    # Input
+    # > 'base', 'alt'  : RunningStat().
+    # > 'confidence'   : float in (0, 1).
+    #
+    # Output
+    # > bool or None if either side has less than 2 runs.
+    #
+    # Welch's t-test on the difference of means.
+
+    if base.Count < 2 or alt.Count < 2:
+        return None
+
+    var_base = base.variance() / base.Count
+    var_alt = alt.variance() / alt.Count
+    if var_base + var_alt == 0:
+        return base.Mean != alt.Mean
+
+    dof = (var_base + var_alt)**2 / (var_base**2 / (base.Count - 1)
+                                     + var_alt**2 / (alt.Count - 1))
+    t = t_quantile((1 + confidence) / 2, max(dof, 1))
+    return abs(alt.Mean - base.Mean) > t * math.sqrt(var_base + var_alt)
+
+
+def compare_runs(db, base_ids, alternatives, confidence=0.95):
+    # Input
+    # > 'db'            : Path of database file or sqlite3.Connection.
+    # > 'base_ids'      : 1D list of int(run_id).
+    # > 'alternatives'  : 1D list of (str(name), 1D list of int(run_id)).
+    # > 'confidence'    : float in (0, 1).
+    #
+    # Output
+    # > 'rows' : 1D list of tuples in order of COLUMNS.
+    #
+    # Elements are aligned by name, so an element missing on one side has
+    # None as its mean. 'pct_change' is None if the base mean is 0.
+    # NULL and MISSING values (no vehicle) are not counted.
+    # Intervals are aligned by index, so an alternative whose evaluation
+    # interval or warm-up differs from the base is not compared.
+
+    def _mean(stat):
+        return stat.Mean if stat.Count else None
+
+    rows = []
+    with resultdb.opened(db) as conn:
+        runs = {run['run_id']: run for run in resultdb.runs(conn)}
+        base_timing = _timing(runs, base_ids)
+        if len(base_timing) > 1:
+            logger.error("compare_runs() : Base runs differ in evaluation "
+                         + f"interval or warm-up {sorted(base_timing)}.")
+            return rows
+
+        # Statistics of every column come from one query per run set.
+        base = resultdb.column_stats(conn, base_ids)
+        for name, alt_ids in alternatives:
+            alt_timing = _timing(runs, alt_ids)
+            if alt_timing != base_timing:
+                logger.error(f"compare_runs() : '{name}' has evaluation "
+                             + f"interval and warm-up {sorted(alt_timing)}, "
+                             + f"base has {sorted(base_timing)}. Skipped.")
+                continue
+
+            alt = resultdb.column_stats(conn, alt_ids)
+            keys = sorted(dict.fromkeys(list(base) + list(alt)),
+                          key=lambda key: (key[2], key[0]))
+            for key in keys:
+                metric, kind, interval, element = key
+                base_stat, alt_stat = _stat(base.get(key)), _stat(alt.get(key))
+                base_mean, alt_mean = _mean(base_stat), _mean(alt_stat)
+                diff = pct = None
+                if base_mean is not None and alt_mean is not None:
+                    diff = alt_mean - base_mean
+                    pct = 100 * diff / abs(base_mean) if base_mean else None
+                rows.append((name, metric, kind, interval, element,
+                             base_mean, alt_mean, diff, pct, base_stat.Count,
+                             alt_stat.Count,
+                             _significant(base_stat, alt_stat, confidence)))
+
+    return rows
+
+
+def write_csv(filename, rows):
+    # Input
+    # > 'filename' : Path.
+    # > 'rows'     : 1D list returned by compare_runs().
+
+    with open(filename, 'w', newline='', encoding='UTF8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+    return
@@ -0,0 +1,423 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import atexit
+import datetime
+import gzip
+import json
+import logging
+import shutil
+import threading
+import time
+from pathlib import Path, PureWindowsPath
+
+logger = logging.getLogger(__name__)
+
+# Files of a trace directory.
+EVENTS = 'com.jsonl.gz'
+FILES = 'files'
+
+# Lines of EVENTS, as JSON lists.
+# > ["dispatch", int(session), str(prog_id)]
+# > ["file", str(path), str(name in FILES)]
+# > [int(session), int(object), str(op), str(name), list(args), result]
+#   op is 'g'(get attribute), 's'(set attribute), 'm'(get method) or
+#   'c'(call). Getting a method is written apart from calling it, since
+#   arguments may be COM calls in between(ex. Add(After=Worksheets(1))).
+#   Object 0 is the dispatched object of the session and name of calling
+#   an object itself(ex. ws.Cells(1, 1)) is "".
+#   COM objects are written as {"$obj": int}, datetimes as {"$time": str}
+#   and a raised exception as {"$error": str, "$type": str}.
+
+
+class ReplayError(Exception):
+    # A COM call of the replayed run differs from the recorded one, or a
+    # recorded COM call raised.
+    pass
+
+
+def _encode_value(value):
+    # Input
+    # > 'value' : Argument of a COM call. COM objects are proxies.
+    #
+    # Output
+    # > JSON-compatible value.
+
+    if isinstance(value, (_RecordProxy, _ReplayProxy)):
+        return {'$obj': object.__getattribute__(value, '_id')}
+    if isinstance(value, (list, tuple)):
+        return [_encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _encode_value(item) for key, item in value.items()}
+    if isinstance(value, datetime.datetime):
+        return {'$time': value.isoformat()}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _unwrap(value):
+    # Input
+    # > 'value' : Argument of a COM call.
+    #
+    # Output
+    # > 'value' with proxies replaced by the COM objects they wrap.
+
+    if isinstance(value, _RecordProxy):
+        return object.__getattribute__(value, '_target')
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _unwrap(item) for key, item in value.items()}
+    return value
+
+
+def _arguments(args, kwargs):
+    # Output
+    # > 1D-list. Arguments as written to EVENTS.
+
+    return list(args) + ([{'$kw': kwargs}] if kwargs else [])
+
+
+class _Session:
+    def __init__(self, recorder, index):
+        # COM objects reached from one dispatched object. A session is used
+        # by one thread, so ids are never shared between threads.
+
+        self.Recorder = recorder
+        self.Index = index
+        self.NumObjects = 1     # Object 0 is the dispatched object.
+
+    def wrap(self, value):
+        # Input
+        # > 'value' : Result of a COM call.
+        #
+        # Output
+        # > 'encoded'   : JSON-compatible value.
+        # > 'value'     : 'value' with COM objects wrapped in proxies.
+
+        if hasattr(value, '_oleobj_'):
+            proxy = _RecordProxy(value, self, self.NumObjects)
+            self.NumObjects += 1
+            return {'$obj': object.__getattribute__(proxy, '_id')}, proxy
+        if isinstance(value, (list, tuple)):
+            pairs = [self.wrap(item) for item in value]
+            return ([encoded for encoded, _ in pairs],
+                    type(value)(item for _, item in pairs))
+        return _encode_value(value), value
+
+    def log(self, obj_id, op, name, args, function):
+        # Input
+        # > 'obj_id', 'op', 'name', 'args' : See EVENTS.
+        # > 'function' : function(). The actual COM call.
+        #
+        # Output
+        # > Result of 'function' with COM objects wrapped in proxies.
+
+        try:
+            encoded, result = self.wrap(function())
+        except Exception as e:
+            self.Recorder.write([self.Index, obj_id, op, name,
+                                 _encode_value(args),
+                                 {'$error': str(e),
+                                  '$type': type(e).__name__}])
+            raise
+        self.Recorder.write([self.Index, obj_id, op, name,
+                             _encode_value(args), encoded])
+        return result
+
+
+class _RecordProxy:
+    __slots__ = ('_target', '_session', '_id')
+
+    def __init__(self, target, session, obj_id):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_session', session)
+        object.__setattr__(self, '_id', obj_id)
+
+    def __getattr__(self, name):
+        target = object.__getattribute__(self, '_target')
+        session = object.__getattribute__(self, '_session')
+        obj_id = object.__getattribute__(self, '_id')
+
+        try:
+            value = getattr(target, name)
+        except Exception as e:
+            def _raise():
+                raise e
+            return session.log(obj_id, 'g', name, [], _raise)
+
+        if callable(value) and not hasattr(value, '_oleobj_'):
+            session.Recorder.write([session.Index, obj_id, 'm', name, [],
+                                    None])
+
+            def _method(*args, **kwargs):
+                return session.log(obj_id, 'c', name,
+                                   _arguments(args, kwargs),
+                                   lambda: value(*_unwrap(args),
+                                                 **_unwrap(kwargs)))
+            return _method
+
+        return session.log(obj_id, 'g', name, [], lambda: value)
+
+    def __setattr__(self, name, value):
+        target = object.__getattribute__(self, '_target')
+        session = object.__getattribute__(self, '_session')
+        obj_id = object.__getattribute__(self, '_id')
+
+        session.log(obj_id, 's', name, [value],
+                    lambda: setattr(target, name, _unwrap(value)))
+
+    def __call__(self, *args, **kwargs):
+        target = object.__getattribute__(self, '_target')
+        session = object.__getattribute__(self, '_session')
+        obj_id = object.__getattribute__(self, '_id')
+
+        return session.log(obj_id, 'c', "", _arguments(args, kwargs),
+                           lambda: target(*_unwrap(args), **_unwrap(kwargs)))
+
+
+class Recorder:
+    Replaying = False
+
+    def __init__(self, directory):
+        # Input
+        # > 'directory' : Path of the trace directory.
+        #
+        # Write every COM request and response of this process to
+        # 'directory'. Lines are written as they come, so that the trace of
+        # a broken run is kept as well.
+
+        self.Directory = Path(directory)
+        (self.Directory/FILES).mkdir(parents=True, exist_ok=True)
+        self.File = gzip.open(self.Directory/EVENTS, 'wt', encoding='UTF8')
+        self.Lock = threading.Lock()
+        self.NumSessions = 0
+        self.NumEvents = 0
+        self.NumFiles = 0
+        atexit.register(self.close)
+
+    def write(self, line):
+        text = json.dumps(line, separators=(',', ':')) + '\n'
+        with self.Lock:
+            if self.File is not None:
+                self.File.write(text)
+                self.NumEvents += isinstance(line[0], int)
+
+    def dispatch(self, prog_id, target):
+        # Input
+        # > 'prog_id'   : str.
+        # > 'target'    : CDispatch.
+        #
+        # Output
+        # > Proxy of 'target' recording its COM calls.
+
+        with self.Lock:
+            index = self.NumSessions
+            self.NumSessions += 1
+        self.write(['dispatch', index, prog_id])
+
+        return _RecordProxy(target, _Session(self, index), 0)
+
+    def file(self, path):
+        # Input
+        # > 'path' : str. Path of a file written by a COM server.
+        #
+        # Output
+        # > 'path'.
+        #
+        # Keep a copy of the file, since the replaying machine has no COM
+        # server to write it.
+
+        if not Path(path).exists():
+            logger.error(f"Recorder.file() : {path} is missing.")
+            return path
+
+        with self.Lock:
+            name = f"{self.NumFiles:03d}_{PureWindowsPath(path).name}"
+            self.NumFiles += 1
+        shutil.copyfile(path, self.Directory/FILES/name)
+        self.write(['file', str(path), name])
+
+        return path
+
+    def close(self):
+        with self.Lock:
+            if self.File is None:
+                return
+            self.File.close()
+            self.File = None
+        logger.info(f"Recorded {self.NumEvents} COM calls and "
+                    + f"{self.NumFiles} files to {self.Directory}.")
+
+        return
+
+
+class _ReplayProxy:
+    __slots__ = ('_session', '_id')
+
+    def __init__(self, session, obj_id):
+        object.__setattr__(self, '_session', session)
+        object.__setattr__(self, '_id', obj_id)
+
+    def __getattr__(self, name):
+        session = object.__getattribute__(self, '_session')
+        obj_id = object.__getattribute__(self, '_id')
+
+        # Whether 'name' is a method is known only from the trace.
+        if session.peek(obj_id, name) == 'm':
+            session.next(obj_id, 'm', name)
+
+            def _method(*args, **kwargs):
+                return session.next(obj_id, 'c', name)
+            return _method
+
+        return session.next(obj_id, 'g', name)
+
+    def __setattr__(self, name, value):
+        session = object.__getattribute__(self, '_session')
+        session.next(object.__getattribute__(self, '_id'), 's', name)
+
+    def __call__(self, *args, **kwargs):
+        session = object.__getattribute__(self, '_session')
+        return session.next(object.__getattribute__(self, '_id'), 'c', "")
+
+
+class _ReplaySession:
+    def __init__(self, prog_id, events):
+        # Input
+        # > 'prog_id'   : str.
+        # > 'events'    : 1D-list of (obj_id, op, name, args, result).
+
+        self.ProgId = prog_id
+        self.Events = events
+        self.Cursor = 0
+
+    def _mismatch(self, obj_id, op, name):
+        expected = (self.Events[self.Cursor][:3]
+                    if self.Cursor < len(self.Events) else "end of trace")
+        message = (f"{self.ProgId} event {self.Cursor}: {(obj_id, op, name)} "
+                   + f"is called, but {expected} is recorded.")
+        logger.error(f"Replay : {message}")
+        return ReplayError(message)
+
+    def peek(self, obj_id, name):
+        # Output
+        # > str(op) of the next event if it is of 'obj_id' and 'name'.
+
+        if self.Cursor < len(self.Events):
+            event_id, op, event_name, *_ = self.Events[self.Cursor]
+            if event_id == obj_id and event_name == name:
+                return op
+        return None
+
+    def next(self, obj_id, op, name):
+        # Output
+        # > Recorded result of the next event, which has to match.
+
+        if self.peek(obj_id, name) != op:
+            raise self._mismatch(obj_id, op, name)
+
+        result = self.Events[self.Cursor][4]
+        self.Cursor += 1
+        if isinstance(result, dict) and '$error' in result:
+            if result['$type'] == 'AttributeError':
+                raise AttributeError(result['$error'])
+            raise ReplayError(result['$error'])
+
+        return self.decode(result)
+
+    def decode(self, value):
+        if isinstance(value, list):
+            # COM returns tuples.
+            return tuple(self.decode(item) for item in value)
+        if isinstance(value, dict):
+            if '$obj' in value:
+                return _ReplayProxy(self, value['$obj'])
+            if '$time' in value:
+                return datetime.datetime.fromisoformat(value['$time'])
+        return value
+
+
+class Replayer:
+    Replaying = True
+
+    def __init__(self, directory):
+        # Input
+        # > 'directory' : Path of a trace directory written by Recorder().
+        #
+        # Serve recorded responses without any COM server. The whole trace
+        # is loaded first, so that replay runs at memory speed.
+
+        self.Directory = Path(directory)
+        self.Sessions = dict()  # {str(prog_id): 1D-list of _ReplaySession()}
+        self.Used = []          # _ReplaySession() already dispatched.
+        self.Files = dict()     # {str(path): 1D-list of str(name)}
+
+        start = time.perf_counter()
+        sessions = dict()       # {int(session): _ReplaySession()}
+        with gzip.open(self.Directory/EVENTS, 'rt', encoding='UTF8') as f:
+            try:
+                for line in f:
+                    line = json.loads(line)
+                    if line[0] == 'dispatch':
+                        sessions[line[1]] = _ReplaySession(line[2], [])
+                        self.Sessions.setdefault(line[2], []).append(
+                            sessions[line[1]])
+                    elif line[0] == 'file':
+                        self.Files.setdefault(line[1], []).append(line[2])
+                    else:
+                        sessions[line[0]].Events.append(tuple(line[1:]))
+            except (EOFError, ValueError):
+                # The recording process ended without closing the trace.
+                logger.warning("Replayer() : The trace is cut short.")
+
+        logger.info(f"Loaded {sum(len(s.Events) for s in sessions.values())}"
+                    + f" COM calls from {self.Directory} in "
+                    + f"{time.perf_counter() - start:.3f} sec.")
+        self.Start = time.perf_counter()
+
+    def dispatch(self, prog_id):
+        # Input
+        # > 'prog_id' : str.
+        #
+        # Output
+        # > Proxy of the next recorded session of 'prog_id'.
+
+        if not self.Sessions.get(prog_id):
+            logger.error(f"Replay : {prog_id} is not dispatched any more.")
+            raise ReplayError(f"No recorded session of {prog_id}.")
+
+        session = self.Sessions[prog_id].pop(0)
+        self.Used.append(session)
+
+        return _ReplayProxy(session, 0)
+
+    def file(self, path):
+        # Input
+        # > 'path' : str. Path of a file written by a COM server.
+        #
+        # Output
+        # > str. Path of its recorded copy. The last copy of 'path' is kept
+        #   for later reads.
+
+        names = self.Files.get(str(path))
+        if not names:
+            logger.error(f"Replay : {path} is not recorded.")
+            return path
+
+        name = names.pop(0) if len(names) > 1 else names[0]
+        return str(self.Directory/FILES/name)
+
+    def close(self):
+        num_calls = sum(session.Cursor for session in self.Used)
+        left = sum(len(session.Events) - session.Cursor
+                   for session in self.Used)
+        logger.info(f"Replayed {num_calls} COM calls in "
+                    + f"{time.perf_counter() - self.Start:.3f} sec.")
+        if left or any(self.Sessions.values()):
+            logger.warning(f"Replay : {left} recorded COM calls and "
+                           + f"{sum(map(len, self.Sessions.values()))} "
+                           + "sessions were not replayed.")
+
+        return
@@ -0,0 +1,117 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Sheet:
+    def __init__(self):
+        # In-memory worksheet. report.py lays out the whole report here and
+        # a backend renders it in one pass.
+
+        self.row = 1            # Next row to print. 1-based like Excel.
+        self.Values = dict()    # {(int(row), int(col)): value}
+        self.Colors = []        # 1D-list of (color, from_row, from_col,
+        #                                      to_row, to_col).
+        self.Merges = []        # 1D-list of (row, from_col, to_col).
+        self.Borders = []       # 1D-list of (row, from_col, to_col).
+        self.Centered = set()   # Rows aligned to horizontal center.
+        self.AutoFit = set()    # Columns fitted to their contents.
+
+    def set(self, row, col, value):
+        self.Values[(row, col)] = value
+
+    def get(self, row, col):
+        return self.Values.get((row, col))
+
+    def fill(self, color, from_row, from_col, to_row=None, to_col=None):
+        # 'color' = 19 : Ivory
+        #           36 : Light Yellow
+        #           38 : Rose
+
+        if to_row is None:
+            to_row = from_row
+        if to_col is None:
+            to_col = from_col
+        self.Colors.append((color, from_row, from_col, to_row, to_col))
+
+    def merge(self, row, from_col, to_col):
+        if to_col > from_col:
+            self.Merges.append((row, from_col, to_col))
+
+    def border(self, row, from_col, to_col):
+        self.Borders.append((row, from_col, to_col))
+
+    def center(self, row):
+        self.Centered.add(row)
+
+    def size(self):
+        # Output
+        # > (int, int). The number of used rows and columns.
+
+        if not self.Values:
+            return 0, 0
+        return (max(row for row, _ in self.Values),
+                max(col for _, col in self.Values))
+
+    def to_rows(self):
+        # Output
+        # > 2D-list of values. Empty cells are None.
+
+        num_rows, num_cols = self.size()
+        rows = [[None] * num_cols for _ in range(num_rows)]
+        for (row, col), value in self.Values.items():
+            rows[row - 1][col - 1] = value
+
+        return rows
+
+
+def render_excel(sheet, ws):
+    # Input
+    # > 'sheet' : Sheet().
+    # > 'ws'    : Excel worksheet. DisplayAlerts should be off to merge.
+    #
+    # All values go in a single Range assignment; styles follow.
+
+    num_rows, num_cols = sheet.size()
+    if num_rows:
+        ws.Range(ws.Cells(1, 1), ws.Cells(num_rows, num_cols)).Value = \
+            sheet.to_rows()
+
+    for row in sorted(sheet.Centered):
+        ws.Rows(row).HorizontalAlignment = 3    # Center
+
+    for color, from_row, from_col, to_row, to_col in sheet.Colors:
+        ws.Range(ws.Cells(from_row, from_col), ws.Cells(to_row, to_col))\
+          .Interior.ColorIndex = color
+
+    for row, from_col, to_col in sheet.Borders:
+        # Draw border with solid line.
+        ws.Range(ws.Cells(row, from_col), ws.Cells(row, to_col))\
+          .Borders.LineStyle = 1
+
+    for row, from_col, to_col in sheet.Merges:
+        ws.Range(ws.Cells(row, from_col), ws.Cells(row, to_col)).Merge()
+
+    for col in sorted(sheet.AutoFit):
+        ws.Columns(col).AutoFit()
+
+    return
+
+
+def render_csv(sheet, filename):
+    # Input
+    # > 'sheet'     : Sheet().
+    # > 'filename'  : Path.
+    #
+    # Values only. Styles and merges have no place in CSV.
+
+    with open(filename, 'w', newline='', encoding='UTF8') as f:
+        csv.writer(f).writerows(
+            ['' if value is None else value for value in row]
+            for row in sheet.to_rows())
+
+    return
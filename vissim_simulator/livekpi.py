@@ -0,0 +1,174 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import csv
+import logging
+import math
+from array import array
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Columns of a sample.
+# 'VehNotInNet' is the largest vehicle number seen minus vehicles in
+# network: vehicles which arrived, but also vehicles removed (ex. lost
+# vehicles) and vehicles numbered but still waiting to enter. It is not an
+# arrival count; runsimul.network_arrivals() gives that after a run.
+COLUMNS = ('sim_sec', 'VehInNet', 'VehNotInNet', 'MeanSpeed', 'Stopped')
+
+# Vehicles slower than this [km/h] are counted as stopped.
+STOPPED_SPEED = 1.0
+
+
+class RingBuffer:
+    def __init__(self, capacity, num_cols):
+        # Input
+        # > 'capacity'  : int. The number of rows kept.
+        # > 'num_cols'  : int.
+        #
+        # Fixed-size buffer of float rows in one flat array. The latest
+        # 'capacity' rows are kept, older rows are overwritten.
+
+        self.Capacity = capacity
+        self.NumCols = num_cols
+        self.Values = array('d', [math.nan]) * (capacity * num_cols)
+        self.Head = 0       # Index of the next row to write.
+        self.Count = 0      # The number of rows kept.
+        self.Pending = 0    # The number of rows not handed to flush() yet.
+
+    def push(self, row):
+        # Input
+        # > 'row' : 1D-list of 'NumCols' numbers.
+        #
+        # Output
+        # > bool. True if all kept rows are pending, so that they should be
+        #   flushed before the next push() overwrites them.
+
+        start = self.Head * self.NumCols
+        self.Values[start:start + self.NumCols] = array('d', row)
+        self.Head = (self.Head + 1) % self.Capacity
+        self.Count = min(self.Count + 1, self.Capacity)
+        self.Pending += 1
+
+        return self.Pending == self.Capacity
+
+    def rows(self, last=None):
+        # Input
+        # > 'last' : int or None(all kept rows).
+        #
+        # Output
+        # > 1D-list of 1D-list. The latest 'last' rows, oldest first.
+
+        last = self.Count if last is None else min(last, self.Count)
+        rows = []
+        for back in range(last, 0, -1):
+            start = ((self.Head - back) % self.Capacity) * self.NumCols
+            rows.append(self.Values[start:start + self.NumCols].tolist())
+
+        return rows
+
+    def flush(self):
+        # Output
+        # > 1D-list of 1D-list. Rows not flushed yet, oldest first.
+
+        rows = self.rows(self.Pending)
+        self.Pending = 0
+
+        return rows
+
+
+class LiveSampler:
+    def __init__(self, file, stride=1, capacity=256):
+        # Input
+        # > 'file'      : Path of the time series CSV. Samples are appended.
+        # > 'stride'    : int. Sample every 'stride'-th break.
+        # > 'capacity'  : int. Size of the ring buffer.
+        #
+        # Network-wide KPIs sampled while the simulation is paused at
+        # breaks. Samples are written to 'file' whenever the buffer is full
+        # and at close().
+
+        self.File = Path(file)
+        self.Stride = max(int(stride), 1)
+        self.Buffer = RingBuffer(capacity, len(COLUMNS))
+        self.NumBreaks = 0
+        self.MaxVehNo = 0   # The largest vehicle number seen.
+
+        if not self.File.exists():
+            with self.File.open('w', newline='', encoding='UTF8') as f:
+                csv.writer(f).writerow(COLUMNS)
+
+    def at_break(self, Vissim, sim_sec):
+        # Input
+        # > 'Vissim'    : CDispatch. Paused at 'sim_sec'.
+        # > 'sim_sec'   : int.
+        #
+        # Sample every 'Stride'-th call.
+
+        self.NumBreaks += 1
+        if (self.NumBreaks - 1) % self.Stride == 0:
+            self.sample(Vissim, sim_sec)
+
+        return
+
+    def sample(self, Vissim, sim_sec):
+        # All KPIs come from a single bulk call over vehicles in network.
+        # Vehicles are numbered in order, so those not in network are the
+        # largest number seen so far less those in network.
+
+        vehicles = Vissim.Net.Vehicles.GetMultipleAttributes(('No', 'Speed'))
+
+        speeds = [speed for _, speed in vehicles if speed is not None]
+        if vehicles:
+            self.MaxVehNo = max(self.MaxVehNo,
+                                max(no for no, _ in vehicles))
+        row = [sim_sec, len(vehicles), max(self.MaxVehNo - len(vehicles), 0),
+               sum(speeds) / len(speeds) if speeds else math.nan,
+               sum(1 for speed in speeds if speed < STOPPED_SPEED)]
+
+        if self.Buffer.push(row):
+            self._write(self.Buffer.flush())
+
+        return
+
+    def _write(self, rows):
+        with self.File.open('a', newline='', encoding='UTF8') as f:
+            csv.writer(f).writerows(
+                [int(value) if value.is_integer() else value for value in row]
+                for row in rows)
+
+        return
+
+    def state(self):
+        # Output
+        # > dict. JSON serializable. Samples buffered so far are written
+        #   first, so that the file has every sample up to this point.
+        #
+        # MaxVehNo is kept, since vehicles which left the network before a
+        # checkpoint are not in network after resume.
+
+        self._write(self.Buffer.flush())
+
+        return {'NumBreaks': self.NumBreaks, 'MaxVehNo': self.MaxVehNo,
+                'file_size': self.File.stat().st_size}
+
+    def restore(self, state):
+        # Input
+        # > 'state' : dict returned by state().
+        #
+        # Samples written after the checkpoint are dropped, since they are
+        # sampled again.
+
+        self.NumBreaks = state['NumBreaks']
+        self.MaxVehNo = state['MaxVehNo']
+        with self.File.open('r+b') as f:
+            f.truncate(state['file_size'])
+
+        return
+
+    def close(self):
+        self._write(self.Buffer.flush())
+        logger.info(f"Live KPIs: {self.NumBreaks} breaks, samples in "
+                    + f"{self.File}.")
+
+        return
@@ -1,171 +1,473 @@
 # ==========================================================================
 # Author : HyeAnn Lee
 # ==========================================================================
+import argparse
 import datetime
 import json
 import logging
-import logging.config
-import math
+import sys
+import time
 from pathlib import Path
 
-Path('./log').mkdir(parents=True, exist_ok=True)
-config = json.load(open("resources/logger.json"))
-logging.config.dictConfig(config)
+import runtime
+from variable import *
+
 logger = logging.getLogger(__name__)
 
-import win32com.client as com
 
-import cal
-import readinput
-import report
-import runsimul
-import setvissim
-from variable import *
+def run(args):
+    # Run a new simulation.
+
+    import pipeline
+    import readinput
+
+    datainfo = dict()
+    datainfo['random_seed'] = -1
+    datainfo['quick_mode'] = True
+    datainfo['simulation_time'] = 600
+    datainfo['vehicle_input_period'] = 900
+    datainfo['comment'] = ""
+    datainfo['overlapped_startup'] = True
+    datainfo['start_time'] = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # 1. Read Excel
+    logger.info("Reading an input file...")
+    readinput.read_json(datainfo, Path(args.init))
+
+    Vissim, BreakAt, Link_TT, node_nums, startup = pipeline.prepare(datainfo)
+
+    BreakAt = pipeline.add_interval_breakpoint(BreakAt, datainfo)
+    with pipeline.make_aggregator(
+            datainfo,
+            Path().absolute()/f"partial_{datainfo['start_time']}.jsonl") \
+            as aggregator:
+        # 3. Run Simulation
+        logger.info("Running simulation...")
+        Vissim.Simulation.RunSingleStep()
+        logger.info("Time to first simulation step: "
+                    + f"{time.perf_counter() - startup:.1f} sec "
+                    + ("(overlapped startup)."
+                       if datainfo['overlapped_startup']
+                       else "(sequential startup)."))
+
+        run_no = pipeline.simulate(
+            Vissim, datainfo, Signal, BreakAt, aggregator,
+            Path().absolute()/f"checkpoint_{datainfo['start_time']}")
+
+        # Close COM server:
+        logger.info("Closing Vissim...")
+        Vissim = None
+
+        pipeline.finish(datainfo, aggregator, Link_TT, node_nums, startup,
+                        run_no)
+
+    return
+
+
+def _input_mtimes(init, datainfo):
+    # Output
+    # > dict of {str(path): float or None}. Modification times of init.json
+    #   and input workbooks.
+
+    paths = [init] + [datainfo[key] for key in ('signal_xlsx',
+                                                'vehicle_input_xlsx',
+                                                'vehicle_routes_xlsx')]
+    return {str(path): Path(path).stat().st_mtime if Path(path).exists()
+            else None for path in paths}
+
+
+def session(args):
+    # Keep Vissim open and run again whenever init.json or an input workbook
+    # changes. Only setup stages whose inputs changed are applied again.
+
+    import pipeline
+    import readinput
 
-# from tqdm import tqdm
-
-datainfo = dict()
-datainfo['random_seed'] = -1
-datainfo['quick_mode'] = True
-datainfo['simulation_time'] = 600
-datainfo['vehicle_input_period'] = 900
-datainfo['comment'] = ""
-start_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-
-# 1. Read Excel
-logger.info("Reading an input file...")
-readinput.read_json(datainfo, Path().absolute()/"resources/init.json")
-
-try:
-    excel = com.Dispatch("Excel.Application")
-    excel.Visible = False
-    excel.DisplayAlerts = False
-    logger.info("Reading signal xlsx...")
-    wb1 = excel.Workbooks.Open(datainfo['signal_xlsx'])
-    readinput.read_signal_xlsx(wb1, Signal)
-    logger.info("Reading vehicle xlsx...")
-    wb2 = excel.Workbooks.Open(datainfo['vehicle_input_xlsx'])
-    readinput.read_vehicleinput(wb2, VehicleInput)
-    logger.info("Reading Static Vehicle Routes xlsx...")
-    wb3 = excel.Workbooks.Open(datainfo['vehicle_routes_xlsx'])
-    readinput.read_static_vehicle_routes(wb3, Static_Vehicle_Routes)
-    excel.Quit()
-
-except Exception as e:
-    logger.error(e)
-
-finally:
-    wb1 = wb2 = wb3 = None
-    excel = None
-
-readinput.rearrange_Signal(Signal)
-BreakAt = readinput.calculate_breakpoint(Signal, datainfo['simulation_time'])
-
-# 2. Set Vissim
-setvissim.convert_signal_to_enum(Signal)
-datainfo['random_seed'] = setvissim.set_randomseed(datainfo['random_seed'])
-
-# Connecting the COM Server => Open a new Vissim Window:
-logger.info("Setting Vissim...")
-Vissim = com.Dispatch("Vissim.Vissim")
-
-# Load a Vissim Network:
-Vissim.LoadNet(datainfo['vissim_inpx'])
-
-setvissim.check_sig_file(Vissim)
-
-Link_TT = setvissim.get_travtm_info(Vissim)
-node_nums = setvissim.get_all_node(Vissim)
-setvissim.find_incoming_lane(Vissim, lanes_with_SH)
-
-setvissim.set_Vissim(Vissim, datainfo)
-setvissim.set_link_segment(Vissim)
-setvissim.set_queue_counter(Vissim, lanes_with_SH)
-setvissim.set_data_collection(Vissim, lanes_with_SH)
-setvissim.set_vehicleinput(Vissim, datainfo, VehicleInput)
-setvissim.set_static_vehicle_route(Vissim, Static_Vehicle_Routes)
-
-
-# 3. Run Simulation
-logger.info("Running simulation...")
-Vissim.Simulation.RunSingleStep()
-
-# Extract data per signal period
-"""
-break_at = pbar_update = 0
-with tqdm(total=datainfo['simulation_time']) as pbar:
-    runsimul.set_signal(Vissim, Signal, break_at)
-    for break_at in BreakAt:
-        Vissim.Simulation.SetAttValue('SimBreakAt', break_at)   # Set break_at
-        Vissim.Simulation.RunContinuous()   # Run simulation until 'break_at'
-        runsimul.set_signal(Vissim, Signal, break_at)   # Set signal
-
-        pbar.update(break_at-pbar_update)
-        pbar_update = break_at
-    Vissim.Simulation.RunContinuous()
-"""
-break_at = 0
-runsimul.set_signal(Vissim, Signal, break_at)
-for break_at in runsimul.progressbar(BreakAt):
-    Vissim.Simulation.SetAttValue('SimBreakAt', break_at)   # Set break_at
-    Vissim.Simulation.RunContinuous()   # Run simulation until 'break_at'
-    runsimul.set_signal(Vissim, Signal, break_at)   # Set signal
-Vissim.Simulation.RunContinuous()
-
-# Extract data per hour
-hour_step = math.ceil(break_at/3600)
-for hour in range(hour_step):
-    time_str = str(hour + 1)
-    runsimul.extract_from_datacollection_per_hour(Vissim, time_str, VehNum_hour, OccupRate_hour)
-    runsimul.extract_from_queue_per_hour(Vissim, time_str, QStop_hour)
-    runsimul.extract_from_travtm_per_hour(Vissim, time_str, AvgSpeed_hour)
-
-# Close COM server:
-logger.info("Closing Vissim...")
-Vissim = None
-
-
-# 4. Calculate overall data
-logger.info("Calculating...")
-SH_per_link = cal.cal_SH_per_link(lanes_with_SH)
-
-cal.cal_occuprate_overall(OccupRate_hour, OccupRate_overall, datainfo['simulation_time'])
-cal.cal_qstop_overall(QStop_hour, QStop_overall)
-cal.cal_qstop_per_meter(QStop_hour, QStop_overall, lanes_with_SH)
-
-network_filename, _extention = datainfo['vissim_inpx'].split('.')
-
-linkseg_result = f'{network_filename}_Link Segment Results_001.att'
-cal.extract_from_linkseg(linkseg_result, lanes_with_SH, Density_overall, DelayRel_overall, AvgSpeed_overall)
-
-cal.prep_extract_from_node(hour_step, LOS_hour, EmissionCO_hour, EmissionVOC_hour)
-if node_nums:     # If there was any node in Vissim network,
-    node_result = f'{network_filename}_Node Results_001.att'
-    cal.extract_from_node(node_result, node_nums, EmissionCO, EmissionVOC, LOS_hour, EmissionCO_hour, EmissionVOC_hour)
-
-
-# 5. Report
-logger.info("Reporting...")
-try:
-    excel = com.Dispatch("Excel.Application")
-    excel.Visible = False
-    excel.DisplayAlerts = False     # To merge cells
-    wb = excel.Workbooks.Add()
-    ws = wb.Worksheets("Sheet1")
-
-    report.print_simul_info(ws, datainfo)
-    report.print_explanation(ws)
-    report.print_overall(ws, lanes_with_SH, SH_per_link, node_nums, DelayRel_overall, Density_overall, AvgSpeed_overall, QStop_overall, OccupRate_overall, EmissionCO, EmissionVOC)
-    report.print_hour(ws, lanes_with_SH, SH_per_link, Link_TT, node_nums, VehNum_hour, QStop_hour, OccupRate_hour, AvgSpeed_hour, LOS_hour, EmissionCO_hour, EmissionVOC_hour)
-
-    ws.Columns(2).AutoFit()
-    wb.SaveAs(str(Path().absolute()/f'output_{start_time}.xlsx'))
-    excel.Quit()
-
-except Exception as e:
-    print(e)
-
-finally:
-    ws = None
-    wb = None
-    excel = None
+    live = dict()
+    try:
+        while True:
+            datainfo = dict()
+            datainfo['random_seed'] = -1
+            datainfo['quick_mode'] = True
+            datainfo['simulation_time'] = 600
+            datainfo['vehicle_input_period'] = 900
+            datainfo['comment'] = ""
+            datainfo['overlapped_startup'] = True
+            datainfo['start_time'] = \
+                datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+            logger.info("Reading an input file...")
+            readinput.read_json(datainfo, Path(args.init))
+            mtimes = _input_mtimes(args.init, datainfo)
+
+            pipeline.clear_lists()
+            Vissim, BreakAt, Link_TT, node_nums, startup = \
+                pipeline.prepare(datainfo, live)
+
+            BreakAt = pipeline.add_interval_breakpoint(BreakAt, datainfo)
+            with pipeline.make_aggregator(
+                    datainfo, Path().absolute()
+                    / f"partial_{datainfo['start_time']}.jsonl") \
+                    as aggregator:
+                logger.info("Running simulation...")
+                run_no = pipeline.simulate(
+                    Vissim, datainfo, Signal, BreakAt, aggregator,
+                    Path().absolute()/f"checkpoint_{datainfo['start_time']}")
+                Vissim = None
+
+                pipeline.finish(datainfo, aggregator, Link_TT, node_nums,
+                                startup, run_no)
+            pipeline.discard_runs(live['Vissim'])
+
+            logger.info("Waiting for input files to change (Ctrl+C to quit)...")
+            while _input_mtimes(args.init, datainfo) == mtimes:
+                time.sleep(1)
+
+    except KeyboardInterrupt:
+        pass
+
+    logger.info("Closing Vissim...")
+    live.clear()
+
+    return
+
+
+def resume(args):
+    # Continue a run from its latest checkpoint.
+    # Simulation time before the checkpoint is not simulated again.
+
+    import pipeline
+    import runsimul
+
+    checkpoint_dir = Path(args.checkpoint_dir)
+    checkpoint = runsimul.load_checkpoint(checkpoint_dir)
+    datainfo = checkpoint['datainfo']
+
+    Vissim, BreakAt, Link_TT, node_nums, startup = pipeline.prepare(datainfo)
+
+    BreakAt = pipeline.add_interval_breakpoint(BreakAt, datainfo)
+    # Vissim keeps evaluations only from the snapshot on.
+    logger.warning("Link Segment and Node Results of a resumed run cover "
+                   + f"only the time after {checkpoint['sim_sec']} sec.")
+
+    with pipeline.make_aggregator(
+            datainfo,
+            Path().absolute()/f"partial_{datainfo['start_time']}.jsonl",
+            resume=True) as aggregator:
+        logger.info("Running simulation...")
+        run_no = pipeline.simulate(Vissim, datainfo, Signal, BreakAt,
+                                   aggregator, checkpoint_dir, checkpoint)
+
+        logger.info("Closing Vissim...")
+        Vissim = None
+
+        pipeline.finish(datainfo, aggregator, Link_TT, node_nums, startup,
+                        run_no)
+
+    return
+
+
+def replicate(args):
+    # Run replications with successive seeds until KPIs are precise enough.
+
+    import pipeline
+    import readinput
+    import replication
+
+    datainfo = dict()
+    datainfo['start_time'] = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    logger.info("Reading an input file...")
+    readinput.read_json(datainfo, Path(args.init))
+
+    Vissim, BreakAt, _Link_TT, _node_nums, _startup = pipeline.prepare(datainfo)
+    BreakAt = pipeline.add_interval_breakpoint(BreakAt, datainfo)
+
+    rule = replication.SequentialStopping(
+        datainfo['replication_kpis'],
+        precision=datainfo['replication_precision'],
+        confidence=datainfo['replication_confidence'],
+        min_runs=datainfo['replication_min_runs'],
+        max_runs=datainfo['replication_max_runs'],
+        wave_size=datainfo['replication_wave_size'])
+    seeds = replication.replication_seeds(
+        datainfo['random_seed'], datainfo['replication_seed_increment'],
+        rule.MaxRuns)
+
+    # Per-interval results of all runs, folded run by run.
+    grids = dict()
+
+    logger.info("Running replications...")
+    wave = rule.next_wave()
+    while wave:
+        if datainfo['replication_multirun']:
+            # A wave is one multi-run of Vissim.
+            results = pipeline.simulate_multirun(Vissim, datainfo, Signal,
+                                                 seeds[wave[0]], len(wave),
+                                                 grids=grids)
+            for index, result in zip(wave, results):
+                rule.push(dict(result, seed=seeds[index]))
+        else:
+            for index in wave:
+                result = pipeline.simulate_replication(Vissim, datainfo,
+                                                       Signal, BreakAt,
+                                                       seeds[index],
+                                                       grids=grids)
+                rule.push(dict(result, seed=seeds[index]))
+                if rule.should_stop():
+                    break
+        wave = rule.next_wave()
+
+    logger.info("Closing Vissim...")
+    Vissim = None
+
+    summary = rule.summary()
+    logger.info(f"{summary['runs']} runs"
+                + (" reached " if summary['converged'] else " did not reach ")
+                + f"±{rule.Precision:.0%} precision. "
+                + f"{summary['saved_runs']} of {rule.MaxRuns} runs saved.")
+    summary['per_interval'] = {
+        metric: grid.summary(rule.Confidence) for metric, grid in grids.items()}
+    with open(f"replication_{datainfo['start_time']}.json", 'w',
+              encoding='UTF8') as f:
+        json.dump(summary, f, indent=4)
+
+    # Accumulators can be merged with those of other replication sets.
+    with open(f"replication_{datainfo['start_time']}_state.json", 'w',
+              encoding='UTF8') as f:
+        json.dump({metric: grid.state() for metric, grid in grids.items()}, f)
+
+    return
+
+
+def sweep_offset(args):
+    # Try signal offsets given in init.json and rank them by the objective.
+    # Signal.xlsx is read only once; candidate plans are built in memory.
+
+    import manifest
+    import readinput
+    import setvissim
+    import sweep
+
+    datainfo = dict()
+    datainfo['start_time'] = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    logger.info("Reading an input file...")
+    readinput.read_json(datainfo, Path(args.init))
+    datainfo['random_seed'] = setvissim.set_randomseed(datainfo['random_seed'])
+    manifest.start(datainfo)
+
+    with manifest.step('read_input'):
+        readinput.read_input_xlsx(datainfo, Signal, VehicleInput,
+                                  Static_Vehicle_Routes)
+
+    logger.info("Running sweep...")
+    with manifest.step('sweep'):
+        results = sweep.run_sweep(datainfo, Signal, VehicleInput,
+                                  Static_Vehicle_Routes)
+
+    objective = datainfo['sweep_objective']
+    for rank, result in enumerate(results[:5], 1):
+        logger.info(f"{rank}. {result['offsets']}\t"
+                    + f"{objective} {result['kpis'][objective]:.3f}")
+    with open(f"sweep_{datainfo['start_time']}.json", 'w',
+              encoding='UTF8') as f:
+        json.dump(results, f, indent=4)
+
+    return
+
+
+def sweep_demand(args):
+    # Run the network at each demand level given in init.json.
+    # Vissim is configured once per worker; levels change only volumes.
+
+    import layout
+    import manifest
+    import readinput
+    import report
+    import setvissim
+    import sweep
+
+    datainfo = dict()
+    datainfo['start_time'] = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    logger.info("Reading an input file...")
+    readinput.read_json(datainfo, Path(args.init))
+    datainfo['random_seed'] = setvissim.set_randomseed(datainfo['random_seed'])
+    manifest.start(datainfo)
+
+    with manifest.step('read_input'):
+        readinput.read_input_xlsx(datainfo, Signal, VehicleInput,
+                                  Static_Vehicle_Routes)
+
+    logger.info("Running demand sweep...")
+    with manifest.step('demand_sweep'):
+        results = sweep.run_demand_sweep(datainfo, Signal, VehicleInput,
+                                         Static_Vehicle_Routes)
+
+    with open(f"demand_{datainfo['start_time']}.json", 'w',
+              encoding='UTF8') as f:
+        json.dump(results, f, indent=4)
+
+    sheet = layout.Sheet()
+    report.print_simul_info(sheet, datainfo)
+    report.print_demand_curves(sheet, results)
+    sheet.AutoFit.add(2)
+    layout.render_csv(sheet, f"demand_{datainfo['start_time']}.csv")
+
+    return
+
+
+def compare_run(args):
+    # Compare alternatives with a base case from the results database.
+
+    import compare
+    import resultdb
+
+    start_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    file = Path(args.db).absolute()
+
+    with resultdb.opened(file) as conn:
+        base_ids = compare.resolve_runs(conn, args.base)
+        alternatives = [(spec, compare.resolve_runs(conn, spec))
+                        for spec in args.alternative]
+        rows = compare.compare_runs(conn, base_ids, alternatives,
+                                    args.confidence)
+
+    for name, alt_ids in alternatives:
+        significant = sum(1 for item in rows
+                          if item[0] == name and item[-1])
+        logger.info(f"{name} ({len(alt_ids)} runs) vs {args.base} "
+                    + f"({len(base_ids)} runs): {significant} significant "
+                    + "differences.")
+    compare.write_csv(f"compare_{start_time}.csv", rows)
+
+    return
+
+
+def check_signal(args):
+    # Validate compiled signal programs against signals set at breaks.
+
+    import pipeline
+    import readinput
+
+    datainfo = dict()
+    datainfo['start_time'] = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    logger.info("Reading an input file...")
+    readinput.read_json(datainfo, Path(args.init))
+
+    result = pipeline.compare_signal_modes(datainfo)
+
+    for mode in ('breakpoint', 'native', 'multirun'):
+        logger.info(f"{mode}:\t{result[mode]['wall_time']:.1f} sec, "
+                    + f"{result[mode]['breaks']} breaks")
+    for kpi, difference in result['difference'].items():
+        logger.info(f"{kpi}:\t{result['breakpoint']['kpis'][kpi]:.3f} -> "
+                    + f"{result['native']['kpis'][kpi]:.3f}"
+                    + ("" if difference is None else f" ({difference:+.2%})"))
+    logger.info(f"Native signals ran {result['speedup']:.1f} times as fast.")
+    for kpi, difference in result['multirun_difference'].items():
+        if difference:
+            logger.error(f"{kpi}:\tMulti-run differs from the native run by "
+                         + f"{difference:+.2%} with the same seed.")
+
+    with open(f"signal_modes_{datainfo['start_time']}.json", 'w',
+              encoding='UTF8') as f:
+        json.dump(result, f, indent=4)
+
+    return
+
+
+def main(argv=None):
+    init_json = str(runtime.RESOURCES/"init.json")
+
+    parser = argparse.ArgumentParser(description="Vissim simulator")
+    parser.set_defaults(func=run, init=init_json)
+    trace = parser.add_mutually_exclusive_group()
+    trace.add_argument('--record', metavar='TRACE_DIR',
+                       help="Record all COM calls and result files.")
+    trace.add_argument('--replay', metavar='TRACE_DIR',
+                       help="Replay a recorded run without any COM server.")
+    subparsers = parser.add_subparsers()
+
+    parser_run = subparsers.add_parser('run', help="Run a new simulation.")
+    parser_run.add_argument('--init', default=init_json,
+                            help="Path of init.json.")
+    parser_run.set_defaults(func=run)
+
+    parser_session = subparsers.add_parser(
+        'session', help="Keep Vissim open and run again on input changes.")
+    parser_session.add_argument('--init', default=init_json,
+                                help="Path of init.json.")
+    parser_session.set_defaults(func=session)
+
+    parser_resume = subparsers.add_parser(
+        'resume', help="Resume a run from its latest checkpoint.")
+    parser_resume.add_argument('checkpoint_dir',
+                               help="Directory of checkpoints of the run.")
+    parser_resume.set_defaults(func=resume)
+
+    parser_replicate = subparsers.add_parser(
+        'replicate', help="Run replications until KPIs are precise enough.")
+    parser_replicate.add_argument('--init', default=init_json,
+                                  help="Path of init.json.")
+    parser_replicate.set_defaults(func=replicate)
+
+    parser_sweep = subparsers.add_parser(
+        'sweep', help="Rank signal offsets on a pool of Vissim workers.")
+    parser_sweep.add_argument('--init', default=init_json,
+                              help="Path of init.json.")
+    parser_sweep.set_defaults(func=sweep_offset)
+
+    parser_demand = subparsers.add_parser(
+        'demand', help="Run the network at scaled demand levels.")
+    parser_demand.add_argument('--init', default=init_json,
+                               help="Path of init.json.")
+    parser_demand.set_defaults(func=sweep_demand)
+
+    parser_compare = subparsers.add_parser(
+        'compare', help="Compare runs stored in the results database.")
+    parser_compare.add_argument(
+        'base', help="runs:<ids> (ex. runs:3,4,5), scenario:<name> or "
+        + "start:<start time of a replication set>. Without a prefix, a "
+        + "scenario, else a start time.")
+    parser_compare.add_argument('alternative', nargs='+',
+                                help="Runs to compare, given as 'base'.")
+    parser_compare.add_argument('--db', default="results.sqlite",
+                                help="Path of the results database.")
+    parser_compare.add_argument('--confidence', type=float, default=0.95,
+                                help="Confidence of significance flags.")
+    parser_compare.set_defaults(func=compare_run)
+
+    parser_signal = subparsers.add_parser(
+        'check-signal',
+        help="Compare compiled signal programs with signals set at breaks.")
+    parser_signal.add_argument('--init', default=init_json,
+                               help="Path of init.json.")
+    parser_signal.set_defaults(func=check_signal)
+
+    args = parser.parse_args(argv)
+    # Sweep workers dispatch Vissim in processes of their own, whose COM
+    # calls would be neither recorded nor replayed.
+    if (args.record or args.replay) and args.func in (sweep_offset,
+                                                      sweep_demand):
+        parser.error("--record and --replay do not cover the Vissim "
+                     + "workers of 'sweep' and 'demand'. Record a single "
+                     + "run instead.")
+
+    runtime.init()
+    if args.record or args.replay:
+        runtime.start_trace(args.record or args.replay,
+                            replay=bool(args.replay))
+    try:
+        args.func(args)
+    finally:
+        # Commands import what they need, so only modules a command used
+        # have anything to stop.
+        for name in ('telemetry', 'manifest'):
+            if name in sys.modules:
+                sys.modules[name].stop()
+        runtime.stop_trace()
+
+    return
+
+
+if __name__ == "__main__":
+    main()
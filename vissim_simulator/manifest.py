@@ -0,0 +1,267 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Manifest of the current run. Set by start().
+_active = None
+
+# Names of the stages open in each thread.
+_local = threading.local()
+
+
+def _rss():
+    # Output
+    # > (float or None, float). Current and peak resident set size of this
+    #   process [MB]. Current is None where the platform does not tell.
+
+    try:
+        import resource
+    except ImportError:     # Windows
+        import ctypes
+        from ctypes import wintypes
+
+        class _Counters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD),
+                        ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t),
+                        ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t),
+                        ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = _Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(),
+            ctypes.byref(counters), counters.cb)
+        return (counters.WorkingSetSize / 2**20,
+                counters.PeakWorkingSetSize / 2**20)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere.
+    peak /= 2**20 if sys.platform == 'darwin' else 2**10
+
+    current = None
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            current = int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return current, peak
+
+
+def _revision():
+    # Output
+    # > str or None. Git commit of this source tree.
+
+    import subprocess
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=Path(__file__).resolve().parent,
+                              capture_output=True, text=True, timeout=5,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Manifest:
+    def __init__(self, file, top=5):
+        # Input
+        # > 'file'  : Path of the manifest JSON.
+        # > 'top'   : int. The number of allocations kept per stage.
+        #             0 leaves tracemalloc off.
+        #
+        # Wall time, CPU time, RSS and top allocations of every stage of a
+        # run, with sizes of its inputs. 'peak_rss_mb' is the high-water
+        # mark of the process so far; 'rss_mb' and 'rss_delta_mb' are the
+        # RSS at the end of the stage and its change over the stage.
+
+        self.File = Path(file)
+        self.Pid = os.getpid()
+        self.Top = top
+        self.Start = (time.perf_counter(), time.process_time())
+        self.Inputs = dict()
+        self.Stages = []        # 1D list of dict, in order of start.
+        self.Lock = threading.Lock()
+        self.Tracing = False    # Whether tracemalloc was started here.
+
+        if self.Top:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.Tracing = True
+
+    def _snapshot(self):
+        if not self.Top:
+            return None
+
+        import tracemalloc
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),
+             tracemalloc.Filter(False, __file__),
+             tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")))
+
+    def _allocations(self, before):
+        # Input
+        # > 'before' : Snapshot at start of the stage.
+        #
+        # Output
+        # > 1D list of dict. Lines which allocated the most during the
+        #   stage and still hold it.
+
+        if before is None:
+            return []
+
+        stats = self._snapshot().compare_to(before, 'lineno')
+        stats = sorted((stat for stat in stats if stat.size_diff > 0),
+                       key=lambda stat: stat.size_diff, reverse=True)
+        return [{'where': f"{stat.traceback[0].filename}:"
+                          + f"{stat.traceback[0].lineno}",
+                 'size_kb': round(stat.size_diff / 1024, 1),
+                 'count': stat.count_diff}
+                for stat in stats[:self.Top]]
+
+    @contextlib.contextmanager
+    def step(self, name):
+        stack = _local.__dict__.setdefault('stack', [])
+        stack.append(name)
+        entry = {'stage': '/'.join(stack), 'depth': len(stack) - 1}
+        with self.Lock:
+            self.Stages.append(entry)
+
+        before = self._snapshot()
+        rss, _ = _rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield entry['stage']
+        finally:
+            # CPU time is of the process, so stages of other threads
+            # running at the same time are counted as well.
+            entry['wall_sec'] = round(time.perf_counter() - wall, 3)
+            entry['cpu_sec'] = round(time.process_time() - cpu, 3)
+            current, peak = _rss()
+            if current is not None:
+                entry['rss_mb'] = round(current, 1)
+                if rss is not None:
+                    entry['rss_delta_mb'] = round(current - rss, 1)
+            entry['peak_rss_mb'] = round(peak, 1)
+            entry['allocations'] = self._allocations(before)
+            stack.pop()
+
+    def write(self):
+        import platform
+
+        wall, cpu = self.Start
+        current, peak = _rss()
+        content = {'file': self.File.name,
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'revision': _revision(),
+                   'inputs': self.Inputs,
+                   'total': {'wall_sec': round(time.perf_counter() - wall, 3),
+                             'cpu_sec': round(time.process_time() - cpu, 3),
+                             'rss_mb': (round(current, 1)
+                                        if current is not None else None),
+                             'peak_rss_mb': round(peak, 1)},
+                   'stages': self.Stages}
+
+        with self.File.open('w', encoding='UTF8') as f:
+            json.dump(content, f, indent=2)
+
+        return
+
+    def close(self):
+        if self.Tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self.Tracing = False
+
+        return
+
+
+def start(datainfo, worker=None):
+    # Input
+    # > 'datainfo'  : dict.
+    # > 'worker'    : str or None. Name of a worker process, which writes a
+    #                 manifest of its own, ex) 'sweep'.
+    #
+    # Start the manifest of a new run. The manifest of the previous run of
+    # this process is written first.
+
+    global _active
+    if _active is not None and _active.Pid != os.getpid():
+        # Stages of the parent are not open in a forked worker.
+        _local.__dict__.pop('stack', None)
+    stop()
+    name = f"manifest_{datainfo['start_time']}"
+    if worker is not None:
+        name += f"_{worker}_{os.getpid()}"
+    _active = Manifest(Path().absolute()/f"{name}.json",
+                       datainfo.get('manifest_allocations', 5))
+
+    return
+
+
+def flush():
+    # Write the manifest of the current run so far. Pool workers are
+    # terminated rather than stopped, so they flush after each task.
+
+    if _active is not None and _active.Pid == os.getpid():
+        _active.write()
+
+    return
+
+
+def stop():
+    # Write the manifest of the current run, if any. A manifest inherited
+    # from the parent by a forked worker is dropped without writing.
+
+    global _active
+    if _active is not None and _active.Pid == os.getpid():
+        _active.write()
+        _active.close()
+        logger.info(f"Manifest in {_active.File}.")
+    _active = None
+
+    return
+
+
+@contextlib.contextmanager
+def step(name):
+    # Measure stage 'name' of the current run. Stages opened inside are
+    # named '<name>/<inner name>'.
+    #
+    # Output
+    # > str. Name of the stage with names of outer stages.
+
+    if _active is None:
+        yield name
+        return
+
+    with _active.step(name) as path:
+        yield path
+
+
+def inputs(**sizes):
+    # Input
+    # > 'sizes' : int. ex) controllers=3, breakpoints=480
+
+    if _active is not None:
+        _active.Inputs.update(sizes)
+
+    return
@@ -0,0 +1,81 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+from array import array
+
+
+class NetworkIndex:
+    def __init__(self, lanes_with_SH, node_nums=(), Link_TT=()):
+        # Input
+        # > 'lanes_with_SH' : 1D list of (int, int, double, double), sorted.
+        # > 'node_nums'     : 1D list of int.
+        # > 'Link_TT'       : 1D list of (str, str).
+        #
+        # Columns of every result kind, built once per network so that cal.py
+        # and report.py look elements up instead of scanning lists.
+        #
+        # Lane columns follow 'lanes_with_SH'. A lane with several signal heads
+        # has one column per signal head. Link columns follow the first
+        # appearance of each link in 'lanes_with_SH'.
+
+        self.Lanes = list(lanes_with_SH)
+        self.Nodes = list(node_nums)
+        self.Sections = list(Link_TT)
+
+        self.Links = []             # 1D list of int(LinkNo).
+        self.LinkRanges = []        # 1D list of (first, last + 1) lane column.
+        self.LinkColumn = dict()    # {int(LinkNo): int(link column)}
+        self.LaneColumns = dict()   # {(int(LinkNo), int(LaneNo)):
+        #                               1D list of int(lane column)}
+        self.LinkOfLane = array('l')    # Lane column -> link column.
+        self.Lengths = array('d')       # Lane column -> length of link.
+
+        for col, (linkNo, laneNo, _, length) in enumerate(self.Lanes):
+            if linkNo not in self.LinkColumn:
+                self.LinkColumn[linkNo] = len(self.Links)
+                self.Links.append(linkNo)
+                self.LinkRanges.append([col, col])
+            link_col = self.LinkColumn[linkNo]
+            self.LinkRanges[link_col][1] = col + 1
+            self.LaneColumns.setdefault((linkNo, laneNo), []).append(col)
+            self.LinkOfLane.append(link_col)
+            self.Lengths.append(length)
+        self.LinkRanges = [tuple(link_range) for link_range in self.LinkRanges]
+
+        self.NodeColumn = {nodeNo: col for col, nodeNo in enumerate(self.Nodes)}
+        self.SectionColumn = {section: col
+                              for col, section in enumerate(self.Sections)}
+
+        # Result att files name links as str.
+        self.LinkNames = {str(linkNo): col
+                          for linkNo, col in self.LinkColumn.items()}
+
+        # 1D list of (int(LinkNo), int(NumSH)).
+        self.SH_per_link = [(linkNo, last - first) for linkNo, (first, last)
+                            in zip(self.Links, self.LinkRanges)]
+
+    def link_columns(self, start_col=3):
+        # Input
+        # > 'start_col' : int. Column of the first lane.
+        #
+        # Output
+        # > 1D list of (int(from_col), int(to_col)).
+        #
+        # A link spans one column per signal head.
+
+        return [(start_col + first, start_col + last - 1)
+                for first, last in self.LinkRanges]
+
+    def element_names(self):
+        # Output
+        # > dict of {str(kind): 1D list of str(name)}.
+        #
+        # Names of result columns outside Excel. A lane may have several signal
+        # heads, so the position of the signal head is part of the lane name.
+
+        return {'lane': [f"{linkNo}-{laneNo}@{pos:.1f}"
+                         for linkNo, laneNo, pos, *_ in self.Lanes],
+                'link': [str(linkNo) for linkNo in self.Links],
+                'section': [f'{start} to {end}'
+                            for start, end in self.Sections],
+                'node': [str(nodeNo) for nodeNo in self.Nodes]}
@@ -0,0 +1,924 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import bisect
+import contextlib
+import hashlib
+import json
+import logging
+import multiprocessing
+import threading
+import time
+from pathlib import Path
+
+import aggregate
+import cal
+import layout
+import livekpi
+import manifest
+from network import NetworkIndex
+import readinput
+import report
+import resultdb
+import runsimul
+import runtime
+import setvissim
+import sigfile
+import stats
+import telemetry
+from variable import *
+
+logger = logging.getLogger(__name__)
+
+# Setup stages of set_vissim() in order of application.
+SETUP_STAGES = ('evaluation', 'link_segment', 'queue_counter',
+                'data_collection', 'vehicle_input', 'static_routes')
+
+
+def prepare(datainfo, live=None):
+    # Input
+    # > 'datainfo' : dict.
+    # > 'live'     : dict or None. See set_vissim(). Vissim of an earlier
+    #                call with the same 'live' is used again.
+    #
+    # Output
+    # > 'Vissim'    : CDispatch. Configured Vissim.
+    # > 'BreakAt'   : 1D-list of int.
+    # > 'Link_TT'   : 1D list of (str, str).
+    # > 'node_nums' : 1D list of int.
+    # > 'startup'   : float. time.perf_counter() at start.
+    #
+    # 1. Read Excel and 2. Set Vissim.
+
+    startup = time.perf_counter()
+    manifest.start(datainfo)
+    telemetry.start(datainfo)
+
+    def _read_input():
+        with telemetry.stage('read_input'):
+            readinput.read_input_xlsx(datainfo, Signal, VehicleInput,
+                                      Static_Vehicle_Routes)
+
+    # Input workbooks are read in another thread while Vissim loads the
+    # network, since neither depends on the other.
+    reader = threading.Thread(target=_read_input, name="read_input_xlsx")
+    if datainfo['overlapped_startup']:
+        reader.start()
+    else:
+        reader.run()
+
+    if live is not None and 'Vissim' in live:
+        Vissim = live['Vissim']
+    else:
+        with telemetry.stage('load_vissim'):
+            Vissim = load_vissim(datainfo)
+        if live is not None:
+            live['Vissim'] = Vissim
+
+    if datainfo['overlapped_startup']:
+        reader.join()
+
+    BreakAt = plan_signal(Signal, datainfo['simulation_time'])
+
+    # 2. Set Vissim
+    datainfo['random_seed'] = setvissim.set_randomseed(datainfo['random_seed'])
+
+    with telemetry.stage('set_vissim'):
+        Link_TT, node_nums = set_vissim(Vissim, datainfo, VehicleInput,
+                                        Static_Vehicle_Routes, live)
+
+    if datainfo.get('signal_mode') == 'native':
+        BreakAt = use_native_signal(Vissim, datainfo, Signal)
+
+    manifest.inputs(controllers=len(Signal),
+                    vehicle_inputs=len(VehicleInput),
+                    lanes=len(lanes_with_SH), nodes=len(node_nums),
+                    sections=len(Link_TT),
+                    simulation_sec=datainfo['simulation_time'])
+
+    return Vissim, BreakAt, Link_TT, node_nums, startup
+
+
+def load_vissim(datainfo):
+    # Input
+    # > 'datainfo' : dict.
+    #
+    # Output
+    # > 'Vissim' : CDispatch.
+
+    # Connecting the COM Server => Open a new Vissim Window:
+    logger.info("Setting Vissim...")
+    Vissim = runtime.dispatch("Vissim.Vissim")
+
+    # Load a Vissim Network:
+    Vissim.LoadNet(datainfo['vissim_inpx'])
+
+    return Vissim
+
+
+def plan_signal(Signal, simulation_len, offsets=None):
+    # Input
+    # > 'Signal'            : 1D-list of SigControl() as read from Excel.
+    # > 'simulation_len'    : simulation period in seconds.
+    # > 'offsets'           : dict of {str(Name): int(offset)} or None.
+    #
+    # Output
+    # > 'BreakAt' : 1D-list of int.
+    #
+    # Turn 'Signal' into a signal plan which set_signal() can apply.
+    # 'offsets' replace offsets read from sheet 1 of Signal.xlsx.
+
+    if offsets:
+        for sigcon in Signal:
+            if sigcon.Name in offsets:
+                sigcon.offset_info = (offsets[sigcon.Name],
+                                      sigcon.offset_info[1])
+
+    readinput.rearrange_Signal(Signal)
+    BreakAt = readinput.calculate_breakpoint(Signal, simulation_len)
+    setvissim.convert_signal_to_enum(Signal)
+
+    return BreakAt
+
+
+def use_native_signal(Vissim, datainfo, Signal):
+    # Input
+    # > 'Vissim'    : CDispatch. Configured Vissim.
+    # > 'datainfo'  : dict.
+    # > 'Signal'    : 1D-list of SigControl() planned by plan_signal().
+    #
+    # Output
+    # > 'BreakAt' : Empty list. No break is needed for signals any more.
+    #
+    # Compile the signal plan into fixed time controller files and let
+    # Vissim run them, instead of setting signals through COM at each break.
+
+    sig_files = sigfile.write_sig_files(
+        Signal, datainfo['simulation_time'],
+        Path().absolute()/f"sig_{datainfo['start_time']}")
+    sigfile.attach_sig_files(Vissim, sig_files)
+
+    # runsimul.set_signal() finds nothing to set from now on.
+    for sigcon in Signal:
+        sigcon.BreakAt = []
+
+    return []
+
+
+def fingerprint(content):
+    # Input
+    # > 'content' : JSON serializable.
+    #
+    # Output
+    # > str. sha1 of 'content'.
+
+    return hashlib.sha1(json.dumps(content, sort_keys=True,
+                                   default=str).encode()).hexdigest()
+
+
+def stage_fingerprints(datainfo, VehicleInput, Static_Vehicle_Routes):
+    # Input
+    # > 'datainfo', 'VehicleInput', 'Static_Vehicle_Routes' : See
+    #   set_vissim().
+    #
+    # Output
+    # > dict of {str(stage of SETUP_STAGES): str}.
+    #
+    # Fingerprint of everything each setup stage reads. 'lanes_with_SH'
+    # should be found already.
+
+    network = datainfo['vissim_inpx']
+    lanes = fingerprint(lanes_with_SH)
+    # The seed is left out: set_vissim() sets it for every run, since a
+    # resolved -1 differs each time.
+    settings = {key: datainfo.get(key)
+                for key in ('evaluation_interval', 'warmup_time',
+                            'simulation_time', 'quick_mode')}
+
+    return {'evaluation': fingerprint([network, settings]),
+            'link_segment': fingerprint([network]),
+            'queue_counter': fingerprint([network, lanes]),
+            'data_collection': fingerprint([network, lanes]),
+            'vehicle_input': fingerprint(
+                [network, datainfo['simulation_time'],
+                 datainfo['vehicle_input_period'],
+                 [(vehinput.TimeInt, vehinput.VehInfo)
+                  for vehinput in VehicleInput]]),
+            'static_routes': fingerprint([network, Static_Vehicle_Routes])}
+
+
+def set_vissim(Vissim, datainfo, VehicleInput, Static_Vehicle_Routes,
+               live=None):
+    # Input
+    # > 'Vissim'                : CDispatch. Vissim with a loaded network.
+    # > 'datainfo'              : dict.
+    # > 'VehicleInput'          : 1D-list of VehInput().
+    # > 'Static_Vehicle_Routes' : list returned by read_static_vehicle_routes.
+    # > 'live'                  : dict or None. State of 'Vissim' left by an
+    #                             earlier call, updated in place. Stages
+    #                             whose fingerprints did not change are not
+    #                             applied again. None applies all stages.
+    #
+    # Output
+    # > 'Link_TT'   : 1D list of (str, str).
+    # > 'node_nums' : 1D list of int.
+    #
+    # 2. Set Vissim, except signals.
+
+    if live is None:
+        live = dict()
+
+    if live.get('network') != datainfo['vissim_inpx']:
+        if 'network' in live:
+            logger.info("Network changed. Loading the network...")
+            Vissim.LoadNet(datainfo['vissim_inpx'])
+
+        setvissim.check_sig_file(Vissim)
+
+        live['Link_TT'] = setvissim.get_travtm_info(Vissim)
+        live['node_nums'] = setvissim.get_all_node(Vissim)
+        lanes_with_SH.clear()
+        setvissim.find_incoming_lane(Vissim, lanes_with_SH)
+
+        live['network'] = datainfo['vissim_inpx']
+        live['stages'] = dict()     # {str(stage): str(fingerprint)}
+        live['durations'] = dict()  # {str(stage): float(sec)}
+
+    fingerprints = stage_fingerprints(datainfo, VehicleInput,
+                                      Static_Vehicle_Routes)
+    applied = live['stages']
+
+    if applied.get('vehicle_input', fingerprints['vehicle_input']) \
+            != fingerprints['vehicle_input']:
+        # Models, vehicle types and compositions cannot be added twice.
+        logger.info("Vehicle inputs changed. Loading the network again...")
+        Vissim.LoadNet(datainfo['vissim_inpx'])
+        durations = live['durations']
+        del live['network']
+        Link_TT, node_nums = set_vissim(Vissim, datainfo, VehicleInput,
+                                        Static_Vehicle_Routes, live)
+        live['durations'] = dict(durations, **live['durations'])
+        return Link_TT, node_nums
+
+    stages = {
+        'evaluation': lambda: setvissim.set_Vissim(Vissim, datainfo),
+        'link_segment': lambda: setvissim.set_link_segment(Vissim),
+        'queue_counter': lambda: setvissim.set_queue_counter(Vissim,
+                                                             lanes_with_SH),
+        'data_collection': lambda: setvissim.set_data_collection(
+            Vissim, lanes_with_SH),
+        'vehicle_input': lambda: setvissim.set_vehicleinput(Vissim, datainfo,
+                                                            VehicleInput),
+        'static_routes': lambda: setvissim.set_static_vehicle_route(
+            Vissim, Static_Vehicle_Routes)}
+
+    skipped = []
+    for stage in SETUP_STAGES:
+        if applied.get(stage) == fingerprints[stage]:
+            skipped.append(stage)
+            continue
+
+        start = time.perf_counter()
+        with telemetry.stage(stage):
+            stages[stage]()
+        live['durations'][stage] = time.perf_counter() - start
+        applied[stage] = fingerprints[stage]
+
+    if skipped:
+        saved = sum(live['durations'].get(stage, 0) for stage in skipped)
+        logger.info(f"set_vissim():\tSkipped unchanged {', '.join(skipped)} "
+                    + f"(about {saved:.1f} sec saved).")
+    Vissim.Simulation.SetAttValue('RandSeed', datainfo['random_seed'])
+
+    return live['Link_TT'], live['node_nums']
+
+
+def clear_lists():
+    # Empty lists of variable.py filled by a run, so that the next run in
+    # this process starts from scratch. 'lanes_with_SH' belongs to the
+    # network and is kept.
+
+    for list_ in (Signal, VehicleInput, Static_Vehicle_Routes, VehNum_hour,
+                  OccupRate_hour, OccupRate_overall, Density_overall,
+                  QStop_hour, QStop_overall, DelayRel_overall, AvgSpeed_hour,
+                  AvgSpeed_overall, LOS_hour, EmissionCO, EmissionVOC,
+                  EmissionCO_hour, EmissionVOC_hour):
+        list_.clear()
+
+    return
+
+
+def discard_runs(Vissim):
+    # Remove all simulation runs whose results have been read.
+    #
+    # Evaluations keep results of previous runs (KeepPrevResults), which a
+    # multi-run needs until all of its runs are read. Removing them
+    # afterwards keeps memory of a long-lived Vissim flat across runs.
+
+    Runs = Vissim.Net.SimulationRuns
+    for run in Runs.GetAll():
+        Runs.RemoveSimulationRun(run)
+
+    return
+
+
+def result_att(datainfo, result_name, run_no=1):
+    # Input
+    # > 'datainfo'      : dict.
+    # > 'result_name'   : str. ex) 'Link Segment Results', 'Node Results'
+    # > 'run_no'        : int. Number of simulation run.
+    #
+    # Output
+    # > str. Path of result att file written by Vissim.
+
+    network_filename, _extention = datainfo['vissim_inpx'].split('.')
+    return runtime.com_file(
+        f'{network_filename}_{result_name}_{run_no:03d}.att')
+
+
+def parse_pool(datainfo):
+    # Input
+    # > 'datainfo' : dict.
+    #
+    # Output
+    # > Context manager of multiprocessing.Pool() for parsing result att
+    #   files, or of None to parse them in this process.
+
+    workers = datainfo.get('parse_workers', 0)
+    if workers:
+        return multiprocessing.Pool(workers)
+    return contextlib.nullcontext()
+
+
+def make_aggregator(datainfo, partial_file=None, resume=False):
+    # Input
+    # > 'datainfo'  : dict.
+    # > Others      : See IntervalAggregator().
+    #
+    # Output
+    # > IntervalAggregator(). Its intervals start after warm-up.
+
+    return aggregate.IntervalAggregator(
+        datainfo['evaluation_interval'], datainfo['simulation_time'],
+        partial_file, resume, start=datainfo['warmup_time'])
+
+
+def add_interval_breakpoint(BreakAt, datainfo):
+    # Input
+    # > 'BreakAt'   : 1D-list of int.
+    # > 'datainfo'  : dict.
+    #
+    # Output
+    # > 1D-list of int.
+    #
+    # Stop at every boundary of evaluation intervals as well, so that each
+    # interval is extracted as soon as it is completed.
+
+    interval = datainfo['evaluation_interval']
+    return sorted(set(BreakAt)
+                  | set(range(datainfo['warmup_time'] + interval,
+                              datainfo['simulation_time'], interval)))
+
+
+def is_checkpoint(break_at, datainfo):
+    # Input
+    # > 'break_at'  : int. Simulation second of a break.
+    # > 'datainfo'  : dict.
+    #
+    # Output
+    # > bool. Whether a checkpoint is saved at 'break_at'.
+    #
+    # Checkpoints are counted from the end of warm-up, like evaluation
+    # intervals, so that each falls on an interval boundary which
+    # add_interval_breakpoint() stops at.
+
+    period = datainfo['checkpoint_period']
+    since = break_at - datainfo['warmup_time']
+    return bool(period) and since > 0 and since % period == 0
+
+
+def warmup_snapshot(Vissim, datainfo, Signal, BreakAt, directory):
+    # Input
+    # > 'Vissim'    : CDispatch. Configured Vissim.
+    # > 'datainfo'  : dict.
+    # > 'Signal'    : 1D-list of SigControl(). Signal plan used for warm-up.
+    # > 'BreakAt'   : 1D-list of int.
+    # > 'directory' : <class 'pathlib.Path'>.
+    #
+    # Output
+    # > str. Path of the snapshot at the end of warm-up.
+    #
+    # Warm-up is simulated only once per input contents, seed, evaluation
+    # settings and signal plan before the end of warm-up. Later calls with
+    # the same ones return the saved snapshot.
+
+    warmup = datainfo['warmup_time']
+    content = [resultdb.hash_inputs(datainfo), datainfo['random_seed'],
+               warmup, datainfo['evaluation_interval'],
+               datainfo['simulation_time'],
+               [break_at for break_at in BreakAt if break_at < warmup],
+               [(sigcon.Name, sigcon.SigInd,
+                 [int(sec) for sec in sigcon.BreakAt if sec < warmup])
+                for sigcon in Signal]]
+    key = hashlib.sha1(json.dumps(content).encode()).hexdigest()
+    snapshot = Path(directory)/f'warmup_{key[:16]}.snp'
+    if snapshot.exists():
+        return str(snapshot)
+
+    logger.info(f"Simulating {warmup} sec of warm-up...")
+    Vissim.Simulation.SetAttValue('RandSeed', datainfo['random_seed'])
+    runsimul.set_signal(Vissim, Signal, 0)
+    for break_at in BreakAt:
+        if break_at >= warmup:
+            break
+        Vissim.Simulation.SetAttValue('SimBreakAt', break_at)
+        Vissim.Simulation.RunContinuous()
+        runsimul.set_signal(Vissim, Signal, break_at)
+    Vissim.Simulation.SetAttValue('SimBreakAt', warmup)
+    Vissim.Simulation.RunContinuous()
+
+    Vissim.Simulation.SaveSnapshot(str(snapshot))
+    Vissim.Simulation.Stop()
+
+    return str(snapshot)
+
+
+def warmup_checkpoint(Signal, BreakAt, snapshot, warmup):
+    # Input
+    # > 'Signal'    : 1D-list of SigControl(). Signal plan of a candidate.
+    # > 'BreakAt'   : 1D-list of int.
+    # > 'snapshot'  : str. Return value of warmup_snapshot().
+    # > 'warmup'    : int. Warm-up period [sec].
+    #
+    # Output
+    # > dict. Same form as runsimul.load_checkpoint(), so that simulate()
+    #   continues from the snapshot with signals of 'Signal'.
+
+    applied = dict()
+    for sigcon in Signal:
+        index = bisect.bisect_right(sigcon.BreakAt, warmup) - 1
+        applied[sigcon.Name] = index % len(sigcon.SigInd)
+
+    return {'sim_sec': warmup,
+            'break_index': bisect.bisect_right(BreakAt, warmup) - 1,
+            'snapshot': snapshot,
+            'applied': applied,
+            'aggregator': None}
+
+
+def simulate(Vissim, datainfo, Signal, BreakAt, aggregator, checkpoint_dir,
+             checkpoint=None):
+    # Input
+    # > 'Vissim'            : CDispatch. Configured Vissim.
+    # > 'datainfo'          : dict.
+    # > 'Signal'            : 1D-list of SigControl(). Signal plan.
+    # > 'BreakAt'           : 1D-list of int.
+    # > 'aggregator'        : IntervalAggregator().
+    # > 'checkpoint_dir'    : <class 'pathlib.Path'>.
+    # > 'checkpoint'        : dict returned by runsimul.load_checkpoint() or
+    #                         None.
+    #
+    # Output
+    # > 'run_no' : int. No of the simulation run just finished.
+    #
+    # 3. Run Simulation, from 'checkpoint' if given.
+
+    sampler = None
+    if datainfo.get('live_stride'):
+        sampler = livekpi.LiveSampler(
+            Path().absolute()/f"live_{datainfo['start_time']}.csv",
+            datainfo['live_stride'], datainfo['live_buffer'])
+
+    if checkpoint is None:
+        first = 0
+        runsimul.set_signal(Vissim, Signal, 0)
+    else:
+        first = checkpoint['break_index'] + 1
+        Vissim.Simulation.LoadSnapshot(checkpoint['snapshot'])
+        runsimul.restore_signal(Vissim, Signal, checkpoint['applied'])
+        if checkpoint['aggregator'] is not None:
+            aggregator.restore(checkpoint['aggregator'])
+        if sampler is not None and checkpoint.get('sampler'):
+            sampler.restore(checkpoint['sampler'])
+        logger.info(f"Continued from snapshot at {checkpoint['sim_sec']} sec.")
+
+    manifest.inputs(breakpoints=len(BreakAt))
+    telemetry.simulation(BreakAt[first - 1] if first else 0,
+                         datainfo['simulation_time'])
+    try:
+        with telemetry.stage('simulate'):
+            for index in range(first, len(BreakAt)):
+                break_at = BreakAt[index]
+                Vissim.Simulation.SetAttValue('SimBreakAt', break_at)   # Set break_at
+                Vissim.Simulation.RunContinuous()   # Run simulation until 'break_at'
+                runsimul.extract_completed_intervals(Vissim, break_at,
+                                                     aggregator)
+                if sampler is not None:
+                    sampler.at_break(Vissim, break_at)
+                runsimul.set_signal(Vissim, Signal, break_at)   # Set signal
+                if is_checkpoint(break_at, datainfo):
+                    runsimul.save_checkpoint(Vissim, checkpoint_dir, index,
+                                             Signal, aggregator, datainfo,
+                                             sampler)
+                telemetry.progress(break_at)
+            Vissim.Simulation.RunContinuous()
+            runsimul.extract_completed_intervals(
+                Vissim, datainfo['simulation_time'], aggregator)
+            telemetry.progress(datainfo['simulation_time'], force=True)
+    finally:
+        # Samples buffered when the simulation fails are written as well.
+        if sampler is not None:
+            sampler.close()
+
+    # Vissim keeps results of earlier runs of a session, so the last
+    # simulation run is the one just finished.
+    return Vissim.Net.SimulationRuns.GetMultiAttValues('No')[-1][1]
+
+
+def finish(datainfo, aggregator, Link_TT, node_nums, startup=None, run_no=1):
+    # Input
+    # > 'datainfo'      : dict.
+    # > 'aggregator'    : IntervalAggregator() with all intervals pushed.
+    # > 'Link_TT'       : 1D list of (str, str).
+    # > 'node_nums'     : 1D list of int.
+    # > 'startup'       : float or None. time.perf_counter() at start.
+    # > 'run_no'        : int. No of the simulation run, returned by
+    #                     simulate().
+    #
+    # 4. Calculate overall data and 5. Report.
+
+    interval = datainfo['evaluation_interval']
+    aggregator.finish(OccupRate_overall, QStop_overall,
+                      (VehNum_hour, OccupRate_hour, QStop_hour, AvgSpeed_hour))
+    num_intervals = aggregator.NumIntervals
+    manifest.inputs(intervals=num_intervals)
+
+    # 4. Calculate overall data
+    logger.info("Calculating...")
+    network = NetworkIndex(lanes_with_SH, node_nums, Link_TT)
+    manifest.inputs(links=len(network.Links))
+
+    cal.cal_qstop_per_meter(QStop_hour, QStop_overall, network)
+
+    num_chunks = 2 * datainfo.get('parse_workers', 0) or 1
+    with telemetry.stage('parse'), parse_pool(datainfo) as pool:
+        linkseg_result = result_att(datainfo, 'Link Segment Results',
+                                    run_no)
+        with telemetry.stage('extract_from_linkseg'):
+            cal.extract_from_linkseg(linkseg_result, network, Density_overall, DelayRel_overall, AvgSpeed_overall, pool, num_chunks)
+
+        cal.prep_extract_from_node(num_intervals, LOS_hour, EmissionCO_hour, EmissionVOC_hour)
+        if node_nums:     # If there was any node in Vissim network,
+            node_result = result_att(datainfo, 'Node Results', run_no)
+            with telemetry.stage('extract_from_node'):
+                cal.extract_from_node(node_result, network, EmissionCO, EmissionVOC, LOS_hour, EmissionCO_hour, EmissionVOC_hour, interval, datainfo['warmup_time'], pool, num_chunks)
+
+    # Roll evaluation intervals up to hours.
+    sim_len = datainfo['simulation_time'] - datainfo['warmup_time']
+    hourly = [aggregate.roll_up(list_2D, interval, 3600, sim_len, how)
+              for list_2D, how in ((VehNum_hour, 'sum'),
+                                   (QStop_hour, 'sum'),
+                                   (OccupRate_hour, 'mean'),
+                                   (AvgSpeed_hour, 'mean'),
+                                   (LOS_hour, 'max'),
+                                   (EmissionCO_hour, 'sum'),
+                                   (EmissionVOC_hour, 'sum'))]
+
+    elements, overall, per_hour, per_interval = result_tables(network,
+                                                              hourly)
+
+    if datainfo.get('export_formats'):
+        tables = [('hour', per_hour)]
+        if interval != 3600:
+            tables.append(('interval', per_interval))
+        report.export_tables(
+            Path().absolute()/f"output_{datainfo['start_time']}",
+            datainfo['export_formats'], elements, overall, tables)
+
+    if datainfo.get('results_db'):
+        store_results(datainfo, startup, elements, overall, per_interval)
+
+    # 5. Report
+    logger.info("Reporting...")
+    with telemetry.stage('report'):
+        transposed = datainfo.get('report_layout') == 'transposed'
+        sheet = layout.Sheet()
+        report.print_simul_info(sheet, datainfo)
+        report.print_explanation(sheet)
+        if not transposed:
+            with telemetry.stage('print_overall'):
+                report.print_overall(sheet, network, DelayRel_overall, Density_overall, AvgSpeed_overall, QStop_overall, OccupRate_overall, EmissionCO, EmissionVOC)
+            with telemetry.stage('print_hour'):
+                report.print_hour(sheet, network, *hourly)
+            if interval != 3600:
+                with telemetry.stage('print_interval'):
+                    report.print_hour(sheet, network, VehNum_hour, QStop_hour, OccupRate_hour, AvgSpeed_hour, LOS_hour, EmissionCO_hour, EmissionVOC_hour, interval)
+        sheet.AutoFit.add(2)
+
+        try:
+            excel = runtime.dispatch("Excel.Application")
+            excel.Visible = False
+            excel.DisplayAlerts = False     # To merge cells
+            wb = excel.Workbooks.Add()
+            ws = wb.Worksheets("Sheet1")
+
+            if transposed:
+                def _write_page(name, page):
+                    page_ws = wb.Worksheets.Add(
+                        After=wb.Worksheets(wb.Worksheets.Count))
+                    page_ws.Name = name
+                    layout.render_excel(page, page_ws)
+
+                tables = [(3600, per_hour)]
+                if interval != 3600:
+                    tables.append((interval, per_interval))
+                index = report.print_transposed(_write_page, elements, overall,
+                                                tables,
+                                                datainfo['report_page_size'])
+                report.print_index(sheet, index)
+                ws.Name = "Index"
+
+            layout.render_excel(sheet, ws)
+
+            wb.SaveAs(str(Path().absolute()/f"output_{datainfo['start_time']}.xlsx"))
+            excel.Quit()
+
+        except Exception as e:
+            print(e)
+
+        finally:
+            ws = None
+            wb = None
+            excel = None
+
+    return
+
+
+def result_tables(network, hourly):
+    # Input
+    # > 'network'       : network.NetworkIndex().
+    # > 'hourly'        : 1D list of 2D-lists rolled up to hours, in order of
+    #                     VehNum, QStop, OccupRate, AvgSpeed, LOS, EmissionCO
+    #                     and EmissionVOC.
+    #
+    # Output
+    # > 'elements'      : dict of {str(kind): 1D list of str(name)}.
+    # > 'overall'       : 1D list of (str(metric), str(kind), 1D list).
+    # > 'per_hour'      : 1D list of (str(metric), str(kind), 2D-list).
+    # > 'per_interval'  : 1D list of (str(metric), str(kind), 2D-list).
+    #
+    # Tables of the report, for outputs other than Excel.
+
+    elements = network.element_names()
+    overall = [('Delay', 'link', DelayRel_overall),
+               ('Density', 'link', Density_overall),
+               ('Speed', 'link', AvgSpeed_overall),
+               ('QueueStop', 'link', QStop_overall),
+               ('OccupRate', 'lane', OccupRate_overall),
+               ('EmissionCO', 'node', EmissionCO),
+               ('EmissionVOC', 'node', EmissionVOC)]
+    names = [('VehNum', 'lane'), ('QueueStop', 'link'), ('OccupRate', 'lane'),
+             ('Speed', 'section'), ('LOS', 'node'), ('EmissionCO', 'node'),
+             ('EmissionVOC', 'node')]
+    per_interval = [(metric, kind, list_2D) for (metric, kind), list_2D
+                    in zip(names, (VehNum_hour, QStop_hour, OccupRate_hour,
+                                   AvgSpeed_hour, LOS_hour, EmissionCO_hour,
+                                   EmissionVOC_hour))]
+    per_hour = [(metric, kind, list_2D) for (metric, kind), list_2D
+                in zip(names, hourly)]
+
+    return elements, overall, per_hour, per_interval
+
+
+def store_results(datainfo, startup, elements, overall, per_interval):
+    # Input
+    # > 'datainfo'      : dict.
+    # > 'startup'       : float or None. time.perf_counter() at start.
+    # > 'elements', 'overall', 'per_interval' : See result_tables().
+    #
+    # Append results of the run to the results database.
+    # Per-interval results are stored at the evaluation interval.
+
+    wall_time = time.perf_counter() - startup if startup else None
+    try:
+        resultdb.append_run(Path(datainfo['results_db']).absolute(), datainfo,
+                            wall_time, elements, overall, per_interval)
+    except Exception as e:
+        logger.error(f"store_results() : {e}")
+
+    return
+
+
+def simulate_replication(Vissim, datainfo, Signal, BreakAt, seed,
+                         checkpoint=None, grids=None):
+    # Input
+    # > 'Vissim'    : CDispatch. Configured Vissim.
+    # > 'datainfo'  : dict.
+    # > 'Signal'    : 1D-list of SigControl(). Signal plan.
+    # > 'BreakAt'   : 1D-list of int.
+    # > 'seed'      : int.
+    # > 'checkpoint': dict returned by warmup_checkpoint() or None.
+    # > 'grids'     : dict of {str(metric): stats.GridStat()} or None.
+    #                 Per-interval results of the run are folded into it.
+    #
+    # Output
+    # > dict of {str(KPI): float}. 'Throughput' is the number of vehicles
+    #   which left the network after warm-up.
+    #
+    # Run one more simulation with 'seed' on the configured network.
+
+    Vissim.Simulation.SetAttValue('RandSeed', seed)
+
+    with make_aggregator(datainfo) as aggregator:
+        run_no = simulate(Vissim,
+                          dict(datainfo, checkpoint_period=0, live_stride=0),
+                          Signal, BreakAt, aggregator, None, checkpoint)
+
+        result = replication_result(datainfo, seed, run_no, aggregator,
+                                    grids)
+    result['Throughput'] = runsimul.network_arrivals(Vissim, run_no)
+    discard_runs(Vissim)
+
+    return result
+
+
+def simulate_multirun(Vissim, datainfo, Signal, seed, num_runs, grids=None):
+    # Input
+    # > 'Vissim'    : CDispatch. Configured Vissim.
+    # > 'datainfo'  : dict.
+    # > 'Signal'    : 1D-list of SigControl(). Signal plan.
+    # > 'seed'      : int. Seed of the first run.
+    # > 'num_runs'  : int.
+    # > 'grids'     : See simulate_replication().
+    #
+    # Output
+    # > 1D-list of dict of {str(KPI): float}, one per run.
+    #
+    # Run 'num_runs' replications as Vissim's own multi-run, with seeds
+    # 'seed', 'seed' + increment, ..., and read the results of all runs
+    # afterwards. Signals run as compiled fixed time controllers, since
+    # Vissim starts each run on its own.
+
+    if any(sigcon.BreakAt for sigcon in Signal):
+        logger.info("Compiling signals for multi-run...")
+        use_native_signal(Vissim, datainfo, Signal)
+
+    increment = datainfo['replication_seed_increment']
+    Vissim.Simulation.SetAttValue('RandSeed', seed)
+    Vissim.Simulation.SetAttValue('RandSeedIncr', increment)
+    Vissim.Simulation.SetAttValue('NumRuns', num_runs)
+    Vissim.Simulation.SetAttValue('SimBreakAt', 0)     # No break.
+    Vissim.Simulation.RunContinuous()
+    Vissim.Simulation.SetAttValue('NumRuns', 1)
+
+    # The last 'num_runs' simulation runs are the ones just finished.
+    run_nos = [no for _, no
+               in Vissim.Net.SimulationRuns.GetMultiAttValues('No')]
+    run_nos = run_nos[-num_runs:]
+
+    network = NetworkIndex(lanes_with_SH)
+
+    # Link Segment Results of all runs are parsed together.
+    density = [[] for _ in run_nos]
+    delayrel = [[] for _ in run_nos]
+    speed = [[] for _ in run_nos]
+    with parse_pool(datainfo) as pool:
+        cal.extract_from_linkseg_files(
+            [result_att(datainfo, 'Link Segment Results', run_no)
+             for run_no in run_nos], network, density, delayrel, speed, pool)
+
+    results = []
+    for index, run_no in enumerate(run_nos):
+        with make_aggregator(datainfo) as aggregator:
+            runsimul.extract_run_intervals(Vissim, run_no, aggregator)
+            results.append(replication_result(
+                datainfo, seed + index * increment, run_no, aggregator, grids,
+                (density[index], delayrel[index], speed[index]), network))
+        results[-1]['Throughput'] = runsimul.network_arrivals(Vissim, run_no)
+
+    # The last run is also 'Current', which the breakpoint path reads.
+    mismatches = runsimul.compare_current_run(Vissim, run_nos[-1],
+                                              aggregator.NumIntervals)
+    if mismatches:
+        logger.error("simulate_multirun():\t"
+                     + f"Results of run {run_nos[-1]} differ from Current "
+                     + f"results in {mismatches}.")
+    discard_runs(Vissim)
+
+    return results
+
+
+def replication_result(datainfo, seed, run_no, aggregator, grids=None,
+                       linkseg=None, network=None):
+    # Input
+    # > 'datainfo'      : dict.
+    # > 'seed'          : int.
+    # > 'run_no'        : int. No of the finished simulation run.
+    # > 'aggregator'    : IntervalAggregator() with all intervals pushed.
+    # > 'grids'         : See simulate_replication().
+    # > 'linkseg'       : (density, delayrel, speed) already parsed from Link
+    #                     Segment Results of 'run_no', or None.
+    # > 'network'       : network.NetworkIndex() of lanes with signal heads,
+    #                     or None to build one.
+    #
+    # Output
+    # > dict of {str(KPI): float}
+
+    occuprate_overall, qstop_overall = [], []
+    VehNum, OccupRate, QStop, AvgSpeed = [], [], [], []
+    aggregator.finish(occuprate_overall, qstop_overall,
+                      (VehNum, OccupRate, QStop, AvgSpeed))
+
+    if network is None:
+        network = NetworkIndex(lanes_with_SH)
+
+    if linkseg is None:
+        linkseg = ([], [], [])
+        cal.extract_from_linkseg(
+            result_att(datainfo, 'Link Segment Results', run_no),
+            network, *linkseg)
+    density, delayrel, speed = linkseg
+
+    kpi = cal.cal_network_kpi(delayrel, density, speed, qstop_overall)
+    cal.cal_qstop_per_meter(QStop, qstop_overall, network)
+
+    if grids is not None:
+        for metric, list_2D in (('VehNum', VehNum), ('OccupRate', OccupRate),
+                                ('QueueStop', QStop),
+                                ('Speed', AvgSpeed)):
+            if metric not in grids:
+                grids[metric] = stats.GridStat(len(list_2D),
+                                               len(list_2D[0]) if list_2D
+                                               else 0)
+            grids[metric].push(list_2D)
+
+    # Each replication is a run of its own in the results database.
+    if datainfo.get('results_db'):
+        elements = network.element_names()
+        overall = [('Delay', 'link', delayrel),
+                   ('Density', 'link', density),
+                   ('Speed', 'link', speed),
+                   ('QueueStop', 'link', qstop_overall),
+                   ('OccupRate', 'lane', occuprate_overall)]
+        per_interval = [('VehNum', 'lane', VehNum),
+                        ('OccupRate', 'lane', OccupRate),
+                        ('QueueStop', 'link', QStop)]
+        store_results(dict(datainfo, random_seed=seed), None, elements,
+                      overall, per_interval)
+
+    return kpi
+
+
+def compare_signal_modes(datainfo):
+    # Input
+    # > 'datainfo' : dict.
+    #
+    # Output
+    # > dict of {str(mode): dict}. KPIs, wall time and the number of breaks
+    #   of each mode, and relative differences of KPIs.
+    #
+    # Run the same seed with signals set through COM at each break, with
+    # compiled fixed time controllers, and as a Vissim multi-run of compiled
+    # controllers, on one loaded network.
+
+    datainfo['signal_mode'] = 'breakpoint'
+    Vissim, BreakAt, _Link_TT, _node_nums, _startup = prepare(datainfo)
+    datainfo = dict(datainfo, results_db="")
+
+    result = dict()
+    for mode in ('breakpoint', 'native'):
+        if mode == 'native':
+            BreakAt = use_native_signal(Vissim, datainfo, Signal)
+        breaks = add_interval_breakpoint(BreakAt, datainfo)
+
+        logger.info(f"Running with {mode} signals...")
+        start = time.perf_counter()
+        kpis = simulate_replication(Vissim, datainfo, Signal, breaks,
+                                    datainfo['random_seed'])
+        result[mode] = {'kpis': kpis,
+                        'wall_time': time.perf_counter() - start,
+                        'breaks': len(breaks)}
+
+    # The multi-run path reads results by run number instead of Current.
+    logger.info("Running as a multi-run...")
+    start = time.perf_counter()
+    kpis, = simulate_multirun(Vissim, datainfo, Signal,
+                              datainfo['random_seed'], 1)
+    result['multirun'] = {'kpis': kpis,
+                          'wall_time': time.perf_counter() - start,
+                          'breaks': 0}
+
+    Vissim = None
+
+    def _difference(base, kpis):
+        return {kpi: (value - base[kpi]) / abs(base[kpi]) if base[kpi]
+                else None for kpi, value in kpis.items()}
+
+    base = result['breakpoint']['kpis']
+    result['difference'] = _difference(base, result['native']['kpis'])
+    result['multirun_difference'] = _difference(result['native']['kpis'],
+                                                result['multirun']['kpis'])
+    result['speedup'] = (result['breakpoint']['wall_time']
+                         / result['native']['wall_time'])
+
+    return result
@@ -3,12 +3,12 @@
 # ==========================================================================
 import json
 import logging
-import logging.config
 import sys
 from collections import namedtuple
+from pathlib import PureWindowsPath
+
+import runtime
 
-config = json.load(open("resources/logger.json"))
-logging.config.dictConfig(config)
 logger = logging.getLogger(__name__)
 
 
@@ -19,6 +19,7 @@ class SigControl:
         self.SigInd = []        # 2D-list of characters 'R', 'G' or 'Y'.
         self.signal_time = []   # 1D-list of int.
         self.BreakAt = []       # 1D-list of int.
+        self.Applied = None     # Index of SigInd set to Vissim at last.
 
 
 class VehInput:
@@ -27,6 +28,9 @@ class VehInput:
         self.VehInfo = []       # elements will be namedtuple 'LinkInfo'.
 
 
+# Module level, so that VehInput() can be sent to worker processes.
+LinkInfo = namedtuple('LinkInfo', ['LinkNo', 'VehComp'])
+
 BUF_ROW = 3
 BUF_COL = 2
 
@@ -55,6 +59,51 @@ def read_json(datainfo, filename):
     datainfo['simulation_time'] = comp2['Simulation period [sec]']
     datainfo['vehicle_input_period'] = comp2['TimeInterval of VehicleInput']
     datainfo['comment'] = comp2['Comment']
+    datainfo['overlapped_startup'] = comp2.get('Overlapped Startup', True)
+    datainfo['evaluation_interval'] = comp2.get('Evaluation interval [sec]',
+                                                3600)
+    datainfo['checkpoint_period'] = comp2.get('Checkpoint period [sec]', 0)
+    datainfo['warmup_time'] = comp2.get('Warm-up period [sec]', 0)
+    # Empty scenario means the name of the Vissim input file.
+    datainfo['scenario'] = (comp2.get('Scenario', "")
+                            or PureWindowsPath(datainfo['vissim_inpx']).stem)
+    datainfo['results_db'] = comp2.get('Results database', "results.sqlite")
+    datainfo['export_formats'] = comp2.get('Export formats', [])
+    datainfo['report_layout'] = comp2.get('Report layout', "wide")
+    datainfo['report_page_size'] = comp2.get('Report page size', 1000)
+    datainfo['signal_mode'] = comp2.get('Signal mode', "breakpoint")
+    datainfo['parse_workers'] = comp2.get('Parse workers', 0)
+    datainfo['live_stride'] = comp2.get('Live KPI stride', 0)
+    datainfo['live_buffer'] = comp2.get('Live KPI buffer', 256)
+    datainfo['progress'] = comp2.get('Progress', "bar")
+    datainfo['progress_interval'] = comp2.get('Progress interval [sec]', 1.0)
+    datainfo['progress_port'] = comp2.get('Progress port', 8765)
+    datainfo['manifest_allocations'] = comp2.get('Manifest allocations', 5)
+
+    comp3 = data_dict.get('Replication', dict())
+    datainfo['replication_kpis'] = comp3.get(
+        'KPIs', ['Delay', 'Density', 'Speed', 'QueueStop'])
+    datainfo['replication_precision'] = comp3.get('Target precision', 0.05)
+    datainfo['replication_confidence'] = comp3.get('Confidence', 0.95)
+    datainfo['replication_min_runs'] = comp3.get('Min runs', 3)
+    datainfo['replication_max_runs'] = comp3.get('Max runs', 30)
+    datainfo['replication_wave_size'] = comp3.get('Wave size', 4)
+    datainfo['replication_seed_increment'] = comp3.get('Seed increment', 1)
+    datainfo['replication_multirun'] = comp3.get('Built-in multi-run', False)
+
+    comp4 = data_dict.get('Sweep', dict())
+    datainfo['sweep_offsets'] = comp4.get('Offsets', dict())
+    datainfo['sweep_mode'] = comp4.get('Mode', 'grid')
+    datainfo['sweep_samples'] = comp4.get('Samples', 20)
+    datainfo['sweep_seed'] = comp4.get('Sampling seed', None)
+    datainfo['sweep_workers'] = comp4.get('Workers', 2)
+    datainfo['sweep_objective'] = comp4.get('Objective', 'Delay')
+    datainfo['sweep_maximize'] = comp4.get('Maximize', False)
+    datainfo['sweep_cache'] = comp4.get('Cache', 'sweep_cache.json')
+
+    comp5 = data_dict.get('Demand', dict())
+    datainfo['demand_scales'] = comp5.get('Scales', [1.0])
+    datainfo['demand_workers'] = comp5.get('Workers', 2)
 
     if not isinstance(datainfo['random_seed'], int):
         logger.error(
@@ -67,6 +116,66 @@ def read_json(datainfo, filename):
         logger.error(
             "TimeInterval of VehicleInput should be a positive integer.",
             "Check json file again.")
+    interval = datainfo['evaluation_interval']
+    if (not isinstance(interval, int)) or interval <= 0 or 3600 % interval:
+        logger.error(
+            "Evaluation interval should be a positive divisor of 3600. "
+            + "Check json file again.")
+    if not 0 <= datainfo['warmup_time'] < datainfo['simulation_time']:
+        logger.error(
+            "Warm-up period should be shorter than simulation period. "
+            + "Check json file again.")
+    if datainfo['report_layout'] not in ("wide", "transposed"):
+        logger.error(
+            "Report layout should be 'wide' or 'transposed'. "
+            + "Check json file again.")
+    if datainfo['signal_mode'] not in ("breakpoint", "native"):
+        logger.error(
+            "Signal mode should be 'breakpoint' or 'native'. "
+            + "Check json file again.")
+    if datainfo['checkpoint_period'] % interval:
+        logger.error(
+            "Checkpoint period should be a multiple of evaluation interval. "
+            + "Check json file again.")
+
+    return
+
+
+def read_input_xlsx(datainfo, Signal, VehicleInput, Static_Vehicle_Routes):
+    # Input
+    # > 'datainfo'              : dict.
+    # > 'Signal'                : Empty list.
+    # > 'VehicleInput'          : Empty list.
+    # > 'Static_Vehicle_Routes' : Empty list.
+    #
+    # Read all input Excel files with a dedicated Excel instance.
+    # This function may run in its own thread, which then has its own COM
+    # apartment, while Vissim loads the network in the main thread.
+
+    runtime.co_initialize()
+    excel = wb1 = wb2 = wb3 = None
+    try:
+        excel = runtime.dispatch("Excel.Application")
+        excel.Visible = False
+        excel.DisplayAlerts = False
+        logger.info("Reading signal xlsx...")
+        wb1 = excel.Workbooks.Open(datainfo['signal_xlsx'])
+        read_signal_xlsx(wb1, Signal)
+        logger.info("Reading vehicle xlsx...")
+        wb2 = excel.Workbooks.Open(datainfo['vehicle_input_xlsx'])
+        read_vehicleinput(wb2, VehicleInput)
+        logger.info("Reading Static Vehicle Routes xlsx...")
+        wb3 = excel.Workbooks.Open(datainfo['vehicle_routes_xlsx'])
+        read_static_vehicle_routes(wb3, Static_Vehicle_Routes)
+        excel.Quit()
+
+    except Exception as e:
+        logger.error(e)
+
+    finally:
+        wb1 = wb2 = wb3 = None
+        excel = None
+        runtime.co_uninitialize()
 
     return
 
@@ -237,8 +346,6 @@ def read_vehicleinput(wb, VehicleInput):
 
         return
 
-    LinkInfo = namedtuple('namedtuple_linkinfo', ['LinkNo', 'VehComp'])
-
     try:
         for i in range(wb.Worksheets.Count):
             # set VehInput.TimeInt
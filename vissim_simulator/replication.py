@@ -0,0 +1,109 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import logging
+
+from stats import RunningStat
+
+logger = logging.getLogger(__name__)
+
+MAX_SEED = (1 << 31) - 1
+
+
+def replication_seeds(base_seed, increment, count):
+    # Input
+    # > 'base_seed' : int in range [1, MAX_SEED].
+    # > 'increment' : positive int.
+    # > 'count'     : int.
+    #
+    # Output
+    # > 1D-list of int in range [1, MAX_SEED].
+    #
+    # Seeds are 'base_seed', 'base_seed' + 'increment', ..., as Vissim does
+    # with 'RandSeedIncr', wrapped into the range of set_randomseed().
+
+    return [(base_seed - 1 + i * increment) % MAX_SEED + 1
+            for i in range(count)]
+
+
+class SequentialStopping:
+    def __init__(self, kpis, precision=0.05, confidence=0.95, min_runs=3,
+                 max_runs=30, wave_size=4):
+        # Input
+        # > 'kpis'          : 1D-list of str. ex) ['Delay', 'QueueStop']
+        # > 'precision'     : float. Target relative half width.
+        # > 'confidence'    : float in (0, 1).
+        # > 'min_runs'      : int. At least 2.
+        # > 'max_runs'      : int.
+        # > 'wave_size'     : int. The number of runs scheduled at once.
+        #
+        # Replications are scheduled in waves. After each run, confidence
+        # intervals of 'kpis' are updated, and no more runs are scheduled once
+        # all of them are within 'precision' of their means.
+
+        self.Kpis = kpis
+        self.Precision = precision
+        self.Confidence = confidence
+        self.MinRuns = max(min_runs, 2)
+        self.MaxRuns = max_runs
+        self.WaveSize = wave_size
+
+        self.Stats = {kpi: RunningStat() for kpi in kpis}
+        self.Scheduled = 0
+        self.Results = []   # 1D-list of dict of {str(KPI): float}
+
+    def finished(self):
+        return len(self.Results)
+
+    def converged(self):
+        if self.finished() < self.MinRuns:
+            return False
+        return all(stat.rel_precision(self.Confidence) <= self.Precision
+                   for stat in self.Stats.values())
+
+    def should_stop(self):
+        return self.converged() or self.finished() >= self.MaxRuns
+
+    def next_wave(self):
+        # Output
+        # > 1D-list of int. Indices of runs to be launched now.
+
+        if self.should_stop():
+            return []
+
+        # Never schedule fewer runs than still needed to reach 'MinRuns'.
+        size = max(self.WaveSize, self.MinRuns - self.Scheduled)
+        size = min(size, self.MaxRuns - self.Scheduled)
+        wave = list(range(self.Scheduled, self.Scheduled + size))
+        self.Scheduled += size
+
+        return wave
+
+    def push(self, kpi_values):
+        # Input
+        # > 'kpi_values' : dict of {str(KPI): float}. Result of a finished run.
+
+        self.Results.append(kpi_values)
+        for kpi, stat in self.Stats.items():
+            stat.push(kpi_values[kpi])
+
+        logger.info(f"Replication {self.finished()}:\t"
+                    + ", ".join(f"{kpi} {stat.Mean:.3f} "
+                                + f"±{stat.rel_precision(self.Confidence):.1%}"
+                                for kpi, stat in self.Stats.items()))
+
+        return
+
+    def summary(self):
+        # Output
+        # > dict. Means, half widths and the number of saved runs.
+
+        return {'runs': self.finished(),
+                'converged': self.converged(),
+                'saved_runs': self.MaxRuns - self.finished(),
+                'confidence': self.Confidence,
+                'precision': self.Precision,
+                'kpis': {kpi: {'mean': stat.Mean,
+                               'half_width': stat.half_width(self.Confidence)}
+                         for kpi, stat in self.Stats.items()},
+                'results': self.Results}
@@ -1,18 +1,17 @@
 # ==========================================================================
 # Author : HyeAnn Lee
 # ==========================================================================
-import copy
+import csv
 import datetime
+import heapq
 import json
 import logging
-import logging.config
 from enum import Enum
 
-config = json.load(open("resources/logger.json"))
-logging.config.dictConfig(config)
-logger = logging.getLogger(__name__)
+import cal
+import layout
 
-row = 1
+logger = logging.getLogger(__name__)
 
 
 class Metric(Enum):
@@ -22,143 +21,92 @@ class Metric(Enum):
     Node = 4
 
 
-def _print_text(ws, context):
+def _print_text(sheet, context):
     # Input
-    # > 'ws'        : Excel worksheet.
+    # > 'sheet'     : layout.Sheet().
     # > 'context'   : str.
     #
-    # Set value of cell('row', 1) to 'context' and increases 'row'.
-
-    global row
-    ws.Cells(row, 1).Value = context
-    row += 1
-
-    return
-
+    # Set value of cell('sheet.row', 1) to 'context' and increases
+    # 'sheet.row'.
 
-def _fill_color(ws, color, from_row, from_col, to_row=None, to_col=None):
-    # Input
-    # > 'ws'        : Excel worksheet.
-    # > 'color'     : int
-    # > 'from_row'  : int
-    # > 'from_col'  : int
-    # > 'to_row'    : int
-    # > 'to_col'    : int
-
-    # Set color of cells from cell('from_row', 'from_col') to
-    # cell('to_row', 'to_col') as 'color'.
-    # 'color' = 19 : Ivory
-    #           36 : Light Yellow
-    #           38 : Rose
-
-    if to_row is None:
-        to_row = from_row
-    if to_col is None:
-        to_col = from_col
-    ws.Range(ws.Cells(from_row, from_col), ws.Cells(to_row, to_col))\
-      .Interior.ColorIndex = color
+    sheet.set(sheet.row, 1, context)
+    sheet.row += 1
 
     return
 
 
-def _align_row(ws):
+def _interval_name(index, interval):
     # Input
-    # > 'ws'        : Excel worksheet.
-
-    # Align contexts in 'row' to be horizontally center.
-    ws.Rows(row).HorizontalAlignment = 3  # Center
-
-    return
-
-
-def _merge_for_link(ws, cur_row, col, num_SH):
-    # Input
-    # > 'ws'        : Excel worksheet.
-    # > 'cur_row'   : int
-    # > 'col'       : int
-    # > 'num_SH'    : int
-
+    # > 'index'     : int. Index of evaluation interval.
+    # > 'interval'  : int. Length of evaluation interval [sec].
+    #
     # Output
-    # new column number after merging.
+    # > str. ex) '0~1 hour', '15~30 min'
 
-    # Merge cells in case of link metric.
-    # Caller function should update its col to return value.
-    # This function is supposed to be called by _print_column_name() and
-    # _print_row_item().
+    if interval == 3600:
+        return f'{index}~{index+1} hour'
+    return f'{index*interval//60}~{(index+1)*interval//60} min'
 
-    fromCell = ws.Cells(cur_row, col)
-    col += num_SH - 1
-    toCell = ws.Cells(cur_row, col)
-    ws.Range(fromCell, toCell).Merge()
 
-    return col
-
-
-def _print_column_name(ws, metric, column_name):
+def _print_column_name(sheet, metric, network):
     # Input
-    # > 'ws'            : Excel worksheet.
+    # > 'sheet'         : layout.Sheet().
     # > 'metric'        : enum 'Metric'.
-    # > 'column_name'   : 1D list
+    # > 'network'       : network.NetworkIndex().
 
-    # Print column names of result table and increase 'row'.
+    # Print column names of result table and increase 'sheet.row'.
     # This function is supposed to be called from print_overall() and
     # _print_Metric().
 
-    global row
-    _align_row(ws)
+    row = sheet.row
+    sheet.center(row)
     col = 2
-    ws.Cells(row, col).Value = metric.name
+    sheet.set(row, col, metric.name)
 
     if metric == Metric.Lane:
-        # 'column_name' : 1D list of (int(LinkNo), int(LaneNo), double(PosSH),
-        #                             double(LinkLen))
-        for linkNo, laneNo, *_ in column_name:
+        for linkNo, laneNo, *_ in network.Lanes:
             col += 1
-            ws.Cells(row, col).Value = f"'{linkNo} - {laneNo}"
+            sheet.set(row, col, f"'{linkNo} - {laneNo}")
 
     elif metric == Metric.Link:
-        # 'column_name' : 1D list of (int(LinkNo), int(NumSH))
-        for linkNo, num_SH in column_name:
-            col += 1
-            ws.Cells(row, col).Value = linkNo
-            col = _merge_for_link(ws, row, col, num_SH)
+        for linkNo, (from_col, to_col) in zip(network.Links,
+                                              network.link_columns()):
+            sheet.set(row, from_col, linkNo)
+            sheet.merge(row, from_col, to_col)
+            col = to_col
 
     elif metric == Metric.TT:
-        # 'column_name' : 1D list of (str(StartLink), str(EndLink))
-        ws.Cells(row, col).Value = "Section"    # Overwrite.
-        for startlink, endlink in column_name:
+        sheet.set(row, col, "Section")      # Overwrite.
+        for startlink, endlink in network.Sections:
             col += 1
-            ws.Cells(row, col).Value = f'{startlink} to {endlink}'
+            sheet.set(row, col, f'{startlink} to {endlink}')
 
     elif metric == Metric.Node:
-        # 'column_name' : 1D list of int(NodeNo)
-        for NodeNo in column_name:
+        for NodeNo in network.Nodes:
             col += 1
-            ws.Cells(row, col).Value = NodeNo
+            sheet.set(row, col, NodeNo)
 
     else:
         logger.error("_print_column_name() : Invalid [metric].")
 
-    _fill_color(ws, 19, row, 2, row, col)   # Color table.
+    sheet.fill(19, row, 2, row, col)    # Color table.
+    sheet.border(row, 2, col)
 
-    # Draw border with solid line.
-    ws.Range(ws.Cells(row, 2), ws.Cells(row, col)).Borders.LineStyle = 1
-
-    row += 1
+    sheet.row += 1
 
     return
 
 
-def _print_row_item(ws, row_name, metric, list_1D, SH_per_link=None,
+def _print_row_item(sheet, row_name, metric, list_1D, network=None,
                     display_min=False):
     # Input
-    # > 'ws'            : Excel worksheet.
+    # > 'sheet'         : layout.Sheet().
     # > 'row_name'      : str.
     # > 'metric'        : enum 'Metric'.
     # > 'list_1D'       : 1D list.
-    # > 'SH_per_link'   : 1D list of (int(LinkNo), int(NumSH)).
-    #                       For link metric, 'SH_per_link' should be given.
-    #                       Otherwise, 'SH_per_link' has no meaning.
+    # > 'network'       : network.NetworkIndex().
+    #                       For link metric, 'network' should be given.
+    #                       Otherwise, 'network' has no meaning.
     # > 'display_min'   : boolean.
 
     # This function is supposed to be called from _print_Metric() and
@@ -170,52 +118,43 @@ def _print_row_item(ws, row_name, metric, list_1D, SH_per_link=None,
         # > 'number'        : int.
         # > 'find_max'      : boolean.
         #
-        # Cells with the 'number' largest/smallest values will be colored by
-        # _fill_color().
-
-        # If the number of elements in 'list_of_tuple' is less then 'number',
-        # color all cells.
-        if number > len(list_of_tuple):
-            for _, column in list_of_tuple:
-                _fill_color(ws, 38, row, column)
+        # Cells with the 'number' largest/smallest values will be colored.
+        # Ties with the 'number'-th value are colored as well.
+
+        if not list_of_tuple:
             return
 
-        list_of_tuple.sort(reverse=find_max)
-        thsh = list_of_tuple[number - 1][0]     # list_of_tuple[number-1].item
+        select = heapq.nlargest if find_max else heapq.nsmallest
+        thsh = select(number, (value for value, _ in list_of_tuple))[-1]
         for value, column in list_of_tuple:
-            if (find_max and value < thsh) or (not find_max and value > thsh):
-                return
-            _fill_color(ws, 38, row, column)
+            if (find_max and value >= thsh) or (not find_max and value <= thsh):
+                sheet.fill(38, row, column)
 
-    global row
-    _align_row(ws)
+    row = sheet.row
+    sheet.center(row)
 
     # Insert 'row_name'.
-    ws.Cells(row, 2).Value = row_name
+    sheet.set(row, 2, row_name)
 
-    # Create 1D-list 'target_list'.
-    if metric == Metric.Link:   # Modify list_1D in case of link metric.
-        if SH_per_link is None:
+    # Column of each item.
+    if metric == Metric.Link:
+        if network is None:
             logger.error("_print_row_item(): "
-                         + "SH_per_link must be given in case of link metric.")
-        target_list = copy.deepcopy(list_1D)
-        for index in range(len(SH_per_link) - 1, -1, -1):
-            for _ in range(SH_per_link[index][1] - 1):
-                target_list.insert(index + 1,
-                                   99999999 if display_min
-                                   else -99999999)  # Insert dummy value.
+                         + "network must be given in case of link metric.")
+        link_columns = network.link_columns()
+        columns = [from_col for from_col, _ in link_columns]
+        for from_col, to_col in link_columns:
+            sheet.merge(row, from_col, to_col)
     else:   # lane, TT, Node
-        target_list = list_1D
+        columns = range(3, 3 + len(list_1D))
 
     # Create 1D-list 'to_find_max' of tuple (item, col)
-    col = 2
     to_find_max = []
-    for item in target_list:    # item : str or number
-        col += 1
+    for item, col in zip(list_1D, columns):     # item : str or number
         if item == -1:
-            ws.Cells(row, col).Value = 'None'
+            sheet.set(row, col, 'None')
         else:
-            ws.Cells(row, col).Value = item
+            sheet.set(row, col, item)
             to_find_max.append((item, col))
 
     # Find minimum / maximum values and color them.
@@ -223,101 +162,82 @@ def _print_row_item(ws, row_name, metric, list_1D, SH_per_link=None,
                           False if (metric == Metric.TT) or display_min
                           else True)
 
-    # Merge cells in case of link metric.
-    if metric == Metric.Link:
-        col = 3
-        for _, num_SH in SH_per_link:
-            col = _merge_for_link(ws, row, col, num_SH) + 1
-
     # Increment 'row'.
-    row += 1
+    sheet.row += 1
 
     return
 
 
-def print_simul_info(ws, data):
+def print_simul_info(sheet, data):
     # Input
-    # > 'ws'        : Excel worksheet.
+    # > 'sheet'     : layout.Sheet().
     # > 'data'      : dict.
 
-    start_row = row
-    _print_text(ws, "$ Simulation Info")
-
-    _print_text(ws, "* Network File : ")
-    ws.Cells(row - 1, 3).Value = data['vissim_inpx']
-
-    _print_text(ws, "* Signal : ")
-    ws.Cells(row - 1, 3).Value = data['signal_xlsx']
-
-    _print_text(ws, "* Vehicle Input : ")
-    ws.Cells(row - 1, 3).Value = data['vehicle_input_xlsx']
-
-    _print_text(ws, "* Static Vehicle Routes : ")
-    ws.Cells(row - 1, 3).Value = data['vehicle_routes_xlsx']
-
-    _print_text(ws, "* Date : ")
-    ws.Cells(row - 1, 3).Value = datetime.datetime.now().strftime("%c")
+    def _print_info(name, value):
+        _print_text(sheet, name)
+        sheet.set(sheet.row - 1, 3, value)
 
-    _print_text(ws, "* Random Seed : ")
-    ws.Cells(row - 1, 3).Value = data['random_seed']
+    start_row = sheet.row
+    _print_text(sheet, "$ Simulation Info")
 
-    _print_text(ws, "* Quick Mode : ")
-    ws.Cells(row - 1, 3).Value = data['quick_mode']
+    _print_info("* Network File : ", data['vissim_inpx'])
+    _print_info("* Signal : ", data['signal_xlsx'])
+    _print_info("* Vehicle Input : ", data['vehicle_input_xlsx'])
+    _print_info("* Static Vehicle Routes : ", data['vehicle_routes_xlsx'])
+    _print_info("* Date : ", datetime.datetime.now().strftime("%c"))
+    _print_info("* Random Seed : ", data['random_seed'])
+    _print_info("* Quick Mode : ", data['quick_mode'])
+    _print_info("* Simulation time (sec) : ", data['simulation_time'])
+    _print_info("* Warm-up (sec) : ", data.get('warmup_time', 0))
+    _print_info("* Comment : ", data['comment'])
 
-    _print_text(ws, "* Simulation time (sec) : ")
-    ws.Cells(row - 1, 3).Value = data['simulation_time']
+    _print_text(sheet, "*")
 
-    _print_text(ws, "* Comment : ")
-    ws.Cells(row - 1, 3).Value = data['comment']
-
-    _print_text(ws, "*")
-
-    _fill_color(ws, 36, start_row, 1, row - 2, 1)
+    sheet.fill(36, start_row, 1, sheet.row - 2, 1)
 
     return
 
 
-def print_explanation(ws):
+def print_explanation(sheet):
     # Input
-    # > 'ws'        : Excel worksheet.
-
-    start_row = row
-    _print_text(ws, "$ Measurements")
-    _print_text(ws, "* Delay : "
-                    + "Total delay divided by total travel time of all "
-                    + "vehicles in this link segment [%]")
-    _print_text(ws, "* Density : Vehicle density [/km]")
-#    _print_text(ws, "* Emissions CO : Quantity of carbon monoxide [g]")
-#    _print_text(ws, "* Emissions VOC : "
-#                    + "Quantity of volatile organic compounds [g]")
-    _print_text(ws, "* LOS : Level of service (A ~ F).")
-    _print_text(ws, "* OccupRate : "
-                    + "Share of time [0% ~ 100%] of the last simulation step, "
-                    + "in which at least one data collection point of this "
-                    + "data collection measurement was occupied.")
-    _print_text(ws, "* QueueStop : "
-                    + "The number of queue stops per meter. A queue stop "
-                    + "counts when a vehicle that is directly upstream or "
-                    + "within the queue length falls below the speed of the "
-                    + "Begin attribute defined for the queue condition. [/m]")
-    _print_text(ws, "* Speed : "
-                    + "Average speed of vehicles passing through the section "
-                    + "[km/h]")
-    _print_text(ws, "*")
-
-    _fill_color(ws, 36, start_row, 1, row - 2, 1)
+    # > 'sheet'     : layout.Sheet().
+
+    start_row = sheet.row
+    _print_text(sheet, "$ Measurements")
+    _print_text(sheet, "* Delay : "
+                       + "Total delay divided by total travel time of all "
+                       + "vehicles in this link segment [%]")
+    _print_text(sheet, "* Density : Vehicle density [/km]")
+#    _print_text(sheet, "* Emissions CO : Quantity of carbon monoxide [g]")
+#    _print_text(sheet, "* Emissions VOC : "
+#                       + "Quantity of volatile organic compounds [g]")
+    _print_text(sheet, "* LOS : Level of service (A ~ F).")
+    _print_text(sheet, "* OccupRate : "
+                       + "Share of time [0% ~ 100%] of the last simulation "
+                       + "step, in which at least one data collection point "
+                       + "of this data collection measurement was occupied.")
+    _print_text(sheet, "* QueueStop : "
+                       + "The number of queue stops per meter. A queue stop "
+                       + "counts when a vehicle that is directly upstream or "
+                       + "within the queue length falls below the speed of "
+                       + "the Begin attribute defined for the queue "
+                       + "condition. [/m]")
+    _print_text(sheet, "* Speed : "
+                       + "Average speed of vehicles passing through the "
+                       + "section [km/h]")
+    _print_text(sheet, "*")
+
+    sheet.fill(36, start_row, 1, sheet.row - 2, 1)
 
     return
 
 
-def print_overall(ws, lanes_with_SH, SH_per_link, node_nums, DelayRel_overall,
-                  Density_overall, AvgSpeed_overall, QStop_overall,
-                  OccupRate_overall, EmissionCO, EmissionVOC):
+def print_overall(sheet, network, DelayRel_overall, Density_overall,
+                  AvgSpeed_overall, QStop_overall, OccupRate_overall,
+                  EmissionCO, EmissionVOC):
     # Input
-    # > 'ws'            : Excel worksheet.
-    # > 'lanes_with_SH' : 1D list of (int(LinkNo), int(LaneNo), double(PosSH)).
-    # > 'SH_per_link'   : 1D list of (int(LinkNo), int(NumSH)).
-    # > 'node_nums'       : 1D list of int(NodeNo) or empty list.
+    # > 'sheet'         : layout.Sheet().
+    # > 'network'       : network.NetworkIndex().
     # > 'DelayRel_overall'  : 1D list of floats.
     # > 'Density_overall'   : 1D list of floats.
     # > 'AvgSpeed_overall'  : 1D list of floats.
@@ -326,47 +246,42 @@ def print_overall(ws, lanes_with_SH, SH_per_link, node_nums, DelayRel_overall,
     # > 'EmissionCO'        : 1D list of floats.
     # > 'EmissionVOC'       : 1D list of floats.
 
-    start_row = row
-    _print_text(ws, "$ Overall Results")
+    start_row = sheet.row
+    _print_text(sheet, "$ Overall Results")
 
-    _print_column_name(ws, Metric.Lane, lanes_with_SH)
+    _print_column_name(sheet, Metric.Lane, network)
 
-    _print_row_item(ws, "Delay", Metric.Link, DelayRel_overall, SH_per_link)
-    _print_row_item(ws, "Density", Metric.Link, Density_overall, SH_per_link)
-    _print_row_item(ws, "Speed", Metric.Link, AvgSpeed_overall, SH_per_link,
+    _print_row_item(sheet, "Delay", Metric.Link, DelayRel_overall, network)
+    _print_row_item(sheet, "Density", Metric.Link, Density_overall, network)
+    _print_row_item(sheet, "Speed", Metric.Link, AvgSpeed_overall, network,
                     display_min=True)
-    _print_row_item(ws, "QueueStop", Metric.Link, QStop_overall, SH_per_link)
-    _print_row_item(ws, "OccupRate", Metric.Lane, OccupRate_overall)
+    _print_row_item(sheet, "QueueStop", Metric.Link, QStop_overall, network)
+    _print_row_item(sheet, "OccupRate", Metric.Lane, OccupRate_overall)
 
-    _fill_color(ws, 19, start_row + 2, 2, row - 1, 2)
-    _print_text(ws, "*")
+    sheet.fill(19, start_row + 2, 2, sheet.row - 1, 2)
+    _print_text(sheet, "*")
 
-#    if node_nums:
-#        mid_row = row
-#        _print_column_name(ws, Metric.Node, node_nums)
+#    if network.Nodes:
+#        mid_row = sheet.row
+#        _print_column_name(sheet, Metric.Node, network)
 #
-#        _print_row_item(ws, "Emissions CO",     Metric.Node, EmissionCO)
-#        _print_row_item(ws, "Emissions VOC",    Metric.Node, EmissionVOC)
+#        _print_row_item(sheet, "Emissions CO",     Metric.Node, EmissionCO)
+#        _print_row_item(sheet, "Emissions VOC",    Metric.Node, EmissionVOC)
 #
-#        _fill_color(ws, 19, mid_row, 2, row - 1, 2)
-#        _print_text(ws, "*")
+#        sheet.fill(19, mid_row, 2, sheet.row - 1, 2)
+#        _print_text(sheet, "*")
 
-    _fill_color(ws, 36, start_row, 1, row - 2, 1)
+    sheet.fill(36, start_row, 1, sheet.row - 2, 1)
 
     return
 
 
-def print_hour(ws, lanes_with_SH, SH_per_link, Link_TT, node_nums, VehNum_hour,
-               QStop_hour, OccupRate_hour, AvgSpeed_hour, LOS_hour,
-               EmissionCO_hour, EmissionVOC_hour):
+def print_hour(sheet, network, VehNum_hour, QStop_hour, OccupRate_hour,
+               AvgSpeed_hour, LOS_hour, EmissionCO_hour, EmissionVOC_hour,
+               interval=3600):
     # Input
-    # > 'ws'            : Excel worksheet.
-    # > 'lanes_with_SH' : 1D list of (int(LinkNo), int(LaneNo), double(PosSH),
-    #                                 double(LinkLen)).
-    # > 'SH_per_link'   : 1D list of (int(LinkNo), int(NumSH)).
-    # > 'Link_TT'       : 1D list of (str(StartLink), str(EndLink)) or empty
-    #                     list.
-    # > 'node_nums'       : 1D list of int(NodeNo) or empty list.
+    # > 'sheet'         : layout.Sheet().
+    # > 'network'       : network.NetworkIndex().
     # > 'VehNum_hour'       : 2D-list of non-negative numbers.
     # > 'QStop_hour'        : 2D list of non-negative numbers.
     # > 'OccupRate_hour'    : 2D-list of non-negative numbers.
@@ -374,49 +289,314 @@ def print_hour(ws, lanes_with_SH, SH_per_link, Link_TT, node_nums, VehNum_hour,
     # > 'LOS_hour'          : 2D-list of str or empty list.
     # > 'EmissionCO_hour'   : 2D-list of float or empty list.
     # > 'EmissionVOC_hour'  : 2D-list of float or empty list.
+    # > 'interval'          : int. Length of each row of 2D-lists [sec].
+
+    def _row_name(index):
+        # Input
+        # > 'index' : int. Index of a row of 2D-lists.
+
+        return _interval_name(index, interval)
 
-    def _print_Metric(metric_name, metric, column_name, list_2D):
+    def _print_Metric(metric_name, metric, list_2D):
         # Input
         # > 'metric_name'   : str.
         # > 'metric'        : enum 'Metric'.
-        # > 'column_name'   : 1D list.
         # > 'list_2D'       : 2D-list.
 
-        _print_text(ws, metric_name)    # Print metric's name.
-        _print_column_name(ws, metric, column_name)  # Print column name.
+        _print_text(sheet, metric_name)     # Print metric's name.
+        _print_column_name(sheet, metric, network)  # Print column name.
 
         # Print table contents.
-        inter_row = row
+        inter_row = sheet.row
         hour = 0
         for hour, list_1d in enumerate(list_2D):
-            row_name = f'{hour}~{hour+1} hour'
-            _print_row_item(ws, row_name, metric, list_1d, column_name)
+            _print_row_item(sheet, _row_name(hour), metric, list_1d,
+                            network)
 
         # The last one has to be overwritten.
-        ws.Cells(row - 1, 2).Value = f'{hour}~END'
+        sheet.set(sheet.row - 1, 2, _row_name(hour).split('~')[0] + '~END')
 
-        _fill_color(ws, 19, inter_row, 2, row - 1, 2)   # Color table.
-        _print_text(ws, "*")    # Print new line.
+        sheet.fill(19, inter_row, 2, sheet.row - 1, 2)  # Color table.
+        _print_text(sheet, "*")     # Print new line.
 
         return
 
-    start_row = row
-    _print_text(ws, "$ Per Hour Results")
+    start_row = sheet.row
+    if interval == 3600:
+        _print_text(sheet, "$ Per Hour Results")
+    else:
+        _print_text(sheet, f"$ Per {interval // 60} Minutes Results")
+
+    _print_Metric("* The Number of Vehicles", Metric.Lane, VehNum_hour)
+    _print_Metric("* OccupRate", Metric.Lane, OccupRate_hour)
+    _print_Metric("* QueueStop", Metric.Link, QStop_hour)
+
+    if network.Sections:
+        _print_Metric("* Speed", Metric.TT, AvgSpeed_hour)
+
+    if network.Nodes:
+        _print_Metric("* LOS", Metric.Node, LOS_hour)
+#        _print_Metric("* Emissions CO", Metric.Node, EmissionCO_hour)
+#        _print_Metric("* Emissions VOC", Metric.Node, EmissionVOC_hour)
+
+    sheet.fill(36, start_row, 1, sheet.row - 2, 1)
+
+    return
+
+
+def _transposed_tables(overall, tables):
+    # Input
+    # > 'overall'   : 1D list of (str(metric), str(kind), 1D list).
+    # > 'tables'    : 1D list of (int(interval), 1D list of
+    #                 (str(metric), str(kind), 2D-list)).
+    #
+    # Output
+    # > generator of (str(title), str(kind), 1D list of str(header),
+    #                 2D-list(columns of values)).
+    #
+    # Overall results are grouped by kind, one column per metric.
+    # Results per interval have one column per interval.
+
+    kinds = dict()
+    for metric, kind, list_1D in overall:
+        kinds.setdefault(kind, []).append((metric, list_1D))
+    for kind, metrics in kinds.items():
+        yield (f"Overall {kind}", kind, [metric for metric, _ in metrics],
+               [list_1D for _, list_1D in metrics])
+
+    for interval, metrics in tables:
+        per = "hour" if interval == 3600 else f"{interval // 60} min"
+        for metric, kind, list_2D in metrics:
+            if list_2D and list_2D[0]:
+                yield (f"{kind.capitalize()} {metric} per {per}", kind,
+                       [_interval_name(index, interval)
+                        for index in range(len(list_2D))], list_2D)
+
+
+# Sheet names taken by the workbook itself. Excel compares names
+# without case.
+RESERVED_SHEETS = ('Index', 'Sheet1', 'History')
+
+
+def sheet_name(title, page, used):
+    # Input
+    # > 'title' : str.
+    # > 'page'  : int.
+    # > 'used'  : set of str. Lower-cased names taken so far. Updated.
+    #
+    # Output
+    # > str. Name Excel accepts: at most 31 characters, none of []:*?/\,
+    #   no apostrophe at either end and unique in 'used'.
+
+    base = title.translate(str.maketrans('[]:*?/\\', '().__--')).strip("'")
+    name = None
+    for copy in range(1, len(used) + 2):
+        suffix = f" {page}" if copy == 1 else f" {page}-{copy}"
+        name = base[:31 - len(suffix)].rstrip(" '") + suffix
+        if name.lower() not in used:
+            break
+    used.add(name.lower())
 
-    _print_Metric("* The Number of Vehicles", Metric.Lane, lanes_with_SH,
-                  VehNum_hour)
-    _print_Metric("* OccupRate", Metric.Lane, lanes_with_SH, OccupRate_hour)
-    _print_Metric("* QueueStop", Metric.Link, SH_per_link, QStop_hour)
+    return name
 
-    if Link_TT:
-        _print_Metric("* Speed", Metric.TT, Link_TT, AvgSpeed_hour)
 
-    if node_nums:
-        _print_Metric("* LOS", Metric.Node, node_nums, LOS_hour)
-#        _print_Metric("* Emissions CO", Metric.Node, node_nums, EmissionCO_hour)
-#        _print_Metric("* Emissions VOC", Metric.Node, node_nums,
-#                      EmissionVOC_hour)
+def print_transposed(write_page, elements, overall, tables, page_size=1000,
+                     used=None):
+    # Input
+    # > 'write_page'    : function(str(name), layout.Sheet()). Backend.
+    # > 'elements'      : dict of {str(kind): 1D list of str(name)}.
+    # > 'overall', 'tables' : See _transposed_tables().
+    # > 'page_size'     : int. The maximum number of elements per sheet.
+    # > 'used'          : set of str or None(RESERVED_SHEETS). Lower-cased
+    #                     sheet names already in the workbook.
+    #
+    # Output
+    # > 'index' : 1D list of (str(sheet), str(title), str(first element),
+    #                         str(last element), int(rows)).
+    #
+    # Elements go in rows and intervals in columns, so the width of a sheet
+    # does not depend on the network. Each page is handed to 'write_page'
+    # as soon as it is laid out and is not kept.
+
+    if used is None:
+        used = {name.lower() for name in RESERVED_SHEETS}
+
+    index = []
+    for title, kind, headers, columns in _transposed_tables(overall, tables):
+        names = elements[kind]
+        for page, start in enumerate(range(0, len(names), page_size), 1):
+            stop = min(start + page_size, len(names))
+            name = sheet_name(title, page, used)
+
+            sheet = layout.Sheet()
+            _print_text(sheet, f"$ {title} ({page})")
+
+            row = sheet.row
+            sheet.center(row)
+            for col, header in enumerate([kind.capitalize()] + headers, 1):
+                sheet.set(row, col, header)
+            sheet.fill(19, row, 1, row, len(headers) + 1)
+            sheet.border(row, 1, len(headers) + 1)
+
+            for element in range(start, stop):
+                row += 1
+                sheet.set(row, 1, names[element])
+                for col, column in enumerate(columns, 2):
+                    item = column[element]
+                    sheet.set(row, col, 'None' if item == -1 else item)
+            sheet.fill(19, sheet.row + 1, 1, row, 1)
+            sheet.AutoFit.add(1)
+
+            write_page(name, sheet)
+            index.append((name, title, names[start], names[stop - 1],
+                          stop - start))
+
+    return index
+
+
+def print_index(sheet, index):
+    # Input
+    # > 'sheet' : layout.Sheet().
+    # > 'index' : 1D list returned by print_transposed().
+
+    start_row = sheet.row
+    _print_text(sheet, "$ Index")
+
+    row = sheet.row
+    sheet.center(row)
+    for col, header in enumerate(("Sheet", "Table", "First", "Last", "Rows"),
+                                 2):
+        sheet.set(row, col, header)
+    sheet.fill(19, row, 2, row, 6)
+    sheet.border(row, 2, 6)
+
+    for item in index:
+        row += 1
+        for col, value in enumerate(item, 2):
+            sheet.set(row, col, value)
+    sheet.row = row + 1
+
+    _print_text(sheet, "*")
+    sheet.fill(36, start_row, 1, sheet.row - 2, 1)
+
+    return
+
+
+def print_demand_curves(sheet, results):
+    # Input
+    # > 'sheet'     : layout.Sheet().
+    # > 'results'   : 1D list returned by sweep.run_demand_sweep().
+    #
+    # One row per demand level and one column per KPI, so that each column
+    # is a metric-vs-demand curve.
+
+    start_row = sheet.row
+    _print_text(sheet, "$ Demand Curves")
+
+    kpis = list(results[0]['kpis']) if results else []
+    row = sheet.row
+    sheet.center(row)
+    for col, header in enumerate(["Demand"] + kpis, 2):
+        sheet.set(row, col, header)
+    sheet.fill(19, row, 2, row, len(kpis) + 2)
+    sheet.border(row, 2, len(kpis) + 2)
+
+    for result in results:
+        row += 1
+        sheet.center(row)
+        sheet.set(row, 2, f"{result['scale']:.0%}")
+        for col, kpi in enumerate(kpis, 3):
+            sheet.set(row, col, result['kpis'].get(kpi))
+    sheet.fill(19, sheet.row + 1, 2, row, 2)
+    sheet.row = row + 1
+
+    _print_text(sheet, "*")
+    sheet.fill(36, start_row, 1, sheet.row - 2, 1)
+
+    return
+
+
+EXPORT_COLUMNS = ('table', 'index', 'metric', 'kind', 'element', 'value')
+
+
+def _export_rows(elements, overall, tables):
+    # Input
+    # > 'elements'  : dict of {str(kind): 1D list of str(name)}.
+    # > 'overall'   : 1D list of (str(metric), str(kind), 1D list).
+    # > 'tables'    : 1D list of (str(table), 1D list of
+    #                 (str(metric), str(kind), 2D-list)).
+    #
+    # Output
+    # > generator of (str, int, str, str, str, float or None).
+    #   'index' of overall results is -1. LOS is given as 1 ~ 6. Values with
+    #   no vehicle (-1) and missing values are None, i.e. an empty cell in
+    #   csv and null in jsonl and arrow.
+
+    def _value(metric, value):
+        if metric == 'LOS':
+            return cal.los_value(value)
+        return None if value in (-1, None, "") else value
+
+    for metric, kind, list_1D in overall:
+        for name, value in zip(elements[kind], list_1D):
+            yield ('overall', -1, metric, kind, name, _value(metric, value))
+
+    for table, metrics in tables:
+        for metric, kind, list_2D in metrics:
+            for index, list_1D in enumerate(list_2D):
+                for name, value in zip(elements[kind], list_1D):
+                    yield (table, index, metric, kind, name,
+                           _value(metric, value))
+
+
+def export_tables(basename, formats, elements, overall, tables):
+    # Input
+    # > 'basename'  : Path without suffix.
+    # > 'formats'   : 1D list of 'csv', 'jsonl' or 'arrow'.
+    # > 'elements', 'overall', 'tables' : See _export_rows().
+    #
+    # Write results in long format, one row per value, without Excel.
+    # 'arrow' is the columnar Arrow IPC (Feather) file and needs pyarrow.
+
+    rows = list(_export_rows(elements, overall, tables))
+
+    for form in formats:
+        if form == 'csv':
+            with open(f"{basename}.csv", 'w', newline='',
+                      encoding='UTF8') as f:
+                writer = csv.writer(f)
+                writer.writerow(EXPORT_COLUMNS)
+                writer.writerows(rows)
+
+        elif form == 'jsonl':
+            with open(f"{basename}.jsonl", 'w', encoding='UTF8') as f:
+                for item in rows:
+                    f.write(json.dumps(dict(zip(EXPORT_COLUMNS, item))) + '\n')
+
+        elif form == 'arrow':
+            try:
+                import pyarrow
+                import pyarrow.feather
+            except ImportError:
+                logger.error("export_tables() : 'arrow' needs pyarrow.")
+                continue
+
+            columns = list(zip(*rows)) or [[] for _ in EXPORT_COLUMNS]
+            schema = pyarrow.schema([('table', pyarrow.string()),
+                                     ('index', pyarrow.int32()),
+                                     ('metric', pyarrow.string()),
+                                     ('kind', pyarrow.string()),
+                                     ('element', pyarrow.string()),
+                                     ('value', pyarrow.float64())])
+            table = pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type)
+                 for column, field in zip(columns, schema)], schema=schema)
+            pyarrow.feather.write_feather(table, f"{basename}.arrow")
+
+        else:
+            logger.error(f"export_tables() : Invalid format '{form}'.")
+            continue
 
-    _fill_color(ws, 36, start_row, 1, row - 2, 1)
+        logger.info(f"Exported {len(rows)} values to {basename}.{form}")
 
     return
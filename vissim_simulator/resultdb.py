@@ -0,0 +1,311 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import contextlib
+import hashlib
+import json
+import logging
+import math
+import sqlite3
+from array import array
+from pathlib import Path
+
+import cal
+
+logger = logging.getLogger(__name__)
+
+# 'interval' of overall results.
+OVERALL = -1
+
+# Value of a result with no vehicle, ex) speed of a link nobody passed.
+# Stored as NULL, so that query() gives NaN.
+MISSING = -1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY,
+    scenario    TEXT NOT NULL,
+    start_time  TEXT NOT NULL,
+    seed        INTEGER,
+    interval    INTEGER NOT NULL,
+    warmup      INTEGER NOT NULL,
+    input_hash  TEXT NOT NULL,
+    inputs      TEXT NOT NULL,
+    settings    TEXT NOT NULL,
+    wall_time   REAL
+);
+CREATE TABLE IF NOT EXISTS elements (
+    element_id  INTEGER PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    UNIQUE (kind, name)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id      INTEGER NOT NULL REFERENCES runs (run_id),
+    interval    INTEGER NOT NULL,
+    element_id  INTEGER NOT NULL REFERENCES elements (element_id),
+    metric      TEXT NOT NULL,
+    value       REAL
+);
+CREATE INDEX IF NOT EXISTS runs_scenario ON runs (scenario);
+CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run_id);
+CREATE INDEX IF NOT EXISTS metrics_element
+    ON metrics (metric, element_id, interval);
+CREATE INDEX IF NOT EXISTS metrics_interval ON metrics (metric, interval);
+"""
+
+
+def connect(file):
+    # Input
+    # > 'file' : Path of database file.
+    #
+    # Output
+    # > sqlite3.Connection with all tables created.
+
+    conn = sqlite3.connect(str(file))
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+@contextlib.contextmanager
+def opened(db):
+    # Input
+    # > 'db' : Path of database file or sqlite3.Connection from connect().
+    #
+    # Output
+    # > sqlite3.Connection. Closed on exit only if opened here.
+
+    if isinstance(db, sqlite3.Connection):
+        yield db
+        return
+
+    conn = connect(db)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def hash_inputs(datainfo):
+    # Input
+    # > 'datainfo' : dict.
+    #
+    # Output
+    # > 'inputs' : dict of {str(key of datainfo): str(sha1)}.
+    #              Missing files are hashed as None.
+
+    inputs = dict()
+    for key in ('signal_xlsx', 'vehicle_input_xlsx', 'vehicle_routes_xlsx',
+                'vissim_inpx'):
+        path = Path(datainfo[key])
+        if not path.is_file():
+            inputs[key] = None
+            continue
+
+        sha1 = hashlib.sha1()
+        with path.open('rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        inputs[key] = sha1.hexdigest()
+
+    return inputs
+
+
+def append_run(file, datainfo, wall_time, elements, overall, per_interval):
+    # Input
+    # > 'file'          : Path of database file.
+    # > 'datainfo'      : dict.
+    # > 'wall_time'     : float or None. Wall time of the run [sec].
+    # > 'elements'      : dict of {str(kind): 1D list of str(name)}.
+    #                     kind is one of 'lane', 'link', 'section', 'node'.
+    # > 'overall'       : 1D list of (str(metric), str(kind), 1D list).
+    # > 'per_interval'  : 1D list of (str(metric), str(kind), 2D-list).
+    #                     Rows are evaluation intervals.
+    #
+    # Output
+    # > 'run_id' : int.
+    #
+    # Values follow the order of 'elements[kind]'. LOS is stored as 1 ~ 6,
+    # MISSING as NULL.
+
+    inputs = hash_inputs(datainfo)
+    input_hash = hashlib.sha1(
+        json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    conn = connect(file)
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (scenario, start_time, seed, interval, "
+                + "warmup, input_hash, inputs, settings, wall_time) "
+                + "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (datainfo['scenario'], datainfo['start_time'],
+                 datainfo['random_seed'], datainfo['evaluation_interval'],
+                 datainfo['warmup_time'], input_hash, json.dumps(inputs),
+                 json.dumps(datainfo, sort_keys=True, default=str),
+                 wall_time))
+            run_id = cursor.lastrowid
+
+            # Element ids, created on first use.
+            element_ids = dict()
+            for kind, names in elements.items():
+                conn.executemany(
+                    "INSERT OR IGNORE INTO elements (kind, name) VALUES (?, ?)",
+                    [(kind, name) for name in names])
+                ids = dict(conn.execute(
+                    "SELECT name, element_id FROM elements WHERE kind = ?",
+                    (kind,)))
+                element_ids[kind] = [ids[name] for name in names]
+
+            rows = []
+            for metric, kind, list_1D in overall:
+                for element_id, value in zip(element_ids[kind], list_1D):
+                    if value == MISSING:
+                        value = None
+                    rows.append((run_id, OVERALL, element_id, metric, value))
+            for metric, kind, list_2D in per_interval:
+                for index, list_1D in enumerate(list_2D):
+                    for element_id, value in zip(element_ids[kind], list_1D):
+                        if metric == 'LOS':
+                            value = cal.los_value(value)
+                        elif value == MISSING:
+                            value = None
+                        rows.append((run_id, index, element_id, metric, value))
+
+            conn.executemany(
+                "INSERT INTO metrics (run_id, interval, element_id, metric, "
+                + "value) VALUES (?, ?, ?, ?, ?)", rows)
+    finally:
+        conn.close()
+
+    logger.info(f"Run {run_id}: {len(rows)} values appended to {file}.")
+
+    return run_id
+
+
+def runs(db, scenario=None):
+    # Input
+    # > 'db'        : Path of database file or sqlite3.Connection.
+    # > 'scenario'  : str or None(all scenarios).
+    #
+    # Output
+    # > 1D list of dict. Metadata of each run in order of run_id.
+
+    with opened(db) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        if scenario is None:
+            result = cursor.execute("SELECT * FROM runs ORDER BY run_id")
+        else:
+            result = cursor.execute(
+                "SELECT * FROM runs WHERE scenario = ? ORDER BY run_id",
+                (scenario,))
+        return [dict(run) for run in result]
+
+
+def metric_keys(db, run_ids):
+    # Input
+    # > 'db'        : Path of database file or sqlite3.Connection.
+    # > 'run_ids'   : 1D list of int.
+    #
+    # Output
+    # > 1D list of (str(metric), str(kind), int(interval)) stored for any of
+    #   'run_ids', overall results first.
+
+    with opened(db) as conn:
+        return conn.execute(
+            "SELECT DISTINCT m.metric, e.kind, m.interval FROM metrics AS m "
+            + "JOIN elements AS e ON e.element_id = m.element_id "
+            + f"WHERE m.run_id IN ({', '.join('?' * len(run_ids))}) "
+            + "ORDER BY m.interval, m.metric", list(run_ids)).fetchall()
+
+
+def column_stats(db, run_ids):
+    # Input
+    # > 'db'        : Path of database file or sqlite3.Connection.
+    # > 'run_ids'   : 1D list of int.
+    #
+    # Output
+    # > dict of {(str(metric), str(kind), int(interval), str(element)):
+    #   list as stats.RunningStat.state()}, in order of interval, metric
+    #   and element.
+    #
+    # Count, mean, sum of squared differences from the mean, min and max of
+    # every element over 'run_ids', computed in SQL in one query. NULL and
+    # MISSING values are not counted.
+
+    sql = ("WITH selected AS (SELECT metric, interval, element_id, value "
+           + "FROM metrics "
+           + f"WHERE run_id IN ({', '.join('?' * len(run_ids))}) "
+           + "AND value IS NOT NULL AND value != ?), "
+           + "moments AS (SELECT metric, interval, element_id, "
+           + "COUNT(*) AS n, AVG(value) AS mean, MIN(value) AS low, "
+           + "MAX(value) AS high FROM selected "
+           + "GROUP BY metric, interval, element_id) "
+           + "SELECT m.metric, e.kind, m.interval, e.name, m.n, m.mean, "
+           + "SUM((s.value - m.mean) * (s.value - m.mean)), m.low, m.high "
+           + "FROM moments AS m "
+           + "JOIN selected AS s USING (metric, interval, element_id) "
+           + "JOIN elements AS e ON e.element_id = m.element_id "
+           + "GROUP BY m.metric, m.interval, m.element_id "
+           + "ORDER BY m.interval, m.metric, m.element_id")
+
+    with opened(db) as conn:
+        return {(metric, kind, interval, name): [count, mean, m2, low, high]
+                for metric, kind, interval, name, count, mean, m2, low, high
+                in conn.execute(sql, list(run_ids) + [MISSING])}
+
+
+def query(db, metric, scenario=None, interval=OVERALL, run_ids=None):
+    # Input
+    # > 'db'        : Path of database file or sqlite3.Connection.
+    # > 'metric'    : str. e.g. 'Delay', 'OccupRate', 'VehNum'.
+    # > 'scenario'  : str or None(all scenarios).
+    # > 'interval'  : int. Index of evaluation interval or OVERALL.
+    # > 'run_ids'   : 1D list of int or None(all runs).
+    #
+    # Output
+    # > 'result' : dict.
+    #   'run_ids'  : array('q'). Rows.
+    #   'elements' : 1D list of str. Columns.
+    #   'values'   : array('d') of len(run_ids) * len(elements), row-major.
+    #                NaN where a run has no value.
+    #
+    # Arrays share their buffer with NumPy without copying, e.g.
+    # numpy.frombuffer(result['values']).reshape(len(result['run_ids']), -1)
+
+    # Rows and columns are numbered in SQL, so Python only places values.
+    where = "WHERE m.metric = ? AND m.interval = ?"
+    params = [metric, interval]
+    if scenario is not None:
+        where += " AND r.scenario = ?"
+        params.append(scenario)
+    if run_ids is not None:
+        where += f" AND m.run_id IN ({', '.join('?' * len(run_ids))})"
+        params.extend(run_ids)
+    selected = ("WITH selected AS (SELECT m.run_id, m.element_id, m.value "
+                + "FROM metrics AS m "
+                + "JOIN runs AS r ON r.run_id = m.run_id " + where + ") ")
+
+    with opened(db) as conn:
+        rows = array('q', (run_id for run_id, in conn.execute(
+            selected + "SELECT DISTINCT run_id FROM selected ORDER BY run_id",
+            params)))
+        columns = [name for name, in conn.execute(
+            selected + "SELECT e.name FROM elements AS e WHERE e.element_id "
+            + "IN (SELECT element_id FROM selected) ORDER BY e.element_id",
+            params)]
+        cells = conn.execute(
+            selected + "SELECT cell, value FROM (SELECT "
+            + "(DENSE_RANK() OVER (ORDER BY run_id) - 1) * ? "
+            + "+ DENSE_RANK() OVER (ORDER BY element_id) - 1 AS cell, value "
+            + "FROM selected) WHERE value IS NOT NULL",
+            params + [len(columns)]).fetchall()
+
+    values = array('d', [math.nan]) * (len(rows) * len(columns))
+    for index, value in cells:
+        values[index] = value
+
+    return {'run_ids': rows,
+            'elements': columns,
+            'values': values}
@@ -3,11 +3,9 @@
 # ==========================================================================
 import json
 import logging
-import logging.config
-import sys
+import math
+from pathlib import Path
 
-config = json.load(open("resources/logger.json"))
-logging.config.dictConfig(config)
 logger = logging.getLogger(__name__)
 
 
@@ -30,19 +28,30 @@ def _get_AttValue_num(item, attribute):
     return value
 
 
-def progressbar(it, prefix="", size=60, out=sys.stdout):
-    # https://stackoverflow.com/a/34482761/14257620
-    count = len(it)
+def _apply_sigind(Vissim, sigcon):
+    # Input
+    # > 'sigcon' : SigControl() with self.Applied.
+    #
+    # Set signals of 'sigcon' to 'sigcon.SigInd[sigcon.Applied]'.
+
+    # Find appropriate Signal Controller.
+    SC_Iter = Vissim.Net.SignalControllers.Iterator
+    while SC_Iter.Valid:
+        if SC_Iter.Item.AttValue('Name') == sigcon.Name:
+            break
+        SC_Iter.Next()
 
-    def show(j):
-        x = int(size*j/count)
-        print(f"{prefix}[{u'█'*x}{('.'*(size-x))}] {j}/{count}", end='\r', file=out, flush=True)
+    # Find appropriate signal indicator set.
+    signal_Iter = iter(sigcon.SigInd[sigcon.Applied])
 
-    show(0)
-    for i, item in enumerate(it):
-        yield item
-        show(i+1)
-    print("\n", flush=True, file=out)
+    # Set signals.
+    SG_Iter = SC_Iter.Item.SGs.Iterator
+    while SG_Iter.Valid:
+        signal = next(signal_Iter)
+        SG_Iter.Item.SetAttValue('SigState', signal)
+        SG_Iter.Next()
+
+    return
 
 
 def set_signal(Vissim, list_of_sigcon, break_at):
@@ -60,26 +69,82 @@ def set_signal(Vissim, list_of_sigcon, break_at):
         except ValueError:
             continue
 
-        # Find appropriate Signal Controller.
-        SC_Iter = Vissim.Net.SignalControllers.Iterator
-        while SC_Iter.Valid:
-            if SC_Iter.Item.AttValue('Name') == sigcon.Name:
-                break
-            SC_Iter.Next()
+        sigcon.Applied = index % len(sigcon.SigInd)
+        _apply_sigind(Vissim, sigcon)
+
+    return
+
+
+def restore_signal(Vissim, list_of_sigcon, applied):
+    # Input
+    # > 'list_of_sigcon'    : 1D-list of SigControl().
+    # > 'applied'           : dict of {str(Name): int(index of SigInd)}.
+    #
+    # Set signals which were set when 'applied' was saved.
 
-        # Find appropriate signal indicator set.
-        signal_Iter = iter(sigcon.SigInd[index % len(sigcon.SigInd)])
+    for sigcon in list_of_sigcon:
+        sigcon.Applied = applied.get(sigcon.Name)
+        if sigcon.Applied is not None:
+            _apply_sigind(Vissim, sigcon)
+
+    return
 
-        # Set signals.
-        SG_Iter = SC_Iter.Item.SGs.Iterator
-        while SG_Iter.Valid:
-            signal = next(signal_Iter)
-            SG_Iter.Item.SetAttValue('SigState', signal)
-            SG_Iter.Next()
+
+def save_checkpoint(Vissim, directory, break_index, list_of_sigcon,
+                    aggregator, datainfo, sampler=None):
+    # Input
+    # > 'directory'         : Directory of checkpoints. <class 'pathlib.Path'>.
+    # > 'break_index'       : int. Index of the last finished breakpoint.
+    # > 'list_of_sigcon'    : 1D-list of SigControl().
+    # > 'aggregator'        : IntervalAggregator().
+    # > 'datainfo'          : dict.
+    # > 'sampler'           : livekpi.LiveSampler() or None.
+    #
+    # Save a Vissim snapshot and the state of the runner.
+    # 'checkpoint.json' always refers to the latest checkpoint.
+
+    directory.mkdir(parents=True, exist_ok=True)
+    sim_sec = int(Vissim.Simulation.AttValue('SimSec'))
+    snapshot = directory/f'snapshot_{sim_sec}.snp'
+    Vissim.Simulation.SaveSnapshot(str(snapshot))
+
+    state = {'sim_sec': sim_sec,
+             'break_index': break_index,
+             'snapshot': str(snapshot),
+             'applied': {sigcon.Name: sigcon.Applied
+                         for sigcon in list_of_sigcon},
+             'aggregator': aggregator.state(),
+             'sampler': sampler.state() if sampler is not None else None,
+             'datainfo': datainfo}
+
+    # Replace at once, so that a crash while writing keeps the previous one.
+    temp = directory/'checkpoint.json.tmp'
+    with temp.open('w', encoding='UTF8') as f:
+        json.dump(state, f)
+    temp.replace(directory/'checkpoint.json')
+
+    logger.info(f"Checkpoint saved at {sim_sec} sec.")
 
     return
 
 
+def load_checkpoint(directory):
+    # Input
+    # > 'directory' : Directory of checkpoints. <class 'pathlib.Path'>.
+    #
+    # Output
+    # > dict. State saved by save_checkpoint().
+
+    with (directory/'checkpoint.json').open('r', encoding='UTF8') as f:
+        state = json.load(f)
+
+    if not Path(state['snapshot']).exists():
+        logger.error("load_checkpoint():\t"
+                     + f"Snapshot {state['snapshot']} is missing.")
+
+    return state
+
+
 def extract_from_datacollection_per_hour(Vissim, time_str, VehNum_hour,
                                          OccupRate_hour):
     # Input
@@ -155,3 +220,140 @@ def extract_from_travtm_per_hour(Vissim, time_str, AvgSpeed_hour):
     # through the TT.
 
     return
+
+
+def extract_completed_intervals(Vissim, sim_sec, aggregator):
+    # Input
+    # > 'sim_sec'       : int. Current simulation second.
+    # > 'aggregator'    : IntervalAggregator().
+    #
+    # Push every evaluation interval completed until 'sim_sec' to
+    # 'aggregator'.
+
+    while (not aggregator.done()) and aggregator.next_end() <= sim_sec:
+        time_str = str(aggregator.Count + 1)
+
+        VehNum, OccupRate, QStop, AvgSpeed = [], [], [], []
+        extract_from_datacollection_per_hour(Vissim, time_str, VehNum,
+                                             OccupRate)
+        extract_from_queue_per_hour(Vissim, time_str, QStop)
+        extract_from_travtm_per_hour(Vissim, time_str, AvgSpeed)
+
+        aggregator.push(VehNum[0], OccupRate[0], QStop[0], AvgSpeed[0])
+
+    return
+
+
+def _get_MultiAttValues_num(container, attribute):
+    # Input
+    # > 'container' : CDispatch. Collection of Vissim elements.
+    # > 'attribute' : str.
+    #
+    # Output
+    # > 1D-list of non-negative numbers, in the order of Iterator.
+    #
+    # _get_AttValue_num() of all elements in a single COM call.
+
+    values = []
+    for _, value in container.GetMultiAttValues(attribute):
+        if value is None:
+            value = 0
+        elif value < 0:
+            logger.error("_get_MultiAttValues_num():\t"
+                         + "Negative AttValue has been detected.")
+        values.append(value)
+
+    return values
+
+
+def _run_interval(Vissim, run_no, interval, Dist):
+    # Input
+    # > 'run_no'    : int. No of a finished simulation run.
+    # > 'interval'  : int. No of an evaluation interval, from 1.
+    # > 'Dist'      : 1D-list of 'Dist' of travel time measurements.
+    #
+    # Output
+    # > (VehNum, OccupRate, QStop, AvgSpeed) of 'interval' of 'run_no', each
+    #   read for all elements at once.
+
+    DCs = Vissim.Net.DataCollectionMeasurements
+    QCs = Vissim.Net.QueueCounters
+    TTs = Vissim.Net.VehicleTravelTimeMeasurements
+    subattr = f'({run_no},{interval},All)'
+
+    VehNum = _get_MultiAttValues_num(DCs, f'Vehs{subattr}')
+    OccupRate = [value * 100 for value
+                 in _get_MultiAttValues_num(DCs, f'OccupRate{subattr}')]
+    QStop = _get_MultiAttValues_num(QCs, f'QStops({run_no},{interval})')
+    # km/h. -1 means that there was no vehicles passing through the TT.
+    AvgSpeed = [dist / travtm * 18 / 5 if travtm else -1
+                for dist, travtm
+                in zip(Dist, _get_MultiAttValues_num(TTs,
+                                                     f'TravTm{subattr}'))]
+
+    return VehNum, OccupRate, QStop, AvgSpeed
+
+
+def extract_run_intervals(Vissim, run_no, aggregator):
+    # Input
+    # > 'run_no'        : int. No of a finished simulation run.
+    # > 'aggregator'    : IntervalAggregator().
+    #
+    # Push every evaluation interval of simulation run 'run_no' to
+    # 'aggregator'.
+
+    Dist = _get_MultiAttValues_num(Vissim.Net.VehicleTravelTimeMeasurements,
+                                   'Dist')
+    while not aggregator.done():
+        aggregator.push(*_run_interval(Vissim, run_no, aggregator.Count + 1,
+                                       Dist))
+
+    return
+
+
+def network_arrivals(Vissim, run_no):
+    # Input
+    # > 'run_no' : int. No of a finished simulation run.
+    #
+    # Output
+    # > int. Vehicles which left the network after warm-up in 'run_no',
+    #   from vehicle network performance. Each vehicle is counted once,
+    #   however many signal heads it passed.
+
+    arrived = Vissim.Net.VehicleNetworkPerformanceMeasurement.AttValue(
+        f'VehArr({run_no},Total,All)')
+
+    return int(arrived) if arrived is not None else 0
+
+
+def compare_current_run(Vissim, run_no, num_intervals):
+    # Input
+    # > 'run_no'        : int. No of the last finished simulation run.
+    # > 'num_intervals' : int.
+    #
+    # Output
+    # > 1D-list of (str(metric), int(interval)). Intervals whose results of
+    #   'run_no', as extract_run_intervals() reads them, differ from results
+    #   of 'Current', as extract_completed_intervals() reads them.
+
+    Dist = _get_MultiAttValues_num(Vissim.Net.VehicleTravelTimeMeasurements,
+                                   'Dist')
+
+    mismatches = []
+    for interval in range(1, num_intervals + 1):
+        VehNum, OccupRate, QStop, AvgSpeed = [], [], [], []
+        extract_from_datacollection_per_hour(Vissim, str(interval), VehNum,
+                                             OccupRate)
+        extract_from_queue_per_hour(Vissim, str(interval), QStop)
+        extract_from_travtm_per_hour(Vissim, str(interval), AvgSpeed)
+
+        by_run = _run_interval(Vissim, run_no, interval, Dist)
+        for metric, current, values in zip(
+                ('VehNum', 'OccupRate', 'QStop', 'AvgSpeed'),
+                (VehNum[0], OccupRate[0], QStop[0], AvgSpeed[0]), by_run):
+            if len(current) != len(values) or not all(
+                    math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+                    for a, b in zip(current, values)):
+                mismatches.append((metric, interval))
+
+    return mismatches
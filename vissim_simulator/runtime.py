@@ -0,0 +1,125 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import json
+import logging
+from pathlib import Path
+
+RESOURCES = Path(__file__).resolve().parent/'resources'
+LOG_DIR = Path(__file__).resolve().parent/'log'
+
+_initialized = False
+
+# comtrace.Recorder() or comtrace.Replayer() while COM calls are traced.
+_trace = None
+
+
+def init(log_dir=LOG_DIR):
+    # Input
+    # > 'log_dir' : Directory of log files. <class 'pathlib.Path'>.
+    #
+    # Initialize the runtime once: logging configuration.
+    # Only entry points call this function. Other modules just call
+    # logging.getLogger(__name__), so that importing them costs nothing.
+
+    global _initialized
+    if _initialized:
+        return
+
+    import logging.config
+
+    log_dir = Path(log_dir)
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    with (RESOURCES/'logger.json').open('r', encoding='UTF8') as f:
+        config = json.load(f)
+
+    # File handlers are relative to 'log_dir', not to the current directory.
+    for handler in config['handlers'].values():
+        if 'filename' in handler:
+            handler['filename'] = str(log_dir/Path(handler['filename']).name)
+
+    logging.config.dictConfig(config)
+    _initialized = True
+
+    return
+
+
+def dispatch(prog_id):
+    # Input
+    # > 'prog_id' : str. ex) "Vissim.Vissim", "Excel.Application"
+    #
+    # Output
+    # > CDispatch.
+    #
+    # win32com is imported only when a COM server is actually needed.
+    # While replaying a trace, no COM server is needed at all.
+    # COM calls are counted while telemetry is on.
+
+    import telemetry
+
+    if _trace is not None and _trace.Replaying:
+        return telemetry.count_calls(_trace.dispatch(prog_id))
+
+    import win32com.client as com
+
+    if _trace is not None:
+        return telemetry.count_calls(
+            _trace.dispatch(prog_id, com.Dispatch(prog_id)))
+    return telemetry.count_calls(com.Dispatch(prog_id))
+
+
+def co_initialize():
+    # Initialize COM for the calling thread, unless replaying a trace.
+
+    if _trace is None or not _trace.Replaying:
+        import pythoncom
+        pythoncom.CoInitialize()
+
+    return
+
+
+def co_uninitialize():
+    if _trace is None or not _trace.Replaying:
+        import pythoncom
+        pythoncom.CoUninitialize()
+
+    return
+
+
+def start_trace(directory, replay=False):
+    # Input
+    # > 'directory' : Path of the trace directory.
+    # > 'replay'    : bool. Replay the trace in 'directory' instead of
+    #                 recording into it.
+    #
+    # COM calls of every later dispatch() are recorded or replayed.
+
+    global _trace
+    import comtrace
+
+    _trace = (comtrace.Replayer if replay else comtrace.Recorder)(directory)
+
+    return
+
+
+def stop_trace():
+    global _trace
+    if _trace is not None:
+        _trace.close()
+        _trace = None
+
+    return
+
+
+def com_file(path):
+    # Input
+    # > 'path' : str. Path of a file written by a COM server.
+    #
+    # Output
+    # > str. Path to read the file from. While replaying, it is the copy
+    #   kept in the trace.
+
+    if _trace is None:
+        return path
+    return _trace.file(path)
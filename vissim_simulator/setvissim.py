@@ -1,15 +1,12 @@
 # ==========================================================================
 # Author : HyeAnn Lee
 # ==========================================================================
-import json
 import logging
-import logging.config
 import math
 import random
+import time
 from pathlib import Path
 
-config = json.load(open("resources/logger.json"))
-logging.config.dictConfig(config)
 logger = logging.getLogger(__name__)
 
 def _find_vissim_path():
@@ -122,6 +119,8 @@ def find_incoming_lane(Vissim, lanes_with_SH):
 
 def set_Vissim(Vissim, data):
     # Evaluation
+    # Results of previous runs are kept until pipeline.discard_runs(), so that
+    # all runs of a multi-run can be read.
     Vissim.Evaluation.SetAttValue('KeepPrevResults', 1)
 
     Vissim.Evaluation.SetAttValue('DataCollCollectData',    True)
@@ -129,12 +128,21 @@ def set_Vissim(Vissim, data):
     Vissim.Evaluation.SetAttValue('NodeResCollectData',     True)
     Vissim.Evaluation.SetAttValue('QueuesCollectData',      True)
     Vissim.Evaluation.SetAttValue('VehTravTmsCollectData',  True)
+    Vissim.Evaluation.SetAttValue('VehNetPerfCollectData',  True)
 
-    Vissim.Evaluation.SetAttValue('DataCollInterval',   3600)
+    interval = data['evaluation_interval']
+    Vissim.Evaluation.SetAttValue('DataCollInterval',   interval)
     Vissim.Evaluation.SetAttValue('LinkResInterval',    99999)
-    Vissim.Evaluation.SetAttValue('NodeResInterval',    3600)
-    Vissim.Evaluation.SetAttValue('QueuesInterval',     3600)
-    Vissim.Evaluation.SetAttValue('VehTravTmsInterval', 3600)
+    Vissim.Evaluation.SetAttValue('NodeResInterval',    interval)
+    Vissim.Evaluation.SetAttValue('QueuesInterval',     interval)
+    Vissim.Evaluation.SetAttValue('VehTravTmsInterval', interval)
+    Vissim.Evaluation.SetAttValue('VehNetPerfInterval', 99999)
+
+    # Evaluations start after warm-up.
+    for evaluation in ('DataColl', 'LinkRes', 'NodeRes', 'Queues',
+                       'VehTravTms', 'VehNetPerf'):
+        Vissim.Evaluation.SetAttValue(f'{evaluation}FromTime',
+                                      data['warmup_time'])
 
     # Net
     Vissim.Net.NetPara.SetAttValue('UnitAccel', 0)          # m/s^2
@@ -173,20 +181,18 @@ def set_link_segment(Vissim):
     return
 
 
-def set_queue_counter(Vissim, lanes_with_SH):
+def _plan_queue_counter(lanes_with_SH):
     # Input
     # > 'lanes_with_SH' : 1D list of (int, int, double, double)
     #
-    # Set queue counters at links with signal head.
-
-    def _add_QC(Link):
-        key = Vissim.Net.QueueCounters.Count + 1
-        Vissim.Net.QueueCounters.AddQueueCounter(key, Link, QC[-1])
+    # Output
+    # > 'plan' : 1D list of (int, int, double)
+    #          = (key of QC, linkNo, pos of QC)
+    #
+    # Signal heads of the same link closer than 10m share one queue counter,
+    # which is placed at the last of them.
 
-    # Remove existing QC
-    All_QCs = Vissim.Net.QueueCounters.GetAll()
-    for QC in All_QCs:
-        Vissim.Net.QueueCounters.RemoveQueueCounter(QC)
+    plan = []
 
     # 'SHs'
     SHs = []
@@ -197,7 +203,6 @@ def set_queue_counter(Vissim, lanes_with_SH):
             SHs[-1].append(pos)
 
     # 'SHs' becomes a list of [linkNo, pos1, pos2, ..., posN].
-    # Set New QC.
     for linkNo, *pos_list in SHs:
         pos_list.sort()
 
@@ -207,12 +212,42 @@ def set_queue_counter(Vissim, lanes_with_SH):
                 QC.append(Pos)
             else:   # abs(QC[-1] - pos) >= 10
                 # Set QueueCounter for previous 'Pos'es.
-                _add_QC(Vissim.Net.Links.ItemByKey(linkNo))
+                plan.append((len(plan) + 1, linkNo, QC[-1]))
 
                 # Reset 'QC' to current 'Pos'.
                 QC = [Pos]
 
-        _add_QC(Vissim.Net.Links.ItemByKey(linkNo))
+        plan.append((len(plan) + 1, linkNo, QC[-1]))
+
+    return plan
+
+
+def set_queue_counter(Vissim, lanes_with_SH):
+    # Input
+    # > 'lanes_with_SH' : 1D list of (int, int, double, double)
+    #
+    # Set queue counters at links with signal head.
+
+    start = time.perf_counter()
+
+    # Keys and positions are computed first, so that no COM call is needed
+    # between consecutive additions.
+    plan = _plan_queue_counter(lanes_with_SH)
+
+    QCs = Vissim.Net.QueueCounters
+    Links = Vissim.Net.Links
+
+    # Remove existing QC
+    for QC in QCs.GetAll():
+        QCs.RemoveQueueCounter(QC)
+
+    # Set New QC.
+    for key, linkNo, pos in plan:
+        QCs.AddQueueCounter(key, Links.ItemByKey(linkNo), pos)
+
+    logger.debug(f"set_queue_counter():\t{len(plan)} queue counters for "
+                 + f"{len(lanes_with_SH)} lanes in "
+                 + f"{time.perf_counter() - start:.3f} sec.")
 
     return
 
@@ -223,30 +258,38 @@ def set_data_collection(Vissim, lanes_with_SH):
     #
     # Set data collection points at lanes with signal head.
 
+    start = time.perf_counter()
+
+    DCPs = Vissim.Net.DataCollectionPoints
+    DCMs = Vissim.Net.DataCollectionMeasurements
+    Links = Vissim.Net.Links
+
     # Remove existing DC
-    All_DCPs = Vissim.Net.DataCollectionPoints.GetAll()
-    for DCP in All_DCPs:
-        Vissim.Net.DataCollectionPoints.RemoveDataCollectionPoint(DCP)
+    for DCP in DCPs.GetAll():
+        DCPs.RemoveDataCollectionPoint(DCP)
 
     # Remove existing DC measurements
-    All_DCMs = Vissim.Net.DataCollectionMeasurements.GetAll()
-    for DCM in All_DCMs:
-        Vissim.Net.DataCollectionMeasurements.\
-            RemoveDataCollectionMeasurement(DCM)
+    for DCM in DCMs.GetAll():
+        DCMs.RemoveDataCollectionMeasurement(DCM)
+
+    # Data collection point 'key' is located 1.6m before the 'key'-th signal
+    # head, and is the only point of measurement 'key'.
+    keys = range(1, len(lanes_with_SH) + 1)
 
     # Set New DC and DC measurements
-    for linkNo, laneNo, pos, _ in lanes_with_SH:
-        key = Vissim.Net.DataCollectionPoints.Count + 1
+    for key, (linkNo, laneNo, pos, _) in zip(keys, lanes_with_SH):
+        lane = Links.ItemByKey(linkNo).Lanes.ItemByKey(laneNo)
+        DCPs.AddDataCollectionPoint(key, lane, pos - 1.6)
+        DCMs.AddDataCollectionMeasurement(key)
 
-        # data collection point
-        lane = Vissim.Net.Links.ItemByKey(linkNo).Lanes.ItemByKey(laneNo)
-        Vissim.Net.DataCollectionPoints.AddDataCollectionPoint(
-                                            key, lane, pos - 1.6)
+    # Assign points to measurements at once.
+    # Measurements are ordered by key, which is the same order as 'keys'.
+    DCMs.SetMultipleAttributes(('DataCollectionPoints',),
+                               tuple((key,) for key in keys))
 
-        # data collection measurement
-        Vissim.Net.DataCollectionMeasurements.AddDataCollectionMeasurement(key)
-        Vissim.Net.DataCollectionMeasurements.\
-            ItemByKey(key).SetAttValue('DataCollectionPoints', key)
+    logger.debug(f"set_data_collection():\t{len(keys)} data collections for "
+                 + f"{len(lanes_with_SH)} lanes in "
+                 + f"{time.perf_counter() - start:.3f} sec.")
 
     return
 
@@ -464,6 +507,37 @@ def set_vehicleinput(Vissim, data, VehicleInput):
     return
 
 
+def scale_vehicleinput(Vissim, VehicleInput, scale):
+    # Input
+    # > 'VehicleInput'  : 1D-list of VehInput() set by set_vehicleinput().
+    # > 'scale'         : float. 1.0 is the demand of VehicleInput.xlsx.
+    #
+    # Change only volumes of vehicle inputs set by set_vehicleinput(), with
+    # one bulk call per time interval. Models, distributions, vehicle types
+    # and compositions are kept.
+
+    VIs = Vissim.Net.VehicleInputs
+    # set_vehicleinput() keys each vehicle input by its link number, but the
+    # first column of SetMultiAttValues is the position of an input in the
+    # container, not its key.
+    positions = {int(no): position
+                 for position, no in VIs.GetMultiAttValues('No')}
+    missing = [info.LinkNo for info in VehicleInput[0].VehInfo
+               if info.LinkNo not in positions] if VehicleInput else []
+    if missing:
+        logger.error("scale_vehicleinput():\t"
+                     + f"No vehicle input on links {missing}.")
+        return
+
+    for index_timeint, vehinput in enumerate(VehicleInput):
+        VIs.SetMultiAttValues(
+            f'Volume({index_timeint + 1})',
+            tuple((positions[info.LinkNo], scale * sum(info.VehComp))
+                  for info in vehinput.VehInfo))
+
+    return
+
+
 def set_static_vehicle_route(Vissim, Static_Vehicle_Routes):
     column_names = Static_Vehicle_Routes[0]
     id1 = column_names.index('VehRoutDec'.upper())
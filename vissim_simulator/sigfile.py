@@ -0,0 +1,283 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import bisect
+import logging
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Signals of Signal.xlsx and their states in Vissim.
+STATES = {'R': 'RED', 'G': 'GREEN', 'Y': 'AMBER'}
+
+# Signal displays of a .sig file.
+DISPLAYS = {'R': 1, 'G': 3, 'Y': 4}
+
+# Planned signals are states, see setvissim.convert_signal_to_enum().
+_SIGNALS = {state: signal for signal, state in STATES.items()}
+
+# Signal sequence whose states are all switched by commands.
+SEQUENCE = 7
+
+
+def timeline(sigcon, simulation_len):
+    # Input
+    # > 'sigcon'            : SigControl() planned by pipeline.plan_signal().
+    # > 'simulation_len'    : int. simulation period in seconds.
+    #
+    # Output
+    # > 1D-list of (int(sec), int(index of SigInd)), sorted by sec.
+    #
+    # The signal states runsimul.set_signal() applies during a run. At each
+    # break the first matching index of 'sigcon.BreakAt' is applied.
+
+    changes = dict()
+    for index, sec in enumerate(sigcon.BreakAt):
+        sec = int(sec)
+        if sec < simulation_len and sec not in changes:
+            changes[sec] = index % len(sigcon.SigInd)
+
+    return sorted(changes.items())
+
+
+def _cycle(sigcon, changes, simulation_len):
+    # Input
+    # > 'sigcon'            : SigControl().
+    # > 'changes'           : 1D-list returned by timeline().
+    # > 'simulation_len'    : int.
+    #
+    # Output
+    # > int. Cycle time [sec] of the program.
+    #
+    # A plan which repeats the same cycle for the whole period compiles into
+    # one cycle. Otherwise the program spans the whole period.
+
+    # The first step may be cut short by the offset, so it is left out.
+    num_steps = len(sigcon.SigInd)
+    BreakAt = [int(sec) for sec in sigcon.BreakAt]
+    periods = {BreakAt[i + num_steps] - BreakAt[i]
+               for i in range(1, len(BreakAt) - num_steps)}
+    if len(periods) != 1:
+        return simulation_len
+
+    period = periods.pop()
+    if period <= 0 or BreakAt[-1] < simulation_len:
+        # Signals stay as they are after the last time of Signal.xlsx.
+        return simulation_len
+
+    secs = [sec for sec, _ in changes]
+
+    def _state(sec):
+        return changes[bisect.bisect_right(secs, sec) - 1][1]
+
+    if any(_state(sec) != _state(sec % period) for sec, _ in changes):
+        return simulation_len
+
+    return period
+
+
+def display(signal):
+    # Input
+    # > 'signal' : 'R', 'G', 'Y' or its state in Vissim.
+    #
+    # Output
+    # > int. Display of 'signal' in a .sig file.
+
+    return DISPLAYS[_SIGNALS.get(signal, signal)]
+
+
+def compile_program(sigcon, simulation_len):
+    # Input
+    # > 'sigcon'            : SigControl() planned by pipeline.plan_signal().
+    # > 'simulation_len'    : int.
+    #
+    # Output
+    # > 'cycle'     : int. Cycle time [sec].
+    # > 'commands'  : dict of {int(SG No): 1D-list of (int(sec), int(display))}.
+
+    changes = timeline(sigcon, simulation_len)
+    cycle = _cycle(sigcon, changes, simulation_len)
+
+    commands = dict()
+    for sg_index in range(len(sigcon.SigInd[0])):
+        if sigcon.SigInd[0][sg_index] is None:
+            continue        # Signal group not in Signal.xlsx.
+
+        cmds = []
+        for sec, step in changes:
+            if sec >= cycle:
+                break
+            sg_display = display(sigcon.SigInd[step][sg_index])
+            if not cmds or cmds[-1][1] != sg_display:
+                cmds.append((sec, sg_display))
+        commands[sg_index + 1] = cmds
+
+    return cycle, commands
+
+
+def expand(cycle, cmds, simulation_len):
+    # Input
+    # > 'cycle'             : int. Cycle time [sec].
+    # > 'cmds'              : 1D-list of (int(sec), int(display)) of a signal
+    #                         group, returned by compile_program().
+    # > 'simulation_len'    : int.
+    #
+    # Output
+    # > 1D-list of int. Display of every second, as a fixed time controller
+    #   runs the program. Before the first command of a cycle, the last
+    #   display of the previous cycle goes on.
+
+    secs = [sec for sec, _ in cmds]
+    displays = []
+    for sec in range(simulation_len):
+        index = bisect.bisect_right(secs, sec % cycle) - 1
+        displays.append(cmds[index][1])
+
+    return displays
+
+
+def verify(sigcon, simulation_len):
+    # Input
+    # > 'sigcon'            : SigControl() planned by pipeline.plan_signal().
+    # > 'simulation_len'    : int.
+    #
+    # Output
+    # > 1D-list of (int(SG No), int(sec)). Seconds at which the compiled
+    #   program differs from signals set at breaks.
+
+    changes = timeline(sigcon, simulation_len)
+    secs = [sec for sec, _ in changes]
+    cycle, commands = compile_program(sigcon, simulation_len)
+
+    mismatches = []
+    for sg_no, cmds in commands.items():
+        for sec, sg_display in enumerate(expand(cycle, cmds, simulation_len)):
+            step = changes[bisect.bisect_right(secs, sec) - 1][1]
+            if display(sigcon.SigInd[step][sg_no - 1]) != sg_display:
+                mismatches.append((sg_no, sec))
+
+    return mismatches
+
+
+def to_xml(sigcon, cycle, commands):
+    # Input
+    # > 'sigcon'    : SigControl().
+    # > 'cycle', 'commands' : Returned by compile_program().
+    #
+    # Output
+    # > ElementTree of a fixed time signal controller file (.sig).
+    #   Times are in milliseconds.
+
+    sc = ET.Element('sc', id="1", name=sigcon.Name, frequency="1", steps="0",
+                    defaultIntergreenMatrix="0")
+
+    displays = ET.SubElement(sc, 'signaldisplays')
+    for signal, sg_display in DISPLAYS.items():
+        ET.SubElement(displays, 'display', id=str(sg_display),
+                      name=STATES[signal], state=STATES[signal])
+
+    sequences = ET.SubElement(sc, 'signalsequences')
+    sequence = ET.SubElement(sequences, 'signalsequence', id=str(SEQUENCE),
+                             name="Red-Green-Amber")
+    for signal in ('R', 'G', 'Y'):
+        ET.SubElement(sequence, 'state', display=str(DISPLAYS[signal]),
+                      isFixedDuration="false", isClosed=str(
+                          signal != 'G').lower(), defaultDuration="1000")
+
+    sgs = ET.SubElement(sc, 'sgs')
+    for sg_no in commands:
+        ET.SubElement(sgs, 'sg', id=str(sg_no), name=f"SG {sg_no}",
+                      defaultSignalSequence=str(SEQUENCE))
+
+    ET.SubElement(sc, 'intergreenmatrices')
+
+    progs = ET.SubElement(sc, 'progs')
+    prog = ET.SubElement(progs, 'prog', id="1", cycletime=str(cycle * 1000),
+                         switchpoint="0", offset="0", intergreens="0",
+                         name=f"{sigcon.Name} from Signal.xlsx")
+    prog_sgs = ET.SubElement(prog, 'sgs')
+    for sg_no, cmds in commands.items():
+        sg = ET.SubElement(prog_sgs, 'sg', sg_id=str(sg_no),
+                           signal_sequence=str(SEQUENCE))
+        cmds_element = ET.SubElement(sg, 'cmds')
+        for sec, sg_display in cmds:
+            ET.SubElement(cmds_element, 'cmd', display=str(sg_display),
+                          begin=str(sec * 1000))
+        ET.SubElement(sg, 'fixedstates')
+
+    for name in ('stages', 'interstageProgs', 'stageProgs',
+                 'dailyProgLists'):
+        ET.SubElement(sc, name)
+
+    return ET.ElementTree(sc)
+
+
+def write_sig_files(Signal, simulation_len, directory):
+    # Input
+    # > 'Signal'            : 1D-list of SigControl() planned by
+    #                         pipeline.plan_signal().
+    # > 'simulation_len'    : int.
+    # > 'directory'         : <class 'pathlib.Path'>.
+    #
+    # Output
+    # > 'sig_files' : dict of {str(Name): str(absolute path of .sig)}.
+
+    directory.mkdir(parents=True, exist_ok=True)
+
+    sig_files = dict()
+    for sigcon in Signal:
+        mismatches = verify(sigcon, simulation_len)
+        if mismatches:
+            logger.error("write_sig_files():\t"
+                         + f"Program of {sigcon.Name} differs from signals "
+                         + f"set at breaks at {len(mismatches)} seconds, "
+                         + f"first at {mismatches[0][1]} sec (SG "
+                         + f"{mismatches[0][0]}).")
+
+        cycle, commands = compile_program(sigcon, simulation_len)
+        filename = Path(directory).absolute()/f"{sigcon.Name}.sig"
+        to_xml(sigcon, cycle, commands).write(filename, encoding='UTF-8',
+                                              xml_declaration=True)
+        sig_files[sigcon.Name] = str(filename)
+
+        logger.info(f"{sigcon.Name}: {cycle} sec program, "
+                    + f"{sum(len(cmds) for cmds in commands.values())} "
+                    + "commands.")
+
+    return sig_files
+
+
+def attach_sig_files(Vissim, sig_files):
+    # Input
+    # > 'Vissim'    : CDispatch.
+    # > 'sig_files' : dict returned by write_sig_files().
+    #
+    # Run signal controllers of 'sig_files' as fixed time controllers of
+    # their .sig files, instead of through COM.
+
+    attached = set()
+    SC_Iter = Vissim.Net.SignalControllers.Iterator
+    while SC_Iter.Valid:
+        SC = SC_Iter.Item
+        name = SC.AttValue('Name')
+        if name in sig_files:
+            SC.SetAttValue('Type', 'FIXEDTIME')
+            SC.SetAttValue('SupplyFile2', sig_files[name])
+            SC.SetAttValue('ProgNo', 1)
+
+            # Give signal groups back to the controller.
+            SG_Iter = SC.SGs.Iterator
+            while SG_Iter.Valid:
+                SG_Iter.Item.SetAttValue('ContrByCOM', False)
+                SG_Iter.Next()
+
+            attached.add(name)
+        SC_Iter.Next()
+
+    missing = set(sig_files) - attached
+    if missing:
+        logger.error("attach_sig_files():\t"
+                     + f"No signal controller named {sorted(missing)}.")
+
+    return
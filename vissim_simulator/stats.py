@@ -0,0 +1,265 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import logging
+import math
+from array import array
+from statistics import NormalDist
+
+logger = logging.getLogger(__name__)
+
+
+def t_quantile(p, dof):
+    # Input
+    # > 'p'     : float in (0, 1).
+    # > 'dof'   : positive int. Degrees of freedom.
+    #
+    # Output
+    # > float. p-quantile of Student's t-distribution.
+    #
+    # Cornish-Fisher expansion around the normal quantile. Error is below
+    # 1% for dof >= 3, which is enough for confidence intervals.
+
+    z = NormalDist().inv_cdf(p)
+    g1 = (z**3 + z) / 4
+    g2 = (5*z**5 + 16*z**3 + 3*z) / 96
+    g3 = (3*z**7 + 19*z**5 + 17*z**3 - 15*z) / 384
+    g4 = (79*z**9 + 776*z**7 + 1482*z**5 - 1920*z**3 - 945*z) / 92160
+
+    return z + g1/dof + g2/dof**2 + g3/dof**3 + g4/dof**4
+
+
+class RunningStat:
+    def __init__(self):
+        # Running mean and variance of a scalar (Welford's algorithm).
+
+        self.Count = 0
+        self.Mean = 0.0
+        self.M2 = 0.0       # Sum of squared differences from the mean.
+        self.Min = math.inf
+        self.Max = -math.inf
+
+    def push(self, value):
+        # Input
+        # > 'value' : number.
+
+        self.Count += 1
+        delta = value - self.Mean
+        self.Mean += delta / self.Count
+        self.M2 += delta * (value - self.Mean)
+        self.Min = min(self.Min, value)
+        self.Max = max(self.Max, value)
+
+        return
+
+    def merge(self, other):
+        # Input
+        # > 'other' : RunningStat(). Values pushed elsewhere, ex) in a worker.
+        #
+        # Combine as if all values of 'other' were pushed here (Chan et al.).
+
+        count = self.Count + other.Count
+        if count == 0:
+            return
+        delta = other.Mean - self.Mean
+        self.M2 += other.M2 + delta**2 * self.Count * other.Count / count
+        self.Mean += delta * other.Count / count
+        self.Count = count
+        self.Min = min(self.Min, other.Min)
+        self.Max = max(self.Max, other.Max)
+
+        return
+
+    def state(self):
+        # Output
+        # > list. JSON serializable.
+
+        return [self.Count, self.Mean, self.M2, self.Min, self.Max]
+
+    def restore(self, state):
+        # Input
+        # > 'state' : list returned by state().
+
+        self.Count, self.Mean, self.M2, self.Min, self.Max = state
+
+        return
+
+    def variance(self):
+        # Output
+        # > float. Sample variance.
+
+        if self.Count < 2:
+            return math.inf
+        return self.M2 / (self.Count - 1)
+
+    def half_width(self, confidence=0.95):
+        # Input
+        # > 'confidence' : float in (0, 1).
+        #
+        # Output
+        # > float. Half width of the confidence interval of the mean.
+
+        if self.Count < 2:
+            return math.inf
+        t = t_quantile((1 + confidence) / 2, self.Count - 1)
+        return t * math.sqrt(self.variance() / self.Count)
+
+    def rel_precision(self, confidence=0.95):
+        # Output
+        # > float. Half width relative to the mean.
+
+        if self.Mean == 0:
+            return math.inf
+        return self.half_width(confidence) / abs(self.Mean)
+
+
+class GridStat:
+    def __init__(self, num_rows, num_cols):
+        # Input
+        # > 'num_rows'  : int. ex) The number of evaluation intervals.
+        # > 'num_cols'  : int. ex) The number of lanes.
+        #
+        # RunningStat() of every cell of a 2D-list, kept in flat arrays.
+        # Memory depends only on the size of the grid, not on the number of
+        # pushed 2D-lists.
+
+        self.NumRows = num_rows
+        self.NumCols = num_cols
+        size = num_rows * num_cols
+        self.Count = array('q', bytes(8 * size))
+        self.Mean = array('d', bytes(8 * size))
+        self.M2 = array('d', bytes(8 * size))
+        self.Min = array('d', [math.inf]) * size
+        self.Max = array('d', [-math.inf]) * size
+
+    def push(self, list_2D, missing=(-1, None, "")):
+        # Input
+        # > 'list_2D' : 2D-list of numbers of size (NumRows, NumCols).
+        # > 'missing' : Values which are not counted.
+        #
+        # A 2D-list of another size is not pushed, since its values would
+        # land in the wrong cells.
+
+        if len(list_2D) != self.NumRows:
+            logger.error("GridStat.push():\t" + f"{len(list_2D)} rows, "
+                         + f"expected {self.NumRows}.")
+            return
+        for row, list_1D in enumerate(list_2D):
+            if len(list_1D) != self.NumCols:
+                logger.error("GridStat.push():\t" + f"Row {row} has "
+                             + f"{len(list_1D)} columns, expected "
+                             + f"{self.NumCols}.")
+                return
+
+        count, mean, m2 = self.Count, self.Mean, self.M2
+        index = 0
+        for list_1D in list_2D:
+            for value in list_1D:
+                if value not in missing:
+                    count[index] += 1
+                    delta = value - mean[index]
+                    mean[index] += delta / count[index]
+                    m2[index] += delta * (value - mean[index])
+                    if value < self.Min[index]:
+                        self.Min[index] = value
+                    if value > self.Max[index]:
+                        self.Max[index] = value
+                index += 1
+
+        return
+
+    def merge(self, other):
+        # Input
+        # > 'other' : GridStat() of the same size.
+        #
+        # A GridStat() of another size is not merged, since its values would
+        # land in the wrong cells.
+
+        if (other.NumRows, other.NumCols) != (self.NumRows, self.NumCols):
+            logger.error("GridStat.merge():\t"
+                         + f"{other.NumRows} x {other.NumCols} grid, "
+                         + f"expected {self.NumRows} x {self.NumCols}.")
+            return
+
+        for index in range(len(self.Count)):
+            count = self.Count[index] + other.Count[index]
+            if count == 0:
+                continue
+            delta = other.Mean[index] - self.Mean[index]
+            self.M2[index] += (other.M2[index] + delta**2 * self.Count[index]
+                               * other.Count[index] / count)
+            self.Mean[index] += delta * other.Count[index] / count
+            self.Count[index] = count
+            self.Min[index] = min(self.Min[index], other.Min[index])
+            self.Max[index] = max(self.Max[index], other.Max[index])
+
+        return
+
+    def _to_2D(self, values):
+        return [list(values[row * self.NumCols:(row + 1) * self.NumCols])
+                for row in range(self.NumRows)]
+
+    def mean(self):
+        # Output
+        # > 2D-list of float. None where nothing was counted.
+
+        return self._to_2D([mean if count else None
+                            for count, mean in zip(self.Count, self.Mean)])
+
+    def variance(self):
+        # Output
+        # > 2D-list of float. Sample variance, None with less than 2 values.
+
+        return self._to_2D([m2 / (count - 1) if count > 1 else None
+                            for count, m2 in zip(self.Count, self.M2)])
+
+    def half_width(self, confidence=0.95):
+        # Output
+        # > 2D-list of float. Half width of the confidence interval of the
+        #   mean, None with less than 2 values.
+
+        return self._to_2D(
+            [t_quantile((1 + confidence) / 2, count - 1)
+             * math.sqrt(m2 / (count - 1) / count) if count > 1 else None
+             for count, m2 in zip(self.Count, self.M2)])
+
+    def summary(self, confidence=0.95):
+        # Output
+        # > dict of {str: 2D-list}.
+
+        return {'count': self._to_2D(self.Count),
+                'mean': self.mean(),
+                'half_width': self.half_width(confidence),
+                'min': self._to_2D([value if count else None for count, value
+                                    in zip(self.Count, self.Min)]),
+                'max': self._to_2D([value if count else None for count, value
+                                    in zip(self.Count, self.Max)])}
+
+    def state(self):
+        # Output
+        # > dict. JSON serializable.
+
+        return {'shape': [self.NumRows, self.NumCols],
+                'count': self.Count.tolist(),
+                'mean': self.Mean.tolist(),
+                'm2': self.M2.tolist(),
+                'min': [None if math.isinf(value) else value
+                        for value in self.Min],
+                'max': [None if math.isinf(value) else value
+                        for value in self.Max]}
+
+    @classmethod
+    def from_state(cls, state):
+        # Input
+        # > 'state' : dict returned by state().
+
+        grid = cls(*state['shape'])
+        grid.Count = array('q', state['count'])
+        grid.Mean = array('d', state['mean'])
+        grid.M2 = array('d', state['m2'])
+        grid.Min = array('d', [math.inf if value is None else value
+                               for value in state['min']])
+        grid.Max = array('d', [-math.inf if value is None else value
+                               for value in state['max']])
+
+        return grid
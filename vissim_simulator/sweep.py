@@ -0,0 +1,324 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import copy
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import random
+from pathlib import Path
+
+import manifest
+import pipeline
+import resultdb
+import runtime
+import setvissim
+
+logger = logging.getLogger(__name__)
+
+# Vissim of each worker process. Set by _init_worker().
+_worker = dict()
+
+
+def offset_candidates(spec, mode='grid', samples=20, seed=None):
+    # Input
+    # > 'spec'      : dict of {str(Name): [int(start), int(stop), int(step)]}
+    # > 'mode'      : 'grid', 'random' or 'lhs' (Latin hypercube).
+    # > 'samples'   : int. The number of candidates for 'random' and 'lhs'.
+    # > 'seed'      : int or None.
+    #
+    # Output
+    # > 1D-list of dict of {str(Name): int(offset)}.
+
+    names = list(spec)
+    rng = random.Random(seed)
+
+    if mode == 'grid':
+        axes = [range(start, stop + 1, step)
+                for start, stop, step in spec.values()]
+        return [dict(zip(names, values))
+                for values in itertools.product(*axes)]
+
+    if mode == 'random':
+        return [{name: rng.randint(start, stop)
+                 for name, (start, stop, _step) in spec.items()}
+                for _ in range(samples)]
+
+    if mode == 'lhs':
+        # Each controller's range is split into 'samples' strata, and every
+        # stratum is used exactly once.
+        columns = []
+        for start, stop, _step in spec.values():
+            width = (stop - start + 1) / samples
+            column = [start + int(width * (i + rng.random()))
+                      for i in range(samples)]
+            rng.shuffle(column)
+            columns.append(column)
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    logger.error(f"offset_candidates():\tInvalid mode '{mode}'.")
+    return []
+
+
+def make_plan(Signal, datainfo, offsets, inputs):
+    # Input
+    # > 'Signal'    : 1D-list of SigControl() as read from Excel.
+    # > 'datainfo'  : dict.
+    # > 'offsets'   : dict of {str(Name): int(offset)}.
+    # > 'inputs'    : dict returned by resultdb.hash_inputs(). Cached KPIs of
+    #                 edited input files are not used again.
+    #
+    # Output
+    # > 'plan'      : 1D-list of SigControl().
+    # > 'BreakAt'   : 1D-list of int.
+    # > 'key'       : str. Identifies the plan together with the inputs,
+    #                 seed, simulation period, warm-up and evaluation
+    #                 interval.
+    #
+    # Build a candidate signal plan in memory. 'Signal' is not modified.
+
+    plan = copy.deepcopy(Signal)
+
+    # Offsets beyond the cycle are the same as offsets within the cycle.
+    offsets = dict(offsets)
+    for sigcon in plan:
+        if sigcon.Name in offsets:
+            cycle = int(sum(sigcon.signal_time[:len(sigcon.SigInd)]))
+            offsets[sigcon.Name] %= cycle
+
+    BreakAt = pipeline.plan_signal(plan, datainfo['simulation_time'], offsets)
+
+    content = [inputs, datainfo['random_seed'], datainfo['simulation_time'],
+               datainfo['warmup_time'], datainfo['evaluation_interval'],
+               [(sigcon.Name, sigcon.SigInd, sigcon.signal_time)
+                for sigcon in plan]]
+    key = hashlib.sha1(json.dumps(content).encode()).hexdigest()
+
+    return plan, BreakAt, key
+
+
+def _init_worker(datainfo, VehicleInput, Static_Vehicle_Routes, base_plan,
+                 lock):
+    # Input
+    # > 'base_plan' : (list(Signal), list(BreakAt)) used during warm-up.
+    # > 'lock'      : multiprocessing.Lock(). Only one worker simulates
+    #                 warm-up, the others reuse its snapshot.
+    #
+    # Start and configure Vissim once per worker process.
+
+    runtime.init()
+    manifest.start(datainfo, 'sweep')
+    with manifest.step('init_worker'):
+        Vissim = pipeline.load_vissim(datainfo)
+        pipeline.set_vissim(Vissim, datainfo, VehicleInput,
+                            Static_Vehicle_Routes)
+
+        _worker['Vissim'] = Vissim
+        _worker['datainfo'] = datainfo
+        _worker['snapshot'] = None
+        if datainfo['warmup_time']:
+            with lock:
+                _worker['snapshot'] = pipeline.warmup_snapshot(
+                    Vissim, datainfo, *base_plan, Path().absolute())
+    manifest.flush()
+
+    return
+
+
+def _evaluate(candidate):
+    # Input
+    # > 'candidate' : (str(key), dict(offsets), list(plan), list(BreakAt))
+    #
+    # Output
+    # > (str(key), dict(offsets), dict(KPIs))
+
+    key, offsets, plan, BreakAt = candidate
+    datainfo = _worker['datainfo']
+
+    BreakAt = pipeline.add_interval_breakpoint(BreakAt, datainfo)
+
+    # Continue from the shared warm-up with signals of 'plan'.
+    checkpoint = None
+    if _worker['snapshot'] is not None:
+        checkpoint = pipeline.warmup_checkpoint(plan, BreakAt,
+                                                _worker['snapshot'],
+                                                datainfo['warmup_time'])
+
+    with manifest.step('evaluate'):
+        kpis = pipeline.simulate_replication(_worker['Vissim'], datainfo,
+                                             plan, BreakAt,
+                                             datainfo['random_seed'],
+                                             checkpoint)
+    manifest.flush()
+
+    return key, offsets, kpis
+
+
+def load_cache(file):
+    # Output
+    # > dict of {str(key): dict(KPIs)}
+
+    if not Path(file).exists():
+        return dict()
+    with open(file, 'r', encoding='UTF8') as f:
+        return json.load(f)
+
+
+def save_cache(file, cache):
+    temp = Path(f'{file}.tmp')
+    with temp.open('w', encoding='UTF8') as f:
+        json.dump(cache, f)
+    temp.replace(file)
+
+    return
+
+
+def run_sweep(datainfo, Signal, VehicleInput, Static_Vehicle_Routes):
+    # Input
+    # > 'datainfo'              : dict with a resolved 'random_seed'.
+    # > 'Signal'                : 1D-list of SigControl() as read from Excel.
+    # > 'VehicleInput'          : 1D-list of VehInput().
+    # > 'Static_Vehicle_Routes' : list returned by read_static_vehicle_routes.
+    #
+    # Output
+    # > 1D-list of dict. Candidates ranked by the objective, best first.
+    #
+    # Candidates are evaluated on a pool of Vissim workers. Plans found in
+    # the cache are not simulated again.
+
+    objective = datainfo['sweep_objective']
+    cache_file = datainfo['sweep_cache']
+    cache = load_cache(cache_file)
+
+    offsets_list = offset_candidates(datainfo['sweep_offsets'],
+                                     datainfo['sweep_mode'],
+                                     datainfo['sweep_samples'],
+                                     datainfo['sweep_seed'])
+
+    inputs = resultdb.hash_inputs(datainfo)
+    planned = []        # 1D-list of (dict(offsets), str(key))
+    pending = dict()    # Equal plans are simulated only once.
+    for offsets in offsets_list:
+        plan, BreakAt, key = make_plan(Signal, datainfo, offsets, inputs)
+        planned.append((offsets, key))
+        if (key not in cache) and (key not in pending):
+            pending[key] = (key, offsets, plan, BreakAt)
+    logger.info(f"Sweep:\t{len(offsets_list)} candidates, "
+                + f"{len(pending)} plans to simulate.")
+
+    # Signal plan of Signal.xlsx, which is used during warm-up.
+    base = copy.deepcopy(Signal)
+    base_plan = (base, pipeline.plan_signal(base, datainfo['simulation_time']))
+
+    if pending:
+        workers = min(datainfo['sweep_workers'], len(pending))
+        lock = multiprocessing.Lock()
+        with multiprocessing.Pool(workers, _init_worker,
+                                  (datainfo, VehicleInput,
+                                   Static_Vehicle_Routes, base_plan,
+                                   lock)) as pool:
+            for key, offsets, kpis in pool.imap_unordered(_evaluate,
+                                                          pending.values()):
+                cache[key] = kpis
+                save_cache(cache_file, cache)
+                logger.info(f"Sweep:\t{offsets} -> "
+                            + f"{objective} {kpis[objective]:.3f}")
+
+        if datainfo['warmup_time']:
+            saved = datainfo['warmup_time'] * (len(pending) - 1)
+            total = datainfo['simulation_time'] * len(pending)
+            logger.info(f"Sweep:\tShared warm-up saved {saved} of {total} "
+                        + "simulated seconds.")
+
+    results = [{'offsets': offsets, 'kpis': cache[key]}
+               for offsets, key in planned]
+    results.sort(key=lambda result: result['kpis'][objective],
+                 reverse=datainfo['sweep_maximize'])
+
+    return results
+
+
+def _init_demand_worker(datainfo, VehicleInput, Static_Vehicle_Routes):
+    # Start and configure Vissim once per worker process. Demand levels
+    # change only volumes of its vehicle inputs afterwards.
+
+    runtime.init()
+    manifest.start(datainfo, 'demand')
+    with manifest.step('init_worker'):
+        Vissim = pipeline.load_vissim(datainfo)
+        pipeline.set_vissim(Vissim, datainfo, VehicleInput,
+                            Static_Vehicle_Routes)
+
+        _worker['Vissim'] = Vissim
+        _worker['datainfo'] = datainfo
+        _worker['VehicleInput'] = VehicleInput
+    manifest.flush()
+
+    return
+
+
+def _evaluate_demand(level):
+    # Input
+    # > 'level' : (float(scale), list(Signal), list(BreakAt))
+    #
+    # Output
+    # > dict of {'scale': float, 'kpis': dict, 'per_interval': dict}
+
+    scale, Signal, BreakAt = level
+    datainfo = _worker['datainfo']
+
+    with manifest.step('evaluate'):
+        setvissim.scale_vehicleinput(_worker['Vissim'],
+                                     _worker['VehicleInput'], scale)
+
+        # Each level is a scenario of its own in the results database.
+        grids = dict()
+        kpis = pipeline.simulate_replication(
+            _worker['Vissim'],
+            dict(datainfo, scenario=f"{datainfo['scenario']} x{scale:g}"),
+            Signal, BreakAt, datainfo['random_seed'], None, grids)
+    manifest.flush()
+
+    # kpis['Throughput'] is the demand actually served: vehicles which left
+    # the network, each counted once.
+    per_interval = {metric: grid.mean() for metric, grid in grids.items()}
+
+    return {'scale': scale, 'kpis': kpis, 'per_interval': per_interval}
+
+
+def run_demand_sweep(datainfo, Signal, VehicleInput, Static_Vehicle_Routes):
+    # Input
+    # > 'datainfo'              : dict with a resolved 'random_seed'.
+    # > 'Signal'                : 1D-list of SigControl() as read from Excel.
+    # > 'VehicleInput'          : 1D-list of VehInput().
+    # > 'Static_Vehicle_Routes' : list returned by read_static_vehicle_routes.
+    #
+    # Output
+    # > 1D-list of dict returned by _evaluate_demand(), sorted by scale.
+    #
+    # Demand levels are simulated on a pool of Vissim workers, each of
+    # which configures the network only once. All levels use the same seed.
+
+    scales = sorted(set(datainfo['demand_scales']))
+    BreakAt = pipeline.add_interval_breakpoint(
+        pipeline.plan_signal(Signal, datainfo['simulation_time']), datainfo)
+    levels = [(scale, Signal, BreakAt) for scale in scales]
+    logger.info(f"Demand sweep:\t{len(levels)} levels.")
+
+    results = []
+    if levels:
+        workers = min(datainfo['demand_workers'], len(levels))
+        with multiprocessing.Pool(workers, _init_demand_worker,
+                                  (datainfo, VehicleInput,
+                                   Static_Vehicle_Routes)) as pool:
+            for result in pool.imap_unordered(_evaluate_demand, levels):
+                results.append(result)
+                logger.info(f"Demand sweep:\t{result['scale']:.0%} -> "
+                            + ", ".join(f"{kpi} {value:.3f}" for kpi, value
+                                        in result['kpis'].items()))
+
+    results.sort(key=lambda result: result['scale'])
+
+    return results
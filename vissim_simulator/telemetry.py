@@ -0,0 +1,284 @@
+# ==========================================================================
+# Author : HyeAnn Lee
+# ==========================================================================
+import contextlib
+import datetime
+import json
+import logging
+import sys
+import threading
+import time
+import types
+
+import manifest
+
+logger = logging.getLogger(__name__)
+
+# Telemetry of this process. Set by start().
+_active = None
+
+# Results of COM calls which are not COM objects.
+_PLAIN = (type(None), bool, int, float, str, datetime.datetime)
+
+
+class _Counter:
+    Calls = 0   # COM calls made through dispatched objects.
+
+
+def _count(value):
+    # Input
+    # > 'value' : Result of a COM call.
+    #
+    # Output
+    # > 'value' with COM objects wrapped in _Counted().
+
+    if isinstance(value, _PLAIN):
+        return value
+    if isinstance(value, (list, tuple)):
+        # Bulk results are rows of plain values. Only the first item is
+        # checked, so that they are returned as they are.
+        first = value[0] if value else None
+        if isinstance(first, (list, tuple)):
+            first = first[0] if first else None
+        if isinstance(first, _PLAIN):
+            return value
+        return type(value)(_count(item) for item in value)
+    return _Counted(value)
+
+
+def _unwrap(value):
+    if isinstance(value, _Counted):
+        return object.__getattribute__(value, '_target')
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(item) for item in value)
+    return value
+
+
+class _Counted:
+    __slots__ = ('_target',)
+
+    def __init__(self, target):
+        # Count every attribute get, set and call of 'target' and of COM
+        # objects reached from it. One Python call per COM call is all it
+        # costs.
+
+        object.__setattr__(self, '_target', target)
+
+    def __getattr__(self, name):
+        value = getattr(object.__getattribute__(self, '_target'), name)
+        if isinstance(value, (types.MethodType, types.FunctionType)):
+            def _method(*args, **kwargs):
+                _Counter.Calls += 1
+                return _count(value(*_unwrap(args), **{
+                    key: _unwrap(item) for key, item in kwargs.items()}))
+            return _method
+
+        _Counter.Calls += 1
+        return _count(value)
+
+    def __setattr__(self, name, value):
+        _Counter.Calls += 1
+        setattr(object.__getattribute__(self, '_target'), name,
+                _unwrap(value))
+
+    def __call__(self, *args, **kwargs):
+        _Counter.Calls += 1
+        return _count(object.__getattribute__(self, '_target')(
+            *_unwrap(args),
+            **{key: _unwrap(item) for key, item in kwargs.items()}))
+
+
+def count_calls(target):
+    # Input
+    # > 'target' : CDispatch returned by runtime.dispatch().
+    #
+    # Output
+    # > 'target' whose COM calls are counted while telemetry is on.
+
+    if _active is None:
+        return target
+    return _Counted(target)
+
+
+class Telemetry:
+    def __init__(self, mode, file=None, port=8765, interval=1.0):
+        # Input
+        # > 'mode'      : 'bar', 'jsonl' or 'http'.
+        # > 'file'      : Path of JSON lines for 'jsonl'.
+        # > 'port'      : int. Port on 127.0.0.1 for 'http'.
+        # > 'interval'  : float. The shortest wall time [sec] between
+        #                 progress events.
+        #
+        # Progress events are throttled to 'interval', so that a break
+        # costs only a clock read between events.
+
+        self.Mode = mode
+        self.Interval = interval
+        self.Start = time.perf_counter()
+        self.Stages = dict()    # {str(stage): float(wall sec)}
+        self.Latest = dict()    # The latest event.
+        self.LastEmit = -interval
+        self.LastCalls = (self.Start, 0)
+        self.Sim = None         # (wall start, sim start, sim total)
+
+        self.File = None
+        self.Server = None
+        if mode == 'jsonl':
+            self.File = open(file, 'a', encoding='UTF8')
+        elif mode == 'http':
+            self._serve(port)
+
+    def _serve(self, port):
+        import http.server
+
+        telemetry = self
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(telemetry.Latest).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.Server = http.server.ThreadingHTTPServer(('127.0.0.1', port),
+                                                      _Handler)
+        threading.Thread(target=self.Server.serve_forever, daemon=True,
+                         name="telemetry").start()
+        logger.info(f"Telemetry on http://127.0.0.1:{port}/metrics")
+
+    def emit(self, event):
+        # Input
+        # > 'event' : dict. Wall time and COM calls are added.
+
+        now = time.perf_counter()
+        calls = _Counter.Calls
+        last_time, last_calls = self.LastCalls
+        event = dict(event, wall_sec=round(now - self.Start, 3),
+                     com_calls=calls,
+                     com_rate=round((calls - last_calls)
+                                    / max(now - last_time, 1e-9), 1))
+        self.LastCalls = (now, calls)
+        self.Latest = event
+
+        if self.File is not None:
+            self.File.write(json.dumps(event) + '\n')
+            self.File.flush()
+        elif self.Mode == 'bar':
+            self._draw(event)
+
+        return
+
+    def _draw(self, event, size=40):
+        if event['event'] != 'progress':
+            return
+        done = int(size * event['sim_sec'] / max(event['sim_total'], 1))
+        eta = event['eta_sec']
+        print(f"[{'█' * done}{'.' * (size - done)}] "
+              + f"{event['sim_sec']}/{event['sim_total']} sec  "
+              + f"x{event['speed']:.1f}  "
+              + ("" if eta is None else f"ETA {int(eta) // 60}:"
+                 + f"{int(eta) % 60:02d}  ")
+              + f"{event['com_rate']:.0f} calls/sec",
+              end='\r', file=sys.stdout, flush=True)
+
+    def simulation(self, sim_start, sim_total):
+        self.Sim = (time.perf_counter(), sim_start, sim_total)
+        self.LastEmit = -self.Interval
+
+    def progress(self, sim_sec, force=False):
+        now = time.perf_counter()
+        if not force and now - self.LastEmit < self.Interval:
+            return
+        self.LastEmit = now
+
+        wall_start, sim_start, sim_total = self.Sim
+        wall = now - wall_start
+        speed = (sim_sec - sim_start) / wall if wall > 0 else 0.0
+        self.emit({'event': 'progress', 'sim_sec': sim_sec,
+                   'sim_total': sim_total, 'speed': round(speed, 2),
+                   'eta_sec': round((sim_total - sim_sec) / speed, 1)
+                   if speed > 0 else None,
+                   'stages': self.Stages})
+        if force and self.Mode == 'bar':
+            print(flush=True)
+
+    def close(self):
+        self.emit({'event': 'end', 'stages': self.Stages})
+        if self.File is not None:
+            self.File.close()
+        if self.Server is not None:
+            self.Server.shutdown()
+
+
+def start(datainfo):
+    # Input
+    # > 'datainfo' : dict.
+    #
+    # Start telemetry of this process as set in 'datainfo', unless it has
+    # been started already.
+
+    global _active
+    mode = datainfo.get('progress', 'bar')
+    if _active is not None or mode == 'off':
+        return
+
+    _Counter.Calls = 0
+    _active = Telemetry(mode, f"progress_{datainfo['start_time']}.jsonl",
+                        datainfo.get('progress_port', 8765),
+                        datainfo.get('progress_interval', 1.0))
+
+    return
+
+
+def stop():
+    global _active
+    if _active is not None:
+        _active.close()
+        _active = None
+
+    return
+
+
+@contextlib.contextmanager
+def stage(name):
+    # Measure wall time of stage 'name' and emit it when done. The stage is
+    # recorded in the manifest of the run as well.
+
+    with manifest.step(name) as name:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if _active is not None:
+                duration = time.perf_counter() - start
+                _active.Stages[name] = round(
+                    _active.Stages.get(name, 0) + duration, 3)
+                _active.emit({'event': 'stage', 'stage': name,
+                              'duration_sec': round(duration, 3)})
+
+
+def simulation(sim_start, sim_total):
+    # Input
+    # > 'sim_start' : int. Simulation second the run starts from.
+    # > 'sim_total' : int. Simulation period [sec].
+
+    if _active is not None:
+        _active.simulation(sim_start, sim_total)
+
+    return
+
+
+def progress(sim_sec, force=False):
+    # Input
+    # > 'sim_sec'   : int. Simulation second reached.
+    # > 'force'     : bool. Emit even within the interval.
+
+    if _active is not None and _active.Sim is not None:
+        _active.progress(sim_sec, force)
+
+    return